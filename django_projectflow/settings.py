@@ -122,3 +122,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Serve the prometheus metrics of the ProcessRunners at /metrics/
+PROCESSFLOW_METRICS = False
@@ -16,6 +16,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from processflow.views import prometheus_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', prometheus_metrics, name='processflow-metrics'),
 ]
@@ -1,6 +1,14 @@
-from django.test import TestCase
+import io
 
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from processflow.models import FlowInstance
+from processflow.runner import ProcessRunner
 from processflow.runner.object_compare import deep_copy
+from processflow.worker import FlowWorker
 
 
 from .models import Order, OrderItem, Picker
@@ -39,4 +47,129 @@ class TestModels(TestCase):
 
         self.assertEqual(values, fields)
 
+    def test_deep_copy_queries(self):
+        o2 = Order.objects.create(order_id="O-002", address="Entenhausen")
+        OrderItem.objects.create(
+            order=o2, sku="SKU-3", title="Wurstbrot",
+            channel_status="", price="2.50", amount=3)
+        orders = list(Order.objects.all())
+        items = list(OrderItem.objects.all())
+
+        # related keys of all orders are loaded with one query
+        with self.assertNumQueries(1):
+            values = deep_copy({"orders": orders, "items": items})
+
+        self.assertEqual(
+            [set(i.id for i in o.orderitem_set.all()) for o in orders],
+            [v["orderitem_set"] for v in values["orders"]],
+        )
+        self.assertEqual(items[0].order_id, values["items"][0]["order_id"])
+        self.assertEqual(items[0].price, values["items"][0]["price"])
+        self.assertNotIn("order", values["items"][0])
+
+    def test_deep_copy_unsaved(self):
+        order = Order(order_id="O-003", address="Nirgendwo")
+        with self.assertNumQueries(0):
+            values = deep_copy(order)
+        self.assertIsNone(values["pk"])
+        self.assertEqual(set(), values["orderitem_set"])
+
+
+class FlowOrder:
+    def __init__(self, id, items, express=False):
+        self.id = id
+        self.items = items
+        self.status = "new"
+        self.express = express
+
+
+class TestFlowWorker(TestCase):
+
+    FLOW = "processflow.tests.example_flow"
+
+    def setUp(self):
+        for i in range(5):
+            FlowInstance.start(self.FLOW, "new", order=FlowOrder(i, ["a"] if i else [], express=i == 4), log=[])
+
+    def test_worker(self):
+        worker = FlowWorker(batch_size=2, max_steps=None)
+        self.assertEqual(2, len(worker.claim()))
+        # claimed instances are not handed out again
+        other = FlowWorker(batch_size=10)
+        self.assertEqual(3, len(other.claim()))
+        self.assertEqual([], FlowWorker().claim())
+
+        FlowInstance.objects.update(lease_owner=None, lease_expires=None)
+        self.assertEqual(5, worker.run(stop_when_idle=True))
+
+        instances = {i.get_context()["order"].id: i for i in FlowInstance.objects.all()}
+        self.assertEqual("invalid", instances[0].state)
+        for i in (1, 2, 3):
+            self.assertTrue(instances[i].finished)
+            self.assertEqual("done", instances[i].state)
+            self.assertEqual("done", instances[i].get_context()["order"].status)
+            self.assertEqual(["finished %s" % i], instances[i].get_context()["log"])
+            self.assertIsNone(instances[i].lease_owner)
+
+        # the step before the failing one is kept
+        self.assertFalse(instances[4].finished)
+        self.assertIn("invalid changes", instances[4].error)
+        self.assertEqual("validated", instances[4].state)
+        self.assertEqual("validated", instances[4].get_context()["order"].status)
+        self.assertEqual(1, instances[4].steps)
+
+    def test_retry(self):
+        worker = FlowWorker(max_steps=None, retry_seconds=60)
+        with self.assertLogs("processflow.worker", "ERROR") as logs:
+            self.assertEqual(5, worker.run(stop_when_idle=True))
+        self.assertIn("invalid changes", logs.output[0])
+
+        instance = FlowInstance.objects.get(finished=False)
+        self.assertIsNone(instance.error)
+        self.assertEqual("validated", instance.state)
+        self.assertGreater(instance.next_run_at, timezone.now())
+
+    def test_lost_lease(self):
+        worker = FlowWorker(max_steps=None)
+        instances = worker.claim()
+        # the lease expired and another worker took over the first instance
+        FlowInstance.objects.filter(pk=instances[0].pk).update(lease_owner="other")
+
+        written = worker.process(instances)
+        self.assertEqual(instances[1:], written)
+        instance = FlowInstance.objects.get(pk=instances[0].pk)
+        self.assertEqual("other", instance.lease_owner)
+        self.assertEqual("new", instance.state)
+        self.assertEqual(0, instance.steps)
+        self.assertEqual(4, FlowInstance.objects.filter(lease_owner__isnull=True).count())
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("runflow", "--once", "--batch-size", "3", stdout=out)
+        self.assertIn("processed", out.getvalue())
+        self.assertEqual(
+            {"invalid": 1, "done": 3},
+            {state: FlowInstance.objects.filter(state=state, finished=True).count() for state in ("invalid", "done")}
+        )
+
+
+class TestMetricsView(TestCase):
+
+    def test_disabled(self):
+        self.assertEqual(404, self.client.get(reverse("processflow-metrics")).status_code)
+
+    @override_settings(PROCESSFLOW_METRICS=True)
+    def test_prometheus(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        runner.set_metrics(True, name="metrics-view")
+        context = runner.create_context("new", order=FlowOrder(1, ["a"]), log=[])
+        while not context.is_finished:
+            context.step()
 
+        response = self.client.get(reverse("processflow-metrics"))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(
+            'processflow_duration_seconds_count{runner="metrics-view",kind="transition",name="finish"} 1',
+            response.content.decode(),
+        )
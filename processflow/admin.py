@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import FlowInstance
+
+
+@admin.register(FlowInstance)
+class FlowInstanceAdmin(admin.ModelAdmin):
+    list_display = ("context_id", "flow", "state", "finished", "steps", "next_run_at", "lease_owner", "updated")
+    list_filter = ("flow", "state", "finished")
+    search_fields = ("context_id", )
+    exclude = ("context", )
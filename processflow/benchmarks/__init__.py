@@ -0,0 +1,3 @@
+"""
+Benchmarks of processflow, run with `python -m processflow.benchmarks --help`
+"""
@@ -0,0 +1,75 @@
+"""
+Run the benchmarks and write the results as JSON
+
+    python -m processflow.benchmarks -o results.json
+    python -m processflow.benchmarks --compare old.json -o new.json
+
+The django group needs the project settings and creates a test database.
+"""
+import argparse
+import os
+import sys
+
+from .run import GROUPS, QUICK_SIZES, FULL_SIZES, run_benchmarks, compare, save, load
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m processflow.benchmarks")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="JSON file to write the results to, defaults to stdout")
+    parser.add_argument("-g", "--group", type=str, nargs="+", default=[g for g in GROUPS if g != "django"],
+                        choices=GROUPS, help="The benchmark groups to run")
+    parser.add_argument("--full", action="store_true",
+                        help="Use flows of up to %s states instead of %s" % (FULL_SIZES[-1], QUICK_SIZES[-1]))
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help="Number of states of the synthetic flows")
+    parser.add_argument("-k", "--filter", type=str, default=None,
+                        help="Only run cases whose name contains this string")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=.2,
+                        help="Minimum seconds per repetition")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="JSON file of a previous run to compare with")
+    return parser.parse_args()
+
+
+def _setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_projectflow.settings")
+    import django
+    django.setup()
+    from django.db import connection
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    return lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def main():
+    args = parse_args()
+    sizes = args.sizes or (FULL_SIZES if args.full else QUICK_SIZES)
+
+    teardown = _setup_django() if "django" in args.group else None
+    try:
+        results = run_benchmarks(
+            groups=args.group, sizes=sizes, repeat=args.repeat, min_time=args.min_time,
+            name_filter=args.filter,
+        )
+    finally:
+        if teardown:
+            teardown()
+
+    if args.output:
+        save(results, args.output)
+    else:
+        import json
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        for name, params, old, new, ratio in compare(load(args.compare), results):
+            print("%-24s %-70s %10.6f ms -> %10.6f ms  x%.2f" % (
+                name, " ".join("%s=%s" % (key, params[key]) for key in params), old * 1000., new * 1000., ratio,
+            ), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
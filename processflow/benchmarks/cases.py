@@ -0,0 +1,137 @@
+"""
+The benchmark cases.
+
+Each case function yields tuples of (name, params, func), where `func` is the
+timed callable without arguments. Everything outside of `func` is setup.
+"""
+import tempfile
+
+from ..description import ProcessDescription, ChangeMatcher
+from ..runner import ProcessRunner
+from ..runner import function_validation
+from ..runner.object_compare import deep_copy, get_difference, subtract_valid_changes
+from . import generators
+
+
+def description_cases(sizes):
+    for num_states in sizes:
+        transitions = generators.make_transitions(num_states)
+        yield "set_transitions", {"states": num_states}, \
+            lambda: ProcessDescription().set_transitions(transitions)
+
+
+def load_functions_cases(sizes):
+    """
+    "cold" validates the functions like the first runner of a process,
+    "warm" reuses the remembered validation result like any later runner
+    """
+    directory = tempfile.mkdtemp(prefix="processflow-benchmark-")
+    for num_states in sizes:
+        transitions = generators.make_transitions(num_states)
+        module_name = generators.write_flow_module(transitions, directory, "benchmark_flow_%s" % num_states)
+        pd = ProcessDescription(transitions)
+
+        def _load(pd=pd, module_name=module_name, cold=False):
+            if cold:
+                function_validation._results.clear()
+                pd._transitions_hash = None
+            ProcessRunner.from_process_description(pd).load_functions(module_name)
+
+        # import the module outside of the measurement
+        _load()
+        yield "load_functions", {"states": num_states, "cache": "cold"}, lambda _load=_load: _load(cold=True)
+        yield "load_functions", {"states": num_states, "cache": "warm"}, _load
+
+
+def step_cases(sizes, num_steps=100, context_depths=(0, 4)):
+    for num_states in sizes:
+        transitions = generators.make_transitions(num_states)
+        route = generators.make_route(transitions, num_steps)
+        runner = ProcessRunner.from_process_description(ProcessDescription(transitions))
+        generators.install_scripted_functions(runner)
+
+        for depth in context_depths:
+            payload = generators.make_context(depth, 8)
+            for mode in (ProcessRunner.TRACK_SNAPSHOT, ProcessRunner.TRACK_PROXY):
+
+                def _run(mode=mode, payload=payload):
+                    runner.set_change_tracking(mode)
+                    context = runner.create_context(
+                        "s0", data=generators.make_data(), route=route, cursor=[0], payload=payload,
+                    )
+                    context.run()
+
+                yield "step", {
+                    "states": num_states, "steps": num_steps, "context_depth": depth, "tracking": mode,
+                }, _run
+
+
+def step_overhead_cases(num_steps=1000):
+    """
+    Steps with empty functions and nothing to compare, to measure the runner itself
+    """
+    transitions = {"a": {"b": {}}, "b": {"a": {}}}
+    runner = ProcessRunner.from_process_description(ProcessDescription(transitions))
+    runner._state_functions.update(
+        a=lambda context: context.state.b,
+        b=lambda context: context.state.a,
+    )
+    runner._transition_functions.update({
+        ("a", "b"): lambda context: None,
+        ("b", "a"): lambda context: None,
+    })
+    runner.set_change_tracking(ProcessRunner.TRACK_PROXY)
+
+    def _run():
+        context = runner.create_context("a")
+        step = context.step
+        for i in range(num_steps):
+            step()
+
+    yield "step_overhead", {"steps": num_steps, "tracking": ProcessRunner.TRACK_PROXY, "compiled": False}, _run
+
+    directory = tempfile.mkdtemp(prefix="processflow-benchmark-")
+    runner.load_compiled(generators.write_runner_module(runner.process_description, directory))
+    yield "step_overhead", {"steps": num_steps, "tracking": ProcessRunner.TRACK_PROXY, "compiled": True}, _run
+
+
+def object_compare_cases(depths=(2, 4, 6), width=8, num_changes=10, num_patterns=20):
+    for depth in depths:
+        params = {"depth": depth, "width": width}
+        tree = generators.make_context(depth, width)
+        yield "deep_copy", params, lambda tree=tree: deep_copy(tree)
+
+        A = {"context": deep_copy(tree)}
+        generators.modify_context(tree, num_changes)
+        B = {"context": deep_copy(tree)}
+        yield "get_difference", dict(params, changes=num_changes), lambda A=A, B=B: get_difference(A, B)
+
+        diff = get_difference(A, B)
+        patterns = generators.make_change_patterns(depth, num_patterns)
+        params = dict(params, changes=num_changes, patterns=num_patterns)
+        yield "subtract_valid_changes", params, \
+            lambda diff=diff, patterns=patterns: subtract_valid_changes(diff, patterns)
+
+        matcher = ChangeMatcher(patterns)
+
+        def _subtract(diff=diff, matcher=matcher, cold=False):
+            if cold:
+                matcher.clear_cache()
+            return matcher.subtract(diff)
+
+        yield "ChangeMatcher.subtract", dict(params, cache="cold"), lambda _subtract=_subtract: _subtract(cold=True)
+        yield "ChangeMatcher.subtract", dict(params, cache="warm"), _subtract
+
+
+def django_cases(order_counts=(10, 100), items_per_order=5):
+    """
+    Snapshots of order_app models, requires a configured database
+    """
+    from order_app.models import Order, OrderItem
+
+    for num_orders in order_counts:
+        OrderItem.objects.filter(order__order_id__startswith="B-").delete()
+        Order.objects.filter(order_id__startswith="B-").delete()
+        orders = generators.make_django_orders(num_orders, items_per_order)
+        yield "deep_copy_models", {"orders": num_orders, "items_per_order": items_per_order}, \
+            lambda orders=orders: deep_copy(orders)
@@ -0,0 +1,203 @@
+"""
+Generators for synthetic flows and contexts
+"""
+import importlib
+import os
+import random
+import sys
+
+from ..description import ProcessDescription
+
+
+def make_transitions(num_states, fan_out=(1, 4), num_variables=8, seed=23):
+    """
+    Create a TRANSITIONS dict of a connected flow.
+    Each state `sN` has a transition to `s(N+1)` (wrapping around) plus random other transitions.
+    Each transition may change one or two of the variables `data.vN` of the context.
+    :param num_states: int
+    :param fan_out: tuple of (min, max) number of transitions per state
+    :param num_variables: int, number of variables in `data`
+    :param seed: random seed
+    :return: dict
+    """
+    rnd = random.Random(seed)
+    transitions = {"$in": ["data"]}
+    for i in range(num_states):
+        targets = {(i + 1) % num_states}
+        for j in range(rnd.randint(*fan_out) - 1):
+            targets.add(rnd.randrange(num_states))
+        transitions["s%s" % i] = {
+            "s%s" % t: {
+                "$change": ["data.v%s" % v for v in sorted(rnd.sample(range(num_variables), rnd.randint(1, 2)))],
+            }
+            for t in sorted(targets)
+        }
+    return transitions
+
+
+def make_route(transitions, num_steps, start="s0", seed=23):
+    """
+    Random walk through a flow created with make_transitions()
+    :return: list of state names, starting with the state after `start`
+    """
+    rnd = random.Random(seed)
+    route = []
+    state = start
+    for i in range(num_steps):
+        state = rnd.choice(sorted(k for k in transitions[state] if not k.startswith("$")))
+        route.append(state)
+    return route
+
+
+def write_flow_module(transitions, directory, module_name="benchmark_flow"):
+    """
+    Render the code of the flow into a module in `directory` and import it
+    :return: str, the module name
+    """
+    filename = os.path.join(directory, "%s.py" % module_name)
+    with open(filename, "w") as fp:
+        ProcessDescription(transitions).render_code(fp)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    importlib.invalidate_caches()
+    sys.modules.pop(module_name, None)
+    return module_name
+
+
+def write_runner_module(pd, directory, module_name="benchmark_flow_compiled"):
+    """
+    Render the compiled state machine of the flow into a module in `directory`
+    :return: str, the module name
+    """
+    filename = os.path.join(directory, "%s.py" % module_name)
+    with open(filename, "w") as fp:
+        pd.render_runner(fp)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    importlib.invalidate_caches()
+    sys.modules.pop(module_name, None)
+    return module_name
+
+
+def install_scripted_functions(runner):
+    """
+    Replace the state and transition functions of a runner created from make_transitions().
+    The state functions follow `context.route` (from make_route()),
+    the transition functions write their allowed variables.
+    """
+    for state in runner.states():
+        runner._state_functions[state.name] = _scripted_state
+    for transition in runner.transitions():
+        runner._transition_functions[(transition.name_from, transition.name_to)] = \
+            _make_transition_function(transition.changes)
+
+
+def _scripted_state(context):
+    index = context.cursor[0]
+    if index >= len(context.route):
+        return None
+    context.cursor[0] = index + 1
+    return getattr(context.state, context.route[index])
+
+
+def _make_transition_function(changes):
+    names = [change.split(".")[1] for change in changes if change.startswith("data.")]
+
+    def transition(context):
+        for name in names:
+            setattr(context.data, name, getattr(context.data, name) + 1)
+    return transition
+
+
+class Node:
+    def __init__(self, **kwargs):
+        for key in kwargs:
+            setattr(self, key, kwargs[key])
+
+
+def make_data(num_variables=8):
+    """
+    The `data` object of the scripted flows
+    """
+    return Node(**{"v%s" % i: 0 for i in range(num_variables)})
+
+
+def make_context(depth, width, branching=2, seed=23):
+    """
+    Create a tree of objects, dicts and lists
+    :param depth: int, number of levels below the root
+    :param width: int, number of scalar attributes per node
+    :param branching: int, number of child nodes per node
+    :return: Node
+    """
+    rnd = random.Random(seed)
+
+    def _scalar(i):
+        return (i, "value-%s" % i, i * .5, i % 2 == 0, None)[rnd.randrange(5)]
+
+    def _node(level):
+        attributes = {"a%s" % i: _scalar(i) for i in range(width)}
+        if level < depth:
+            children = [_node(level + 1) for i in range(branching)]
+            attributes["children"] = children
+            attributes["by_name"] = {"c%s" % i: {"tags": [i, i + 1]} for i in range(branching)}
+        return Node(**attributes)
+
+    return _node(0)
+
+
+def modify_context(context, num_changes, seed=23):
+    """
+    Change `num_changes` random scalar attributes in a tree from make_context()
+    :return: None
+    """
+    rnd = random.Random(seed)
+    nodes = [context]
+    i = 0
+    while i < len(nodes):
+        nodes.extend(getattr(nodes[i], "children", []))
+        i += 1
+    for i in range(num_changes):
+        node = rnd.choice(nodes)
+        name = rnd.choice([key for key in vars(node) if key.startswith("a")])
+        setattr(node, name, "changed-%s" % i)
+
+
+def make_change_patterns(depth, num_patterns, seed=23):
+    """
+    Create valid change patterns for contexts from make_context()
+    :return: list of str
+    """
+    rnd = random.Random(seed)
+    patterns = []
+    for i in range(num_patterns):
+        path = ["context"]
+        for level in range(rnd.randint(0, depth)):
+            path.append(rnd.choice(("children", "by_name", "*")))
+        path.append(rnd.choice(("a0", "a1", "*")))
+        patterns.append(".".join(path))
+    return patterns
+
+
+def make_django_orders(num_orders, items_per_order):
+    """
+    Create and save order_app Orders with OrderItems, requires a configured database
+    :return: list of Order
+    """
+    from order_app.models import Order, OrderItem
+
+    orders = Order.objects.bulk_create([
+        Order(order_id="B-%s" % i, channel_order_id="c-%s" % i, address="address %s" % i)
+        for i in range(num_orders)
+    ])
+    if not all(o.pk for o in orders):
+        orders = list(Order.objects.filter(order_id__startswith="B-").order_by("pk"))
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, sku="SKU-%s" % i, title="item %s" % i,
+            channel_status="new", price="1.00", amount=i,
+        )
+        for order in orders
+        for i in range(items_per_order)
+    ])
+    return list(Order.objects.filter(pk__in=[o.pk for o in orders]).order_by("pk"))
@@ -0,0 +1,128 @@
+import datetime
+import gc
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+from . import cases
+
+
+QUICK_SIZES = (10, 100, 1000)
+FULL_SIZES = (10, 100, 1000, 10000, 100000)
+
+GROUPS = ("description", "load_functions", "step", "object_compare", "django")
+
+
+def measure(func, repeat=5, min_time=.2):
+    """
+    Time a callable like timeit does: find a number of calls that takes at least `min_time`
+    and repeat the measurement
+    :return: dict with "number", "repeat" and "min", "median", "mean" seconds per call
+    """
+    timer = timeit.Timer(func)
+    number, total = timer.autorange()
+    if total < min_time:
+        number = max(1, int(number * min_time / max(total, 1e-9)))
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for j in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number)
+        finally:
+            gc.enable()
+    return {
+        "number": number,
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+    }
+
+
+def run_benchmarks(groups=GROUPS, sizes=QUICK_SIZES, repeat=5, min_time=.2, name_filter=None, verbose=True):
+    """
+    Run the benchmark cases
+    :param groups: sequence of str, see GROUPS
+    :param sizes: sequence of int, number of states of the synthetic flows
+    :param name_filter: str, only run cases whose name contains this
+    :return: dict, the machine readable results
+    """
+    generators = {
+        "description": lambda: cases.description_cases(sizes),
+        "load_functions": lambda: cases.load_functions_cases(sizes),
+        "step": lambda: itertools.chain(cases.step_overhead_cases(), cases.step_cases(sizes)),
+        "object_compare": lambda: cases.object_compare_cases(),
+        "django": lambda: cases.django_cases(),
+    }
+    results = []
+    for group in groups:
+        for name, params, func in generators[group]():
+            if name_filter and name_filter not in name:
+                continue
+            result = measure(func, repeat=repeat, min_time=min_time)
+            results.append(dict(group=group, name=name, params=params, **result))
+            if verbose:
+                print("%-24s %-70s %12.6f ms" % (name, _format_params(params), result["min"] * 1000.),
+                      file=sys.stderr)
+    return {
+        "meta": _meta(),
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """
+    Compare two results of run_benchmarks()
+    :return: list of tuples (name, params, old min seconds, new min seconds, new / old)
+    """
+    old_results = {_key(r): r for r in old["results"]}
+    ret = []
+    for r in new["results"]:
+        o = old_results.get(_key(r))
+        if o is not None:
+            ret.append((r["name"], r["params"], o["min"], r["min"], r["min"] / o["min"] if o["min"] else None))
+    return ret
+
+
+def save(results, filename):
+    with open(filename, "w") as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+
+
+def load(filename):
+    with open(filename) as fp:
+        return json.load(fp)
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def _format_params(params):
+    return " ".join("%s=%s" % (key, params[key]) for key in params)
+
+
+def _meta():
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__)
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "date": datetime.datetime.now().isoformat(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "revision": revision,
+    }
@@ -0,0 +1,151 @@
+
+class ChangeMatcher:
+    """
+    Compiled form of a list of valid change patterns like
+        'variable', 'object.*', 'object.variable', 'object.*.sub.another'
+
+    The patterns are stored as a trie with '*' wildcard nodes.
+    Matches exactly the same keys as object_compare.subtract_valid_changes()
+    """
+    # number of keys for which the match result is remembered
+    MAX_CACHE_SIZE = 10000
+
+    def __init__(self, valid_changes):
+        self.valid_changes = list(valid_changes)
+        self._root = _Node()
+        for pattern in self.valid_changes:
+            self._add(pattern)
+        self._root.compile()
+        self._cache = dict()
+
+    def __getstate__(self):
+        # the match cache is only an optimization
+        state = self.__dict__.copy()
+        state["_cache"] = dict()
+        return state
+
+    def clear_cache(self):
+        """
+        Forget the remembered match results, e.g. to measure the matching itself
+        """
+        self._cache.clear()
+
+    def _add(self, pattern):
+        seq = pattern.split(".")
+        # reduce trailing .*.* to .*
+        while len(seq) > 1 and seq[-2:] == ["*", "*"]:
+            seq = seq[:-1]
+        node = self._root
+        for sub_key in seq:
+            node = node.children.setdefault(sub_key, _Node())
+        node.terminal = True
+
+    def walk_start(self):
+        """
+        Start matching a path one key at a time, see walk_step()
+        :return: the state of the walk at the root of the paths
+        """
+        return [self._root]
+
+    def walk_step(self, nodes, sub_key):
+        """
+        Follow the trie by one key of a path
+        :param nodes: the state of the walk at the parent path, from walk_start() or walk_step()
+        :param sub_key: str, the next key of the path
+        :return: True if the path or one of its parents matches, otherwise the state of the walk
+                 at the path, which is empty if no pattern continues below the path
+        """
+        next_nodes = []
+        for node in nodes:
+            if node.match_any or sub_key in node.accept:
+                return True
+            child = node.children.get(sub_key)
+            if child is not None:
+                next_nodes.append(child)
+            if node.wildcard is not None:
+                next_nodes.append(node.wildcard)
+        return next_nodes
+
+    def _walk(self, sequence):
+        """
+        Follow the trie along `sequence`
+        :return: True if the path or one of its parents matches,
+                 otherwise the list of nodes of the patterns that continue below the path
+        """
+        nodes = [self._root]
+        for sub_key in sequence:
+            nodes = self.walk_step(nodes, sub_key)
+            if nodes is True or not nodes:
+                return nodes
+        return nodes
+
+    def match_sequence(self, sequence):
+        """
+        Returns True if the change at the path `sequence` is valid
+        :param sequence: sequence of str
+        :return: bool
+        """
+        return self._walk(sequence) is True
+
+    def may_change(self, sequence):
+        """
+        Returns True if a change at the path `sequence` or any path below it could be valid
+        :param sequence: sequence of str
+        :return: bool
+        """
+        nodes = self._walk(sequence)
+        return nodes is True or any(node.children for node in nodes)
+
+    def match(self, key):
+        """
+        Returns True if the change at `key` is valid
+        :param key: str, a key as gotten from get_difference(), e.g. 'object.variable'
+        :return: bool
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        sequence = key.split(".")
+        if not sequence:
+            raise ValueError("Empty key in diff")
+        ret = self.match_sequence(sequence)
+        if len(self._cache) >= self.MAX_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = ret
+        return ret
+
+    def subtract(self, diff):
+        """
+        Remove any valid changes from diff (as gotten from get_difference())
+        :param diff: dict with changes from get_difference()
+        :return: new dict, containing all changes in `diff` that are not valid
+        """
+        match = self.match
+        return {key: diff[key] for key in diff if not match(key)}
+
+
+class _Node:
+    __slots__ = ("children", "terminal", "wildcard", "match_any", "accept")
+
+    def __init__(self):
+        self.children = dict()
+        self.terminal = False
+        self.wildcard = None
+        self.match_any = False
+        self.accept = frozenset()
+
+    def compile(self):
+        """
+        Precompute the per-level matching rules:
+            any key matches if there is a terminal '*' child,
+            key `x` matches if child `x` is terminal or has a terminal '*' child
+        """
+        self.wildcard = self.children.get("*")
+        self.match_any = self.wildcard is not None and self.wildcard.terminal
+        self.accept = frozenset(
+            key for key, child in self.children.items()
+            if child.terminal or ("*" in child.children and child.children["*"].terminal)
+        )
+        for child in self.children.values():
+            child.compile()
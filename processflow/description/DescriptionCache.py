@@ -0,0 +1,123 @@
+import copy
+import gc
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from .ProcessDescription import ProcessDescription
+
+
+class DescriptionCache(object):
+    """
+    On-disk cache of compiled ProcessDescriptions.
+
+    The states and transitions, with their resolved inputs and changes and the
+    compiled ChangeMatchers, are stored as plain data (see ProcessDescription.to_compiled())
+    in a file named after the content hash of the TRANSITIONS dict.
+    Loading it skips all the parsing and verification of set_transitions().
+
+    When the module defining the TRANSITIONS is known, the description is also stored
+    under the path, modification time and size of the module file, so an unchanged file
+    is loaded without hashing the TRANSITIONS.
+    This assumes the TRANSITIONS are defined in the module file itself.
+    """
+    # increase when the compiled format changes
+    VERSION = 2
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def transitions_hash(cls, transitions):
+        """
+        Content hash of a TRANSITIONS dict
+        :return: str
+        """
+        data = json.dumps(transitions, sort_keys=True, default=repr, separators=(",", ":"))
+        return hashlib.sha256(("%s:%s" % (cls.VERSION, data)).encode("utf-8")).hexdigest()
+
+    def filename(self, transitions_hash):
+        return os.path.join(self.directory, "description-%s.pickle" % transitions_hash)
+
+    def module_filename(self, module):
+        """
+        :return: str, the cache file for the current version of the module's file,
+            or None if the module has no file
+        """
+        filename = getattr(module, "__file__", None)
+        if not filename:
+            return None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        key = "%s:%s:%s:%s" % (self.VERSION, os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+        return os.path.join(self.directory, "module-%s.pickle" % hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def get(self, transitions, module=None):
+        """
+        Return the ProcessDescription for `transitions` from the cache,
+        or create it and store it in the cache
+        :param transitions: dict, the TRANSITIONS of a flow
+        :param module: module or None, the module that defines `transitions`,
+            the TRANSITIONS are only hashed when its file changed
+        :return: ProcessDescription instance
+        """
+        module_filename = self.module_filename(module) if module is not None else None
+        if module_filename is not None:
+            pd = self.load(module_filename, transitions)
+            if pd is not None:
+                return pd
+
+        # hash before set_transitions() has a chance to modify the dict
+        transitions_hash = self.transitions_hash(transitions)
+        filename = self.filename(transitions_hash)
+
+        pd = self.load(filename, transitions)
+        if pd is None:
+            pd = ProcessDescription(copy.deepcopy(transitions))
+            pd._transition_dict = transitions
+            pd._transitions_hash = transitions_hash
+            self.store(pd, filename)
+        if module_filename is not None:
+            self.store(pd, module_filename)
+        return pd
+
+    def load(self, filename, transitions=None):
+        """
+        :return: ProcessDescription or None if the file does not exist or is unreadable
+        """
+        # the collector would run many times while creating the objects, for nothing
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(filename, "rb") as fp:
+                data = pickle.load(fp)
+            pd = ProcessDescription.from_compiled(data["description"], transitions)
+            pd._transitions_hash = data["transitions_hash"]
+            return pd
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # corrupt or outdated file, replaced by the caller
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def store(self, pd, filename):
+        """
+        Write the compiled description atomically, so concurrent readers never see partial files
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory, prefix=".description-")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                data = {"transitions_hash": pd.transitions_hash(), "description": pd.to_compiled()}
+                pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, filename)
+        except Exception:
+            os.unlink(tmp_filename)
+            raise
@@ -10,6 +10,13 @@ class ProcessDescription(object):
         self._transition_dict = None
         self._states = dict()
         self._transitions = dict()
+        # state name -> {other state name: Transition}
+        self._outgoing = dict()
+        self._incoming = dict()
+        # transition name -> Transition
+        self._transitions_by_name = dict()
+        # see transitions_hash()
+        self._transitions_hash = None
         if transitions:
             self.set_transitions(transitions)
 
@@ -38,29 +45,74 @@ class ProcessDescription(object):
     def get_transition(self, name_from, name_to):
         return self._transitions[(name_from, name_to)]
 
+    def outgoing(self, state):
+        """
+        The transitions starting at a state
+        :param state: State or str
+        :return: list of Transition, sorted by the name of the target state
+        """
+        return list(self._outgoing[getattr(state, "name", state)].values())
+
+    def incoming(self, state):
+        """
+        The transitions ending at a state
+        :param state: State or str
+        :return: list of Transition, sorted by the name of the source state
+        """
+        return list(self._incoming[getattr(state, "name", state)].values())
+
+    def transitions_hash(self):
+        """
+        Content hash of the description, computed on first use
+        :return: str, see DescriptionCache.transitions_hash()
+        """
+        if self._transitions_hash is None:
+            from .DescriptionCache import DescriptionCache
+            data = self._transition_dict
+            if data is None:
+                data = {
+                    "states": sorted((s.name, s.options) for s in self.states()),
+                    "transitions": sorted((t.name_from, t.name_to, t.options) for t in self.transitions()),
+                }
+            self._transitions_hash = DescriptionCache.transitions_hash(data)
+        return self._transitions_hash
+
+    def transition_by_name(self, name):
+        """
+        :param name: str, the Transition.name, e.g. 'a->b' or the `$name` option
+        :return: Transition
+        """
+        return self._transitions_by_name[name]
+
     def set_transitions(self, transitions):
         self._transition_dict = transitions
+        self._transitions_hash = None
         self._states = dict()
         self._transitions = dict()
+        self._outgoing = dict()
+        self._incoming = dict()
+        self._transitions_by_name = dict()
         options = {s[1:]: self._transition_dict[s] for s in self._transition_dict if s.startswith("$")}
-        for state_name in sorted(self._transition_dict):
-            if state_name.startswith("$"):
-                continue
 
-            def _add_state(name):
+        def _add_state(name):
+            if name not in self._states:
                 self.verify_state_name(name)
-                if name not in self._states:
-                    s = State(self, name)
-                    for i in s.inputs:
-                        if i.startswith("transition") or i.startswith("state"):
-                            raise ValueError("input names must not start with 'state' or 'transition', "
-                                             "in state %s" % name)
-                    for key in options:
-                        if key in ("in", "change"):
-                            s.options[key] = options[key]
-                    self._states[name] = s
+                s = State(self, name)
+                for i in s.inputs:
+                    if i.startswith("transition") or i.startswith("state"):
+                        raise ValueError("input names must not start with 'state' or 'transition', "
+                                         "in state %s" % name)
+                for key in options:
+                    if key in ("in", "change"):
+                        s.options[key] = options[key]
+                self._states[name] = s
+                self._outgoing[name] = dict()
+                self._incoming[name] = dict()
 
+        state_names = sorted(name for name in self._transition_dict if not name.startswith("$"))
+        for state_name in state_names:
             _add_state(state_name)
+        for state_name in state_names:
             state = self._states[state_name]
 
             trans = transitions[state_name]
@@ -86,23 +138,80 @@ class ProcessDescription(object):
 
                 state.outputs.add(other_state_name)
                 key = (state_name, other_state_name)
-                if key in self._transitions:
-                    pass
-                else:
-                    transition = trans[other_state_name]
-                    options = {k[1:]: transition[k] for k in transition if k.startswith("$")}
-                    if options.get("name"):
-                        self.verify_state_name(options["name"])
-                    t = Transition(
-                        self, state_name, other_state_name,
-                        options=options,
-                    )
-                    for exist in self._transitions.values():
-                        if t.name == exist.name:
-                            raise ValueError("Duplicate name '%s' given to transition '%s->%s'" % (
-                                t.name, state_name, other_state_name,
-                            ))
-                    self._transitions[key] = t
+                transition = trans[other_state_name]
+                transition_options = {k[1:]: transition[k] for k in transition if k.startswith("$")}
+                if transition_options.get("name"):
+                    self.verify_state_name(transition_options["name"])
+                t = Transition(
+                    self, state_name, other_state_name,
+                    options=transition_options,
+                )
+                if t.name in self._transitions_by_name:
+                    raise ValueError("Duplicate name '%s' given to transition '%s->%s'" % (
+                        t.name, state_name, other_state_name,
+                    ))
+                self._transitions[key] = t
+                self._transitions_by_name[t.name] = t
+                self._outgoing[state_name][other_state_name] = t
+                self._incoming[other_state_name][state_name] = t
+
+        # all states are known now, compile the valid changes once,
+        # transitions with the same changes share the matcher
+        matchers = dict()
+        for t in self._transitions.values():
+            key = tuple(t.changes)
+            if key not in matchers:
+                matchers[key] = t.change_matcher
+            t._change_matcher = matchers[key]
+
+    def to_compiled(self):
+        """
+        Return the resolved description as plain data for serialization, see from_compiled()
+        :return: dict
+        """
+        matchers = []
+        matcher_index = dict()
+        transitions = []
+        for t in self._transitions.values():
+            matcher = t.change_matcher
+            if id(matcher) not in matcher_index:
+                matcher_index[id(matcher)] = len(matchers)
+                matchers.append(matcher)
+            transitions.append((t.name_from, t.name_to, t.options, t.changes, t.inputs, matcher_index[id(matcher)]))
+        return {
+            "states": [(s.name, s.options, sorted(s.outputs)) for s in self._states.values()],
+            "transitions": transitions,
+            "matchers": matchers,
+        }
+
+    @classmethod
+    def from_compiled(cls, data, transition_dict=None):
+        """
+        Create a description from the result of to_compiled() without any verification
+        :param data: dict
+        :param transition_dict: dict, the original TRANSITIONS
+        :return: new ProcessDescription instance
+        """
+        pd = cls()
+        pd._transition_dict = transition_dict
+        for name, options, outputs in data["states"]:
+            state = State(pd, name, options)
+            state.outputs = set(outputs)
+            pd._states[name] = state
+            pd._outgoing[name] = dict()
+            pd._incoming[name] = dict()
+
+        matchers = data["matchers"]
+        for name_from, name_to, options, changes, inputs, matcher in data["transitions"]:
+            t = Transition(pd, name_from, name_to, options)
+            t._changes = changes
+            t._inputs = inputs
+            t._change_matcher = matchers[matcher]
+            pd._transitions[(name_from, name_to)] = t
+            pd._transitions_by_name[t.name] = t
+            pd._outgoing[name_from][name_to] = t
+            pd._incoming[name_to][name_from] = t
+        return pd
 
     def verify_state_name(self, name):
         if not isinstance(name, str):
@@ -132,16 +241,40 @@ class ProcessDescription(object):
         else:
             renderer.render(fp)
 
-    def render_code(self, fp=None):
+    def render_code(self, fp=None, async_functions=False):
         from ..renderer import CodeRenderer
-        self._render(CodeRenderer(self), fp)
+        self._render(CodeRenderer(self, async_functions=async_functions), fp)
+
+    def update_code(self, filename, async_functions=False):
+        """
+        Update the .py file rendered by render_code() and keep the code written into the functions,
+        see CodeRenderer.update()
+        :return: dict with "added", "updated", "removed" and "commented" function names
+        """
+        from ..renderer import CodeRenderer
+        return CodeRenderer(self, async_functions=async_functions).update(filename)
+
+    def render_runner(self, fp=None):
+        """
+        Render the compiled state machine module, see ProcessRunner.load_compiled()
+        """
+        from ..renderer import RunnerRenderer
+        self._render(RunnerRenderer(self), fp)
 
-    def render_graphviz(self, fp=None, format="png"):
+    def render_graphviz(self, fp=None, format="png", cluster=None, center=None, depth=1, cache_dir=None):
+        """
+        Render the DOT graph or, with graphviz, an image of it, see GraphvizRenderer
+        :param fp: filename or file object for the "dot" format, filename for images
+        :param cluster: None, "prefix", "component" or a callable that returns the cluster name of a State
+        :param center: str or None, only render the states around the state with this name
+        :param depth: int, the number of transitions between `center` and the rendered states
+        :param cache_dir: str or None, directory to cache the images in
+        """
         from ..renderer import GraphvizRenderer
-        renderer = GraphvizRenderer(self)
+        renderer = GraphvizRenderer(self, cluster=cluster, center=center, depth=depth)
         if format in ("dot",):
             self._render(renderer, fp)
         else:
             if not isinstance(fp, str):
                 raise ValueError("For image files, 'fp' must be a filename")
-            renderer.run_graphviz(fp, format)
\ No newline at end of file
+            renderer.run_graphviz(fp, format, cache_dir=cache_dir)
\ No newline at end of file
@@ -30,11 +30,7 @@ class State:
 
     @property
     def transitions(self):
-        ret = []
-        for name_from, name_to in self.pd._transitions:
-            if name_from == self.name:
-                ret.append(self.pd.get_transition(name_from, name_to))
-        return ret
+        return self.pd.outgoing(self.name)
 
     @property
     def is_user(self):
@@ -1,3 +1,5 @@
+from .ChangeMatcher import ChangeMatcher
+
 
 class Transition:
     def __init__(self, pd, name_from, name_to, options=None):
@@ -10,6 +12,7 @@ class Transition:
         else:
             self.name = "%s->%s" % (self.name_from, self.name_to)
         self._changes = None
+        self._change_matcher = None
         self._inputs = None
 
     def __str__(self):
@@ -45,6 +48,16 @@ class Transition:
                         self._changes.append(i)
         return self._changes
 
+    @property
+    def change_matcher(self):
+        """
+        The compiled matcher for the valid changes of this transition
+        :return: ChangeMatcher instance
+        """
+        if self._change_matcher is None:
+            self._change_matcher = ChangeMatcher(self.changes)
+        return self._change_matcher
+
     @property
     def inputs(self):
         if self._inputs is None:
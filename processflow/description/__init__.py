@@ -1,3 +1,5 @@
 from .ProcessDescription import ProcessDescription
 from .State import State
 from .Transition import Transition
+from .ChangeMatcher import ChangeMatcher
+from .DescriptionCache import DescriptionCache
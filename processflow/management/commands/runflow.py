@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from ...worker import FlowWorker
+
+
+class Command(BaseCommand):
+    help = "Run a worker that steps the due processflow.models.FlowInstances"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--worker-id", type=str, default=None,
+                            help="Name of the worker, defaults to host, pid and a random part")
+        parser.add_argument("--batch-size", type=int, default=100,
+                            help="Number of instances claimed at once")
+        parser.add_argument("--lease", type=float, default=300.,
+                            help="Seconds after which the claimed instances may be taken over by other workers")
+        parser.add_argument("--max-steps", type=int, default=1,
+                            help="Number of steps per instance and claim, 0 to run until finished")
+        parser.add_argument("--retry", type=float, default=None,
+                            help="Reschedule failed instances after this number of seconds")
+        parser.add_argument("--cache-dir", type=str, default=None,
+                            help="Directory to cache the compiled flow descriptions in")
+        parser.add_argument("--sleep", type=float, default=1.,
+                            help="Seconds to wait when no instance is due")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit when no instance is due")
+
+    def handle(self, *args, **options):
+        worker = FlowWorker(
+            worker_id=options["worker_id"],
+            batch_size=options["batch_size"],
+            lease_seconds=options["lease"],
+            max_steps=options["max_steps"] or None,
+            retry_seconds=options["retry"],
+            description_cache=options["cache_dir"],
+        )
+        self.stdout.write("starting worker %s" % worker.worker_id)
+        try:
+            count = worker.run(idle_sleep=options["sleep"], stop_when_idle=options["once"])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write("processed %s instances" % count)
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:46
+
+from django.db import migrations, models
+import django.utils.timezone
+import processflow.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlowInstance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flow', models.CharField(help_text='python module with the TRANSITIONS and functions of the flow', max_length=256, verbose_name='Flow module')),
+                ('context_id', models.CharField(default=processflow.models._new_context_id, max_length=32, unique=True, verbose_name='Context ID')),
+                ('state', models.CharField(max_length=128, verbose_name='Current state')),
+                ('context', models.BinaryField(verbose_name='Pickled context values')),
+                ('finished', models.BooleanField(default=False, verbose_name='Finished')),
+                ('error', models.TextField(blank=True, default=None, null=True, verbose_name='Error')),
+                ('steps', models.IntegerField(default=0, verbose_name='Number of steps')),
+                ('next_run_at', models.DateTimeField(default=django.utils.timezone.now, null=True, verbose_name='Next run')),
+                ('lease_owner', models.CharField(default=None, max_length=64, null=True, verbose_name='Lease owner')),
+                ('lease_expires', models.DateTimeField(default=None, null=True, verbose_name='Lease expires')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+            ],
+            options={
+                'verbose_name': 'Flow instance',
+                'verbose_name_plural': 'Flow instances',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='flowinstance',
+            index=models.Index(fields=['finished', 'next_run_at'], name='processflow_finishe_c648d8_idx'),
+        ),
+    ]
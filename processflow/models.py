@@ -1,3 +1,68 @@
+import pickle
+import uuid
+
 from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+def _new_context_id():
+    return uuid.uuid4().hex
+
+
+class FlowInstance(models.Model):
+    """
+    A ProcessRunnerContext persisted in the database, to be stepped by the `runflow` workers.
+    """
+
+    class Meta:
+        verbose_name = _("Flow instance")
+        verbose_name_plural = _("Flow instances")
+        indexes = [
+            models.Index(fields=["finished", "next_run_at"]),
+        ]
+
+    flow = models.CharField(verbose_name=_("Flow module"), max_length=256,
+                            help_text=_("python module with the TRANSITIONS and functions of the flow"))
+    context_id = models.CharField(verbose_name=_("Context ID"), max_length=32, unique=True,
+                                  default=_new_context_id)
+    state = models.CharField(verbose_name=_("Current state"), max_length=128)
+    context = models.BinaryField(verbose_name=_("Pickled context values"))
+
+    finished = models.BooleanField(verbose_name=_("Finished"), default=False)
+    error = models.TextField(verbose_name=_("Error"), null=True, default=None, blank=True)
+    steps = models.IntegerField(verbose_name=_("Number of steps"), default=0)
+
+    next_run_at = models.DateTimeField(verbose_name=_("Next run"), null=True, default=timezone.now)
+    lease_owner = models.CharField(verbose_name=_("Lease owner"), max_length=64, null=True, default=None)
+    lease_expires = models.DateTimeField(verbose_name=_("Lease expires"), null=True, default=None)
+
+    created = models.DateTimeField(verbose_name=_("Created"), auto_now_add=True)
+    updated = models.DateTimeField(verbose_name=_("Updated"), auto_now=True)
+
+    def __str__(self):
+        return "%s(%s, %s)" % (self.flow, self.context_id, self.state)
+
+    @classmethod
+    def start(cls, flow, state_name, next_run_at=None, **kwargs):
+        """
+        Create and save a new instance
+        :param flow: str, python module path of the flow
+        :param state_name: str, the initial state
+        :param next_run_at: datetime or None for now
+        :param kwargs: the context values, must be picklable
+        :return: new FlowInstance
+        """
+        instance = cls(flow=flow, state=state_name, next_run_at=next_run_at or timezone.now())
+        instance.set_context(kwargs)
+        instance.save()
+        return instance
+
+    def get_context(self):
+        """
+        :return: dict, the unpickled context values
+        """
+        return pickle.loads(bytes(self.context))
 
-# Create your models here.
+    def set_context(self, objects):
+        self.context = pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL)
@@ -1,10 +1,24 @@
+import collections
+import os
+import re
+import shutil
 import sys
+import tempfile
 
 
 class CodeRenderer:
 
-    def __init__(self, process_description):
+    def __init__(self, process_description, async_functions=False):
+        """
+        :param async_functions: bool, render `async def` functions for use
+            with an AsyncProcessRunnerContext
+        """
         self.pd = process_description
+        self.async_functions = async_functions
+
+    @property
+    def def_keyword(self):
+        return "async def" if self.async_functions else "def"
 
     def render(self, fp=None):
         fp = fp or sys.stdout
@@ -24,49 +38,330 @@ TRANSITIONS = %(transitions)s
     def render_state_functions(self, fp=None):
         fp = fp or sys.stdout
 
-        functions = []
-
-        for state in self.pd._states.values():
-            code = 'def %s(context):\n    """\n%s\n    """\n' % (
-                state.function_name,
-                "\n".join("    %s" % line for line in state.python_doc.split("\n")),
-            )
-            if not state.outputs:
-                code += "    pass\n"
-            else:
-                returns = []
-                for other_state_name in sorted(state.outputs):
-                    returns.append("    return context.state.%s\n" % (
-                        other_state_name,
-                    ))
-                if len(returns) == 1:
-                    code += returns[0]
-                elif len(returns) >= 2:
-                    for i, line in enumerate(returns):
-                        if i == 0:
-                            code += "    if 1:\n"
-                        elif i == len(returns)-1:
-                            code += "    else:\n"
-                        else:
-                            code += "    elif %s:\n" % (i+1)
-                        code += "    " + line
-            functions.append(code)
-
         fp.write("\n\n# STATES #\n\n")
-        fp.write("\n\n".join(sorted(functions)))
+        for i, state in enumerate(sorted(self.pd.states(), key=lambda s: s.function_name)):
+            if i:
+                fp.write("\n\n")
+            fp.write(self.render_state_function(state))
 
     def render_transition_functions(self, fp=None):
         fp = fp or sys.stdout
 
-        functions = []
-        for state_name, other_state_name in self.pd._transitions:
-            state = self.pd.get_state(state_name)
-            trans = self.pd.get_transition(state_name, other_state_name)
-            code = 'def %s(context):\n    """\n%s\n    """\n    pass\n' % (
-                trans.function_name,
-                "\n".join("    %s" % line for line in trans.python_doc.split("\n")),
+        fp.write("\n\n# TRANSITIONS #\n\n")
+        for i, trans in enumerate(sorted(self.pd.transitions(), key=lambda t: t.function_name)):
+            if i:
+                fp.write("\n\n")
+            fp.write(self.render_transition_function(trans))
+
+    def render_state_function(self, state):
+        """
+        :return: str, the code of the function stub of a state
+        """
+        code = "%s %s(context):\n%s" % (self.def_keyword, state.function_name, self.render_doc(state.python_doc))
+        if not state.outputs:
+            code += "    pass\n"
+        else:
+            returns = []
+            for other_state_name in sorted(state.outputs):
+                returns.append("    return context.state.%s\n" % (
+                    other_state_name,
+                ))
+            if len(returns) == 1:
+                code += returns[0]
+            elif len(returns) >= 2:
+                for i, line in enumerate(returns):
+                    if i == 0:
+                        code += "    if 1:\n"
+                    elif i == len(returns)-1:
+                        code += "    else:\n"
+                    else:
+                        code += "    elif %s:\n" % (i+1)
+                    code += "    " + line
+        return code
+
+    def render_transition_function(self, trans):
+        """
+        :return: str, the code of the function stub of a transition
+        """
+        return "%s %s(context):\n%s    pass\n" % (
+            self.def_keyword, trans.function_name, self.render_doc(trans.python_doc),
+        )
+
+    @staticmethod
+    def render_doc(doc, indent="    "):
+        return '%s"""\n%s\n%s"""\n' % (
+            indent,
+            "\n".join("%s%s" % (indent, line) for line in doc.split("\n")),
+            indent,
+        )
+
+    def update(self, filename):
+        """
+        Update a module rendered before, instead of rendering it again.
+
+        The TRANSITIONS are replaced, the doc-strings and the `def` or `async def` keyword
+        of existing state and transition functions are updated and stubs for new states
+        and transitions are inserted in sorted order. Unchanged stubs are rendered again,
+        decorated functions count as user code.
+        All other code is kept as it is.
+        Functions of states and transitions that do not exist anymore are removed
+        if they are unchanged stubs and otherwise commented out.
+
+        The module is streamed to a temporary file which then replaces `filename`.
+        :param filename: str, the python file, it is rendered if it does not exist
+        :return: dict with "added", "updated", "removed" and "commented",
+            each a list of function names
+        """
+        expected = dict()
+        for state in self.pd.states():
+            expected[state.function_name] = (state.python_doc, lambda s=state: self.render_state_function(s))
+        for trans in self.pd.transitions():
+            expected[trans.function_name] = (trans.python_doc, lambda t=trans: self.render_transition_function(t))
+
+        if not os.path.exists(filename):
+            with open(filename, "w") as fp:
+                self.render(fp)
+            return {"added": sorted(expected), "updated": [], "removed": [], "commented": []}
+
+        with open(filename) as fp:
+            segments = _split_statements(fp.read())
+
+        report = {"added": [], "updated": [], "removed": [], "commented": []}
+        existing = set(seg.name for seg in segments if seg.name)
+        pending = {prefix: collections.deque(sorted(
+            name for name in expected if name.startswith(prefix) and name not in existing
+        )) for prefix in _PREFIXES}
+
+        # where the remaining new functions of each kind go
+        last_index = dict()
+        for i, seg in enumerate(segments):
+            if seg.name in expected:
+                last_index[_prefix(seg.name)] = i
+
+        # removed stubs are dropped together with the blank lines before them
+        skip = set()
+        for i, seg in enumerate(segments):
+            if seg.name and _prefix(seg.name) and seg.name not in expected and _is_stub(seg.text):
+                skip.add(i)
+                if i and not segments[i - 1].text.strip():
+                    skip.add(i - 1)
+                elif i + 1 < len(segments) and not segments[i + 1].text.strip():
+                    skip.add(i + 1)
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=".%s-" % os.path.basename(filename))
+        try:
+            with os.fdopen(fd, "w") as fp:
+
+                def _flush(prefix, before=None, leading=False):
+                    names = pending[prefix]
+                    while names and (before is None or names[0] < before):
+                        name = names.popleft()
+                        code = expected[name][1]()
+                        fp.write("\n\n%s" % code if leading else "%s\n\n" % code)
+                        report["added"].append(name)
+
+                for i, seg in enumerate(segments):
+                    prefix = _prefix(seg.name) if seg.name else None
+
+                    if seg.is_transitions:
+                        fp.write("TRANSITIONS = %r\n" % (self.pd.transition_dict, ))
+                    elif i in skip:
+                        if seg.name:
+                            report["removed"].append(seg.name)
+                    elif prefix and seg.name in expected:
+                        _flush(prefix, before=seg.name)
+                        if _is_stub(seg.text):
+                            # follow the outputs of the state
+                            text = expected[seg.name][1]()
+                        else:
+                            text = self._update_function(seg.text, expected[seg.name][0])
+                        if text != seg.text:
+                            report["updated"].append(seg.name)
+                        fp.write(text)
+                    elif prefix:
+                        fp.write("# removed from the process description:\n")
+                        fp.write("".join("# %s" % line if line.strip() else "#\n"
+                                         for line in seg.text.splitlines(True)))
+                        report["commented"].append(seg.name)
+                    else:
+                        fp.write(seg.text)
+
+                    if prefix and last_index.get(prefix) == i:
+                        _flush(prefix, leading=True)
+
+                for prefix in _PREFIXES:
+                    _flush(prefix, leading=True)
+
+            shutil.copymode(filename, tmp_filename)
+            os.replace(tmp_filename, filename)
+        except Exception:
+            os.unlink(tmp_filename)
+            raise
+
+        return report
+
+    def _update_function(self, text, doc):
+        """
+        Update the keyword and the doc-string of the code of one function
+        """
+        match = _HEADER.search(text)
+        if not match:
+            return text
+        header = text[:match.end()]
+        if bool(match.group("async")) != self.async_functions:
+            header = "%s%s%s" % (
+                header[:match.start("def")], self.def_keyword, header[match.end("def"):],
             )
-            functions.append(code)
 
-        fp.write("\n\n# TRANSITIONS #\n\n")
-        fp.write("\n\n".join(sorted(functions)))
\ No newline at end of file
+        rest = text[match.end():]
+        doc_match = _DOCSTRING.match(rest)
+        if doc_match is None:
+            return header + self.render_doc(doc) + rest
+        if _doc_equal(doc_match.group("doc"), doc):
+            return header + rest
+        return "%s%s%s%s" % (
+            header, doc_match.group("blank"), self.render_doc(doc, doc_match.group("indent")),
+            rest[doc_match.end():],
+        )
+
+
+_PREFIXES = ("state_", "transition_")
+
+_HEADER = re.compile(
+    r"^(?P<def>(?P<async>async\s+)?def)\s+\w+\s*\((?:[^()]|\([^()]*\))*\)\s*(?:->[^:]*)?:[ \t]*(?:#[^\n]*)?\n",
+    re.MULTILINE,
+)
+_DOCSTRING = re.compile(
+    r"(?P<blank>(?:[ \t]*\n)*)(?P<indent>[ \t]+)[rRuU]?(?P<quote>\"\"\"|''')(?P<doc>.*?)(?P=quote)[ \t]*\n",
+    re.DOTALL,
+)
+_DEF_NAME = re.compile(r"^(?:async\s+)?def\s+(\w+)", re.MULTILINE)
+_STUB_LINE = re.compile(r"\s*(pass|return context\.state\.\w+|if 1:|elif \d+:|else:)?\s*$")
+
+# the start of lines with code in the first column, and triple quotes
+_EVENT = re.compile(r"^(?=[^ \t\r\n#])|(\"\"\"|''')", re.MULTILINE)
+# triple quotes, comments, strings, brackets and line ends
+_TOKEN = re.compile(r"(\"\"\"|''')|#[^\n]*|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|([(\[{])|([)\]}])|(\n)")
+_STRING = re.compile(r"\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'")
+
+
+class _Segment:
+    __slots__ = ("text", "name", "is_transitions")
+
+    def __init__(self, text, name=None, is_transitions=False):
+        self.text = text
+        self.name = name
+        self.is_transitions = is_transitions
+
+
+def _prefix(name):
+    for prefix in _PREFIXES:
+        if name.startswith(prefix):
+            return prefix
+    return None
+
+
+def _split_statements(source):
+    """
+    Split python source into the top-level statements and the blank and comment lines between them,
+    without parsing it, which would be slow for large modules.
+    Only the first line of each statement and the multi-line strings are looked at,
+    the rest is skipped by the regular expressions.
+    :return: list of _Segment, their texts add up to `source`
+    """
+    starts = []
+    decorated = False
+    pos = 0
+    while True:
+        match = _EVENT.search(source, pos)
+        if match is None:
+            break
+        if match.group(1):
+            # the quotes may be inside a string or comment, look at the whole line
+            pos = max(pos, _skip_line(source, source.rfind("\n", 0, match.start()) + 1))
+            continue
+        start = match.start()
+        # the def after a decorator belongs to the decorator's statement
+        if not decorated:
+            starts.append(start)
+        decorated = source[start] == "@"
+        pos = _skip_line(source, start)
+
+    segments = []
+    if not starts or starts[0] > 0:
+        segments.append(_Segment(source[:starts[0] if starts else len(source)]))
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(source)
+        text = source[start:end]
+        # blank and comment lines at the end belong to the gap before the next statement
+        lines = text.splitlines(True)
+        n = len(lines)
+        while n > 1 and (not lines[n - 1].strip() or lines[n - 1].startswith("#")):
+            n -= 1
+        code = "".join(lines[:n]) if n < len(lines) else text
+        match = _DEF_NAME.match(code) if code[0] != "@" else _DEF_NAME.search(code)
+        segments.append(_Segment(
+            code,
+            name=match.group(1) if match else None,
+            is_transitions=code.startswith("TRANSITIONS") and re.match(r"TRANSITIONS\s*=", code) is not None,
+        ))
+        if n < len(lines):
+            segments.append(_Segment("".join(lines[n:])))
+    return segments
+
+
+def _skip_line(source, pos):
+    """
+    :return: the position after the line at `pos`, or after the line where its brackets are closed
+    """
+    depth = 0
+    length = len(source)
+    while pos < length:
+        end = source.find("\n", pos)
+        end = length if end < 0 else end + 1
+        line = source[pos:end]
+        if "#" not in line and '"""' not in line and "'''" not in line:
+            line = _STRING.sub("", line)
+            depth += line.count("(") + line.count("[") + line.count("{") \
+                - line.count(")") - line.count("]") - line.count("}")
+            pos = end
+        else:
+            while True:
+                match = _TOKEN.search(source, pos)
+                if match is None:
+                    return length
+                pos = match.end()
+                if match.group(1):
+                    end = source.find(match.group(1), pos)
+                    pos = length if end < 0 else end + 3
+                elif match.group(2):
+                    depth += 1
+                elif match.group(3):
+                    depth -= 1
+                elif match.group(4):
+                    break
+        if depth <= 0:
+            return pos
+    return length
+
+
+def _is_stub(text):
+    """
+    True if the function only contains what render_state_function() or render_transition_function() created,
+    decorated functions are never stubs
+    """
+    match = _HEADER.match(text)
+    if not match:
+        return False
+    rest = text[match.end():]
+    doc_match = _DOCSTRING.match(rest)
+    if doc_match:
+        rest = rest[doc_match.end():]
+    return all(_STUB_LINE.match(line) for line in rest.splitlines())
+
+
+def _doc_equal(doc1, doc2):
+    lines1 = list(line.strip() for line in doc1.split("\n") if line.strip())
+    lines2 = list(line.strip() for line in doc2.split("\n") if line.strip())
+    return lines1 == lines2
@@ -1,18 +1,174 @@
+import collections
+import concurrent.futures
+import hashlib
+import io
+import os
+import subprocess
 import sys
+import tempfile
 
 
 class GraphvizRenderer:
+    """
+    Renders a ProcessDescription as a graphviz DOT graph, and the DOT graph as an image with `dot`.
 
-    def __init__(self, process_descriptor):
+    Large graphs can be grouped into clusters and parts of a graph can be rendered
+    by selecting the neighborhood of one state.
+    The images are cached by the content hash of the DOT source.
+    """
+
+    # the graphviz executable
+    DOT_EXECUTABLE = "dot"
+
+    # the number of images cached in memory
+    MEMORY_CACHE_SIZE = 32
+
+    CLUSTER_PREFIX = "prefix"
+    CLUSTER_COMPONENT = "component"
+
+    def __init__(self, process_descriptor, cluster=None, center=None, depth=1):
+        """
+        :param cluster: None, CLUSTER_PREFIX to group the states by the part of their name before the
+            first underscore, CLUSTER_COMPONENT to group the connected parts of the graph,
+            or a callable that returns the cluster name of a State, or None
+        :param center: str or None, only render the states around the state with this name
+        :param depth: int, the number of transitions between `center` and the rendered states
+        """
+        if cluster not in (None, self.CLUSTER_PREFIX, self.CLUSTER_COMPONENT) and not callable(cluster):
+            raise ValueError("Invalid cluster '%s'" % (cluster, ))
+        if center is not None and not process_descriptor.has_state(center):
+            raise ValueError("Unknown state '%s'" % center)
         self.pd = process_descriptor
+        self.cluster = cluster
+        self.center = center
+        self.depth = depth
+
+    def run_graphviz(self, filename, format, cache_dir=None, executable=None):
+        """
+        Render the image with graphviz and write it to `filename`
+        :param format: str, the graphviz output format, e.g. "png" or "svg"
+        :param cache_dir: str or None, directory to store the images in
+        :param executable: str or None, path of the `dot` executable
+        """
+        _write_file(filename, self.run_dot(self.dot_source(), format, cache_dir=cache_dir, executable=executable))
+
+    @classmethod
+    def run_graphviz_many(cls, jobs, cache_dir=None, executable=None, executor=None):
+        """
+        Render many images in parallel.
+        The DOT sources are rendered here, only the images which are not cached are created on `executor`.
+
+        :param jobs: iterable of tuples (GraphvizRenderer, filename, format)
+        :param executor: a concurrent.futures.Executor,
+            if None, a ProcessPoolExecutor is created for the run
+        :return: list of filenames, in the order of `jobs`
+        """
+        filenames = []
+        # (dot source, format) -> filenames
+        pending = collections.OrderedDict()
+        for renderer, filename, format in jobs:
+            source = renderer.dot_source()
+            data = cls.get_cached(source, format, cache_dir=cache_dir, executable=executable)
+            if data is not None:
+                _write_file(filename, data)
+            else:
+                pending.setdefault((source, format), []).append(filename)
+            filenames.append(filename)
+
+        if pending:
+            own_executor = executor is None
+            if own_executor:
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1))
+            try:
+                futures = {
+                    executor.submit(cls.run_dot, source, format, cache_dir, executable): (source, format)
+                    for source, format in pending
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    source, format = futures[future]
+                    data = future.result()
+                    # the memory cache of the worker process is not shared
+                    cls._remember(cls._cache_key(source, format, executable), data)
+                    for filename in pending[(source, format)]:
+                        _write_file(filename, data)
+            finally:
+                if own_executor:
+                    executor.shutdown(wait=True)
+
+        return filenames
 
-    def run_graphviz(self, filename, format):
-        import subprocess, tempfile, os, uuid
-        dot_filename = os.path.join(tempfile.gettempdir(), "%s.dot" % uuid.uuid4())
-        with open(dot_filename, "wt") as fp:
-            self.render(fp)
-        subprocess.call(["dot", "-T%s" % format.lower(), dot_filename, "-o%s" % filename])
-        os.remove(dot_filename)
+    @classmethod
+    def run_dot(cls, source, format, cache_dir=None, executable=None):
+        """
+        Pipe the DOT source through graphviz, or return the cached output
+        :param source: str, DOT source
+        :param format: str, the graphviz output format
+        :return: bytes
+        """
+        data = cls.get_cached(source, format, cache_dir=cache_dir, executable=executable)
+        if data is not None:
+            return data
+
+        process = subprocess.run(
+            [executable or cls.DOT_EXECUTABLE, "-T%s" % format.lower()],
+            input=source.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if process.returncode:
+            raise RuntimeError("graphviz failed with exit code %s: %s" % (
+                process.returncode, process.stderr.decode("utf-8", "replace").strip(),
+            ))
+        data = process.stdout
+
+        key = cls._cache_key(source, format, executable)
+        cls._remember(key, data)
+        if cache_dir:
+            _write_cache_file(cache_dir, "graphviz-%s.%s" % (key, format.lower()), data)
+        return data
+
+    @classmethod
+    def get_cached(cls, source, format, cache_dir=None, executable=None):
+        """
+        :return: bytes or None if the output of the DOT source is not cached
+        """
+        key = cls._cache_key(source, format, executable)
+        data = _outputs.get(key)
+        if data is None and cache_dir:
+            try:
+                with open(os.path.join(cache_dir, "graphviz-%s.%s" % (key, format.lower())), "rb") as fp:
+                    data = fp.read()
+            except OSError:
+                return None
+            cls._remember(key, data)
+        return data
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forget the images cached in memory
+        """
+        _outputs.clear()
+
+    @classmethod
+    def _cache_key(cls, source, format, executable):
+        key = "%s\0%s\0%s" % (executable or cls.DOT_EXECUTABLE, format.lower(), source)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _remember(cls, key, data):
+        _outputs[key] = data
+        _outputs.move_to_end(key)
+        while len(_outputs) > cls.MEMORY_CACHE_SIZE:
+            _outputs.popitem(last=False)
+
+    def dot_source(self):
+        """
+        :return: str, the DOT graph
+        """
+        fp = io.StringIO()
+        self.render(fp)
+        return fp.getvalue()
 
     def render(self, fp=None):
         fp = fp or sys.stdout
@@ -27,25 +183,29 @@ class GraphvizRenderer:
     def render_graph(self, pd, fp=None):
         fp = fp or sys.stdout
 
-        for state in sorted(pd.states(), key=lambda s: s.name):
-
-            hue = round(((sum(ord(s) for s in state.name) % 13) / 13) % 1., 2)
-            sat = 0.2
+        names = self.selected_states(pd)
+        states = sorted((pd.get_state(name) for name in names), key=lambda s: s.name)
+        clusters = self.get_clusters(pd, names)
 
-            attrs = {
-                "color": '"%s %s, .9"' % (hue, sat),
-                "style": "filled",
-                "shape": "ellipse",
-            }
-            if state.is_user:
-                attrs["shape"] = "rect"
+        # states without cluster first, in the order of their names
+        for state in states:
+            if state.name not in clusters:
+                fp.write("\t%s\n" % self.render_state(state))
 
-            fp.write("\t%s [%s]\n" % (
-                self.get_graph_id(state.name),
-                ", ".join("%s=%s" % (key, attrs[key]) for key in attrs),
-            ))
+        members = collections.OrderedDict()
+        for state in states:
+            if state.name in clusters:
+                members.setdefault(clusters[state.name], []).append(state)
+        for cluster_name in sorted(members):
+            fp.write("\tsubgraph %s {\n" % self.get_graph_id("cluster_%s" % cluster_name))
+            fp.write("\t\tlabel=%s;\n" % self.get_graph_id(cluster_name))
+            for state in members[cluster_name]:
+                fp.write("\t\t%s\n" % self.render_state(state))
+            fp.write("\t}\n")
 
         for transition in sorted(pd.transitions(), key=lambda t: str(t)):
+            if transition.name_from not in names or transition.name_to not in names:
+                continue
             attrs = {
                 "color": "black",
             }
@@ -62,6 +222,78 @@ class GraphvizRenderer:
                 " [%s]" % ", ".join("%s=%s" % (key, attrs[key]) for key in attrs) if attrs else "",
             ))
 
+    def render_state(self, state):
+        hue = round(((sum(ord(s) for s in state.name) % 13) / 13) % 1., 2)
+        sat = 0.2
+
+        attrs = {
+            "color": '"%s %s, .9"' % (hue, sat),
+            "style": "filled",
+            "shape": "ellipse",
+        }
+        if state.is_user:
+            attrs["shape"] = "rect"
+        if state.name == self.center:
+            attrs["penwidth"] = "3"
+
+        return "%s [%s]" % (
+            self.get_graph_id(state.name),
+            ", ".join("%s=%s" % (key, attrs[key]) for key in attrs),
+        )
+
+    def selected_states(self, pd):
+        """
+        :return: set of the names of the rendered states
+        """
+        if self.center is None:
+            return set(s.name for s in pd.states())
+
+        names = {self.center}
+        border = [self.center]
+        for i in range(self.depth):
+            next_border = []
+            for name in border:
+                for other in [t.name_to for t in pd.outgoing(name)] + [t.name_from for t in pd.incoming(name)]:
+                    if other not in names:
+                        names.add(other)
+                        next_border.append(other)
+            border = next_border
+        return names
+
+    def get_clusters(self, pd, names):
+        """
+        :param names: set of the names of the rendered states
+        :return: dict of state name -> cluster name, for the states in a cluster of two or more states
+        """
+        if self.cluster is None:
+            return dict()
+
+        if self.cluster == self.CLUSTER_PREFIX:
+            clusters = {name: name.split("_", 1)[0] for name in names if "_" in name}
+        elif self.cluster == self.CLUSTER_COMPONENT:
+            clusters = dict()
+            for name in sorted(names):
+                if name in clusters:
+                    continue
+                # name the component after its first state
+                todo = [name]
+                while todo:
+                    other = todo.pop()
+                    if other in clusters or other not in names:
+                        continue
+                    clusters[other] = name
+                    todo.extend(t.name_to for t in pd.outgoing(other))
+                    todo.extend(t.name_from for t in pd.incoming(other))
+        else:
+            clusters = dict()
+            for name in names:
+                cluster_name = self.cluster(pd.get_state(name))
+                if cluster_name is not None:
+                    clusters[name] = str(cluster_name)
+
+        sizes = collections.Counter(clusters.values())
+        return {name: cluster_name for name, cluster_name in clusters.items() if sizes[cluster_name] > 1}
+
     def get_graph_id(self, name):
         return '"%s"' % name
 
@@ -78,3 +310,24 @@ class GraphvizRenderer:
                 runlen = 0
                 continue
         return " ".join(ret)
+
+
+# cache key -> bytes, the most recently used last
+_outputs = collections.OrderedDict()
+
+
+def _write_file(filename, data):
+    with open(filename, "wb") as fp:
+        fp.write(data)
+
+
+def _write_cache_file(directory, name, data):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=".graphviz-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_filename, os.path.join(directory, name))
+    except Exception:
+        os.unlink(tmp_filename)
+        raise
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import sys
+
+
+class RunnerRenderer:
+    """
+    Renders a python module with a direct-call state machine for a ProcessDescription.
+
+    For each state, the module contains a step function which calls the state function,
+    compares the returned State by identity with the possible next states, runs the
+    transition and detects its changes inline. With TRACK_PROXY, the recorded changes are
+    checked with python code generated from Transition.changes, snapshots are compared
+    with the transition's ChangeMatcher, which skips the valid subtrees.
+    Transitions that need more, e.g. with a job store, go through the generic
+    ProcessRunnerContext code, see ProcessRunner._compiled_tracking().
+    The step functions set the step function of the next state in the context,
+    so a step costs no dict lookups.
+
+    The module is loaded with ProcessRunner.load_compiled().
+    The state and transition functions themselves are taken from the runner when binding.
+    """
+
+    # increase when the generated code changes
+    VERSION = 5
+
+    def __init__(self, process_description):
+        self.pd = process_description
+        # (transitions hash, dict of (name_from, name_to) -> id), see _transition_id()
+        self._ids = (None, None)
+
+    @classmethod
+    def description_hash(cls, pd):
+        """
+        Hash of the states, transitions and changes of a ProcessDescription,
+        stored in the rendered module to detect outdated modules
+        :return: str
+        """
+        data = {
+            "version": cls.VERSION,
+            "states": sorted(s.name for s in pd.states()),
+            "transitions": sorted(
+                [t.name_from, t.name_to, t.function_name, sorted(t.changes)] for t in pd.transitions()
+            ),
+        }
+        data = json.dumps(data, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def render(self, fp=None):
+        fp = fp or sys.stdout
+        self.render_header(fp)
+        self.render_checks(fp)
+        self.render_bind(fp)
+
+    def render_header(self, fp=None):
+        fp = fp or sys.stdout
+
+        fp.write('''"""
+Compiled state machine, generated by processflow.renderer.RunnerRenderer
+
+Do not edit, render it again when the TRANSITIONS change.
+"""
+import types
+
+from %(package)s.runner import change_tracking, object_compare
+
+
+DESCRIPTION_HASH = %(hash)r
+
+
+def _match(parts, pattern):
+    """
+    True if the key parts start with the pattern, None in the pattern matches any key
+    """
+    if len(parts) < len(pattern):
+        return False
+    for part, expected in zip(parts, pattern):
+        if expected is not None and part != expected:
+            return False
+    return True
+''' % {"hash": self.description_hash(self.pd), "package": __name__.split(".")[0]})
+
+    def render_checks(self, fp=None):
+        """
+        Render a replacement of the ChangeMatcher for each transition, see ChangeMatcher.subtract()
+        """
+        fp = fp or sys.stdout
+
+        for transition in self._sorted_transitions():
+            fp.write('\n\ndef _subtract_%s(changes):\n    """\n    %s -> %s\n    changes: %s\n    """\n%s' % (
+                self._transition_id(transition),
+                transition.name_from, transition.name_to,
+                ", ".join(transition.changes),
+                self._render_subtract(transition.changes),
+            ))
+
+        fp.write("\n\nCHECKS = {\n")
+        for transition in self._sorted_transitions():
+            fp.write("    (%r, %r): types.SimpleNamespace(subtract=_subtract_%s),\n" % (
+                transition.name_from, transition.name_to, self._transition_id(transition),
+            ))
+        fp.write("}\n")
+
+    def _render_subtract(self, changes):
+        exact, wildcards = set(), set()
+        for change in changes:
+            seq = change.split(".")
+            # 'a.*' matches the same keys as 'a'
+            while seq and seq[-1] == "*":
+                seq = seq[:-1]
+            if not seq:
+                return "    return dict()\n"
+            if "*" in seq:
+                wildcards.add(tuple(None if key == "*" else key for key in seq))
+            else:
+                exact.add(".".join(seq))
+
+        conditions = []
+        if exact:
+            conditions.append("key in %r" % (tuple(sorted(exact)), ))
+            conditions.append("key.startswith(%r)" % (tuple("%s." % e for e in sorted(exact)), ))
+        for pattern in sorted(wildcards, key=repr):
+            conditions.append("_match(key.split('.'), %r)" % (pattern, ))
+        if not conditions:
+            return "    return dict(changes)\n"
+        return "    return {\n        key: changes[key] for key in changes\n        if not (%s)\n    }\n" % (
+            "\n                or ".join(conditions)
+        )
+
+    def render_bind(self, fp=None):
+        fp = fp or sys.stdout
+
+        fp.write('''
+
+def bind(runner):
+    """
+    Create the step functions with the states, transitions and functions of `runner`.
+    States with missing functions are left out and run by the generic ProcessRunnerContext.step()
+    :return: dict of state name -> step function
+    """
+    steps = dict()
+    deep_copy = object_compare.deep_copy
+    iter_difference = object_compare.iter_difference
+    difference_pair = object_compare.difference_pair
+    ChangeRecorder = change_tracking.ChangeRecorder
+    wrap_context = change_tracking.wrap_context
+    unwrap = change_tracking.unwrap
+''')
+        states = sorted(self.pd.states(), key=lambda s: s.name)
+        for state in states:
+            fp.write("    S_%s = runner.get_state(%r)\n" % (state.name, state.name))
+            fp.write("    state_%s = runner.get_state_function(%r)\n" % (state.name, state.name))
+        for transition in self._sorted_transitions():
+            tid = self._transition_id(transition)
+            fp.write("    T_%s = runner.get_transition(%r, %r)\n" % (tid, transition.name_from, transition.name_to))
+            fp.write("    transition_%s = runner.get_transition_function(%r, %r)\n" % (
+                tid, transition.name_from, transition.name_to,
+            ))
+            fp.write("    tracking_%s = runner._compiled_tracking(T_%s, transition_%s)\n" % (tid, tid, tid))
+            fp.write("    matcher_%s = T_%s.change_matcher\n" % (tid, tid))
+
+        for state in states:
+            fp.write(self._render_step(state))
+
+        fp.write("\n")
+        for state in states:
+            fp.write("    if state_%s is not None%s:\n        steps[%r] = step_%s\n" % (
+                state.name,
+                "".join(
+                    " and transition_%s is not None" % self._transition_id(t)
+                    for t in self.pd.outgoing(state.name)
+                ),
+                state.name, state.name,
+            ))
+        # the step functions refer to these, they are looked up when the function runs
+        for state in states:
+            fp.write("    next_%s = steps.get(%r)\n" % (state.name, state.name))
+        fp.write("    return steps\n")
+
+    def _render_step(self, state):
+        code = "\n    def step_%s(context):\n" % state.name
+        code += "        next_state = state_%s(context._function_context)\n" % state.name
+        for transition in self.pd.outgoing(state.name):
+            tid = self._transition_id(transition)
+            code += "        if next_state is S_%s:\n" % transition.name_to
+            code += self._render_transition(tid)
+            code += "            context._current_state = next_state\n"
+            code += "            context._compiled_step = next_%s\n" % transition.name_to
+            code += "            return result\n"
+        code += "        return context._compiled_fallback(next_state)\n"
+        return code
+
+    def _render_transition(self, tid):
+        """
+        Run the transition function with the change detection chosen when binding
+        """
+        return '''            if tracking_%(tid)s == "clean":
+                result = transition_%(tid)s(context._function_context)
+            elif tracking_%(tid)s == "snapshot":
+                function_context = context._function_context
+                pre_condition = deep_copy(function_context)
+                result = transition_%(tid)s(function_context)
+                post_condition = deep_copy(function_context)
+                for key, old, new in iter_difference(pre_condition, post_condition, matcher_%(tid)s):
+                    context._invalid_changes(T_%(tid)s, {key: difference_pair(old, new)})
+            elif tracking_%(tid)s == "proxy":
+                recorder = ChangeRecorder()
+                try:
+                    result = transition_%(tid)s(wrap_context(context._function_context, recorder))
+                finally:
+                    recorder.close()
+                result = unwrap(result)
+                invalid_changes = _subtract_%(tid)s(recorder.get_difference())
+                if invalid_changes:
+                    context._invalid_changes(T_%(tid)s, invalid_changes)
+            else:
+                result = context._compiled_transition(T_%(tid)s, transition_%(tid)s)
+''' % {"tid": tid}
+
+    def _sorted_transitions(self):
+        return sorted(self.pd.transitions(), key=lambda t: (t.name_from, t.name_to))
+
+    def _transition_id(self, transition):
+        """
+        The index of the transition in _sorted_transitions(), joining the state names
+        is ambiguous when they contain the separator
+        """
+        transitions_hash, ids = self._ids
+        if transitions_hash != self.pd.transitions_hash():
+            ids = {(t.name_from, t.name_to): str(i) for i, t in enumerate(self._sorted_transitions())}
+            self._ids = (self.pd.transitions_hash(), ids)
+        return ids[(transition.name_from, transition.name_to)]
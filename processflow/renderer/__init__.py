@@ -1,2 +1,3 @@
 from .CodeRenderer import CodeRenderer
 from .GraphvizRenderer import GraphvizRenderer
+from .RunnerRenderer import RunnerRenderer
@@ -0,0 +1,82 @@
+import inspect
+import logging
+import time
+
+from .ProcessRunnerContext import ProcessRunnerContext
+from .RunResult import RunResult
+
+
+class AsyncProcessRunnerContext(ProcessRunnerContext):
+    """
+    A context whose step() is a coroutine.
+    State and transition functions may be `async def` functions or plain functions.
+    """
+
+    async def step(self):
+        if self._finished:
+            return
+
+        record = self._get_dispatch()
+        func = record.state_function or self._get_state_function()
+        log = self._runner._logger.isEnabledFor(logging.DEBUG)
+        timed = log or self._runner._metrics is not None
+
+        # run state decision function and determine next state
+        start = time.perf_counter() if timed else None
+        next_state = await _call(func, self._function_context)
+        if timed:
+            self._after_state(next_state, start, log)
+
+        try:
+            entry = record.next.get(next_state)
+        except TypeError:
+            # unhashable, reported by _get_dispatch_entry()
+            entry = None
+        entry = entry or self._get_dispatch_entry(next_state)
+        if entry is None:
+            return
+        transition, func = entry
+        func = func or self._get_transition_function(transition)
+
+        # run transition function
+        argument, tracker = self._begin_transition(transition)
+        start = time.perf_counter() if timed else None
+        try:
+            result = await _call(func, argument)
+        finally:
+            self._close_tracker(tracker)
+        if timed:
+            self._after_transition(transition, start, log)
+        result = self._end_transition(transition, tracker, result)
+
+        self._current_state = next_state
+
+        return result
+
+    async def run(self, max_steps=None, deadline=None):
+        """
+        Step until the process is finished, `max_steps` steps are done or the `deadline` has passed
+        :param max_steps: int or None, maximum number of steps
+        :param deadline: float or None, a time.monotonic() value
+        :return: RunResult instance
+        """
+        start = time.monotonic()
+        steps = 0
+        reason = RunResult.FINISHED
+        while not self._finished:
+            if max_steps is not None and steps >= max_steps:
+                reason = RunResult.MAX_STEPS
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                reason = RunResult.DEADLINE
+                break
+            await self.step()
+            steps += 1
+        return RunResult(steps, self._current_state, reason, time.monotonic() - start)
+
+
+async def _call(func, argument):
+    ret = func(argument)
+    if inspect.isawaitable(ret):
+        ret = await ret
+    return ret
@@ -0,0 +1,25 @@
+
+class JobResult(object):
+    """
+    Outcome of one job run by ProcessRunner.run_many()
+    """
+    def __init__(self, index, kwargs, context=None, error=None):
+        """
+        :param index: int, position of the job in the `contexts_kwargs` passed to run_many()
+        :param kwargs: dict, the context values the job was created with
+        :param context: the ProcessRunnerContext, if the job was created and run without error
+        :param error: the exception raised by the job, or None
+        """
+        self.index = index
+        self.kwargs = kwargs
+        self.context = context
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return "JobResult(%s, error=%r)" % (self.index, self.error)
+        return "JobResult(%s, state=%s)" % (self.index, self.context._current_state)
+
+    @property
+    def ok(self):
+        return self.error is None
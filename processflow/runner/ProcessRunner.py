@@ -1,18 +1,81 @@
+import asyncio
+import concurrent.futures
 import importlib
+import importlib.util
 import inspect
+import itertools
 import warnings
 
 
-from ..description import ProcessDescription
+from ..description import ProcessDescription, DescriptionCache
+from ..renderer import RunnerRenderer
 from .ProcessRunnerContext import ProcessRunnerContext
+from .AsyncProcessRunnerContext import AsyncProcessRunnerContext
+from .JobResult import JobResult
+from .StateDispatch import StateDispatch
+from .ValidationPolicy import ValidationPolicy
+from .log import LOGGER
+from .metrics import RunnerMetrics
+from . import function_validation
+from . import static_check
 
 
 class ProcessRunner(object):
 
+    # compare a deep copy of the whole context before and after each transition
+    TRACK_SNAPSHOT = "snapshot"
+    # wrap the context in recording proxies and only compare the written paths
+    TRACK_PROXY = "proxy"
+
+    # validation modes of the functions in load_functions()
+    VALIDATE_STRICT = "strict"
+    VALIDATE_WARN_ONCE = "warn-once"
+    VALIDATE_OFF = "off"
+
     def __init__(self):
         self._pd = None
+        self._function_modules = []
+        # the functions bound so far
         self._state_functions = dict()
         self._transition_functions = dict()
+        self._validation = self.VALIDATE_WARN_ONCE
+        self._validation_cache = None
+        # module name -> function name -> result of static_check.check_function_node()
+        self._static_results = dict()
+        self._trust_static_check = False
+        # names of the transitions whose bound function is proven clean
+        self._static_clean = set()
+        # state name -> StateDispatch
+        self._dispatch = dict()
+        # module rendered by RunnerRenderer and its bound step functions
+        self._compiled_module = None
+        self._compiled_steps = None
+        self._change_tracking = self.TRACK_SNAPSHOT
+        # transition name -> ValidationPolicy, None to validate every step
+        self._change_validation = None
+        self._change_validation_default = None
+        self._change_validation_explicit = dict()
+        self._violation_callback = None
+        self._job_store = None
+        self._checkpoint_every = None
+        self._logger = LOGGER
+        self._metrics = None
+
+    def __getstate__(self):
+        # modules can not be pickled, e.g. for a ProcessPoolExecutor
+        state = self.__dict__.copy()
+        state["_function_modules"] = [module.__name__ for module in self._function_modules]
+        state["_dispatch"] = dict()
+        if self._compiled_module is not None:
+            state["_compiled_module"] = self._compiled_module.__name__
+        state["_compiled_steps"] = None
+        return state
+
+    def __setstate__(self, state):
+        state["_function_modules"] = [importlib.import_module(name) for name in state["_function_modules"]]
+        if state["_compiled_module"] is not None:
+            state["_compiled_module"] = importlib.import_module(state["_compiled_module"])
+        self.__dict__.update(state)
 
     @property
     def process_description(self):
@@ -30,6 +93,77 @@ class ProcessRunner(object):
     def get_transition(self, name_from, name_to):
         return self._pd.get_transition(name_from, name_to)
 
+    @property
+    def change_tracking(self):
+        return self._change_tracking
+
+    def set_change_tracking(self, mode):
+        """
+        Set the way changes of transition functions to the context are detected
+        :param mode: str, one of
+            ProcessRunner.TRACK_SNAPSHOT: deep copy the whole context before and after the transition
+            ProcessRunner.TRACK_PROXY: pass recording proxies to the transition function,
+                which only snapshot the written paths. Objects that can not be proxied
+                are snapshotted at the path they are accessed through. The proxies of lists
+                and dicts are not accepted by C functions that need the exact type,
+                e.g. json.dumps(), see processflow.runner.change_tracking
+        :return: None
+        """
+        if mode not in (self.TRACK_SNAPSHOT, self.TRACK_PROXY):
+            raise ValueError("Invalid change tracking mode '%s'" % mode)
+        self._change_tracking = mode
+        self._compiled_steps = None
+
+    def set_change_validation(self, policy, transition=None):
+        """
+        Set how often the changes of transition functions to the context are validated.
+        By default every step is validated and invalid changes raise RuntimeError.
+        :param policy: ValidationPolicy instance or str, ValidationPolicy.ALWAYS or ValidationPolicy.NEVER
+        :param transition: str, the Transition.name, or None to set the policy of all transitions
+            that have no policy of their own. The policy of a transition is used as it is
+            and counts its steps, a default policy is copied for each transition.
+            The policies and counters of the other transitions are kept.
+        :return: None
+        """
+        if isinstance(policy, str):
+            policy = ValidationPolicy(policy)
+        if transition is None:
+            self._change_validation_default = policy
+        else:
+            try:
+                self._pd.transition_by_name(transition)
+            except KeyError:
+                raise ValueError("Invalid transition '%s'" % transition)
+            self._change_validation_explicit[transition] = policy
+
+        default = self._change_validation_default or ValidationPolicy()
+        policies = self._change_validation if self._change_validation is not None else dict()
+        for t in self._pd.transitions():
+            if t.name in self._change_validation_explicit:
+                policies[t.name] = self._change_validation_explicit[t.name]
+            elif transition is None or t.name not in policies:
+                policies[t.name] = default.copy()
+        self._change_validation = policies
+        self._compiled_steps = None
+
+    def set_violation_callback(self, callback):
+        """
+        Set the function that receives the invalid changes found by sampled validation.
+        Without a callback, they are logged as warnings.
+        :param callback: callable(context, transition, invalid_changes) or None
+        :return: None
+        """
+        self._violation_callback = callback
+
+    def change_validation_counts(self):
+        """
+        Return how often the changes of each transition were validated, see set_change_validation()
+        :return: dict of transition name -> dict of "policy", "steps", "validated", "violations"
+        """
+        if self._change_validation is None:
+            return dict()
+        return {name: policy.counts() for name, policy in self._change_validation.items()}
+
     @classmethod
     def from_process_description(cls, process_description):
         """
@@ -42,11 +176,19 @@ class ProcessRunner(object):
         return runner
 
     @classmethod
-    def from_python(cls, module_name):
+    def from_python(cls, module_name, description_cache=None, validation=None, validation_cache=None,
+                    compiled=False):
         """
         Create a runner from the .py file generated by ProcessDescription.render_code()
         Any functions from the file will be loaded as well
         :param module_name: str, the python module, e.g. "package.file"
+        :param description_cache: DescriptionCache instance or str, a directory for a DescriptionCache,
+            to load the compiled ProcessDescription from
+        :param validation: str, the validation mode of the functions, see set_validation(),
+            in strict mode the dispatch records are built and checked for missing functions
+        :param validation_cache: str, directory to remember the validation results in
+        :param compiled: bool or str, if True, load the module `<module_name>_compiled` if it exists,
+            if str, the name of the compiled module to load, see load_compiled()
         :return: new instance of ProcessRunner
         """
         module = importlib.import_module(module_name)
@@ -54,56 +196,442 @@ class ProcessRunner(object):
         if "TRANSITIONS" not in objects:
             raise ValueError("TRANSITIONS not found in module %s" % module_name)
 
-        pd = ProcessDescription()
-        pd.set_transitions(objects["TRANSITIONS"])
+        if description_cache is not None:
+            if isinstance(description_cache, str):
+                description_cache = DescriptionCache(description_cache)
+            pd = description_cache.get(objects["TRANSITIONS"], module)
+        else:
+            pd = ProcessDescription()
+            pd.set_transitions(objects["TRANSITIONS"])
 
         runner = cls.from_process_description(pd)
+        if validation is not None or validation_cache is not None:
+            runner.set_validation(validation or runner.validation, validation_cache)
         runner.load_functions(module_name)
+        if runner.validation == cls.VALIDATE_STRICT:
+            runner.build_dispatch()
+        if compiled:
+            if isinstance(compiled, str):
+                runner.load_compiled(compiled)
+            else:
+                runner.load_compiled("%s_compiled" % module_name, required=False)
 
         return runner
 
     def load_functions(self, module_name):
         """
         Load the state and transitions functions from the python module
+        The functions may be `async def` functions, which can only be run by an AsyncProcessRunnerContext
+
+        The functions are checked according to the validation mode (see set_validation())
+        and are only looked up in the module when a state or transition is first used.
         :param module_name: str, the python module, e.g. "package.file"
         :return: None
         """
         module = importlib.import_module(module_name)
 
-        func_name_to_state = {s.function_name: s for s in self._pd.states()}
-        func_name_to_transition = {t.function_name: t for t in self._pd.transitions()}
-
-        def _doc_equal(obj, doc):
-            lines1 = list(line.strip() for line in inspect.getdoc(obj).strip().split("\n") if line.strip())
-            lines2 = list(line.strip() for line in doc.strip().split("\n") if line.strip())
-            return lines1 == lines2
-
-        for name in module.__dict__:
-            obj = module.__dict__[name]
-            if inspect.isfunction(obj):
-                if name.startswith("state_"):
-                    if name not in func_name_to_state:
-                        raise ValueError("state function '%s' is unused" % name)
-                    state = func_name_to_state[name]
-                    if not _doc_equal(obj, state.python_doc):
-                        warnings.warn("doc-string changed for state function '%s':\n%s" % (name, state.python_doc))
-                    self._state_functions[func_name_to_state[name].name] = obj
-
-                if name.startswith("transition_"):
-                    if name not in func_name_to_transition:
-                        raise ValueError("transition function '%s' is unused" % name)
-                    t = func_name_to_transition[name]
-                    if not _doc_equal(obj, t.python_doc):
-                        warnings.warn("doc-string changed for transition function '%s':\n%s" % (name, t.python_doc))
-                    self._transition_functions[(t.name_from, t.name_to)] = obj
+        static = None
+        if self._validation != self.VALIDATE_OFF:
+            result, cached = function_validation.cached_check_functions(
+                self._pd, module, cache_dir=self._validation_cache
+            )
+            if result["errors"]:
+                raise ValueError(result["errors"][0])
+            if result["warnings"]:
+                if self._validation == self.VALIDATE_STRICT:
+                    raise ValueError(result["warnings"][0])
+                if not cached:
+                    for message in result["warnings"]:
+                        warnings.warn(message)
+            if not cached:
+                for message in result["static_warnings"]:
+                    warnings.warn(message)
+            static = result["static"]
+        elif self._trust_static_check:
+            static = static_check.check_module(self._pd, module)
+
+        self._function_modules.insert(0, module)
+        self._static_results[module.__name__] = static or dict()
+        self._unbind_functions()
+
+    def _unbind_functions(self):
+        self._state_functions.clear()
+        self._transition_functions.clear()
+        self._static_clean.clear()
+        self._dispatch.clear()
+        self._compiled_steps = None
+
+    def load_compiled(self, module_name, required=True):
+        """
+        Load a module rendered by ProcessDescription.render_runner().
+        Synchronous contexts then step through its step functions, except when
+        metrics or debug logging are enabled. The module must be rendered from the
+        same states, transitions and changes as the runner's description.
+        :param module_name: str, the python module, e.g. "package.file_compiled"
+        :param required: bool, if False, a module that does not exist is ignored
+        :return: bool, True if the module was loaded
+        """
+        if not required:
+            try:
+                if importlib.util.find_spec(module_name) is None:
+                    return False
+            except ModuleNotFoundError:
+                return False
+        module = importlib.import_module(module_name)
+        if getattr(module, "DESCRIPTION_HASH", None) != RunnerRenderer.description_hash(self._pd):
+            raise ValueError("Compiled module %s does not match the process description, render it again" % (
+                module_name
+            ))
+        self._compiled_module = module
+        self._compiled_steps = None
+        return True
+
+    @property
+    def compiled_module(self):
+        return self._compiled_module
+
+    def _get_compiled_steps(self):
+        """
+        :return: dict of state name -> step function of the compiled module, or None
+        """
+        if self._compiled_steps is None and self._compiled_module is not None:
+            self._compiled_steps = self._compiled_module.bind(self)
+        return self._compiled_steps
+
+    def _compiled_tracking(self, transition, func):
+        """
+        Choose the change detection that the step functions of the compiled module run inline,
+        called when binding them
+        :return: "clean" for transitions proven clean, TRACK_SNAPSHOT or TRACK_PROXY, or None
+            to run the transition through the generic code of the context, which is needed with
+            a job store or validation policies and for coroutine functions
+        """
+        if func is None or inspect.iscoroutinefunction(func):
+            return None
+        if self._job_store is not None or self._change_validation is not None:
+            return None
+        if transition.name in self._static_clean:
+            return "clean"
+        return self._change_tracking
+
+    def _find_function(self, name):
+        for module in self._function_modules:
+            func = module.__dict__.get(name)
+            if func is not None and inspect.isfunction(func):
+                return func
+        return None
 
     def get_state_function(self, state_name):
-        return self._state_functions.get(state_name, None)
+        try:
+            return self._state_functions[state_name]
+        except KeyError:
+            pass
+        func = None
+        if self._pd.has_state(state_name):
+            func = self._find_function(self._pd.get_state(state_name).function_name)
+        self._state_functions[state_name] = func
+        return func
 
     def get_transition_function(self, state_name_from, state_name_to):
-        return self._transition_functions.get((state_name_from, state_name_to), None)
+        key = (state_name_from, state_name_to)
+        try:
+            return self._transition_functions[key]
+        except KeyError:
+            pass
+        func = None
+        if self._pd.has_transition(state_name_from, state_name_to):
+            transition = self._pd.get_transition(state_name_from, state_name_to)
+            func = self._find_function(transition.function_name)
+            if func is not None and self._trust_static_check and self._is_proven_clean(func):
+                self._static_clean.add(transition.name)
+        self._transition_functions[key] = func
+        return func
+
+    def _is_proven_clean(self, func):
+        result = self._static_results.get(func.__module__, dict()).get(func.__name__)
+        return bool(result and result["clean"])
+
+    def get_dispatch(self, state_name):
+        """
+        Return the dispatch record of a state, it is built on first use
+        :param state_name: str
+        :return: StateDispatch instance
+        """
+        try:
+            return self._dispatch[state_name]
+        except KeyError:
+            pass
+        if not self._pd.has_state(state_name):
+            raise ValueError("Invalid state '%s'" % state_name)
+
+        next = dict()
+        for transition in self._pd.outgoing(state_name):
+            next[self._pd.get_state(transition.name_to)] = (
+                transition,
+                self.get_transition_function(transition.name_from, transition.name_to),
+            )
+        record = StateDispatch(
+            self._pd.get_state(state_name), self.get_state_function(state_name), next,
+        )
+        self._dispatch[state_name] = record
+        return record
+
+    def build_dispatch(self, check=True):
+        """
+        Build the dispatch records of all states, instead of on first use
+        :param check: bool, raise ValueError if any state or transition function is missing
+        :return: None
+        """
+        missing = []
+        for state in self._pd.states():
+            missing += self.get_dispatch(state.name).missing_functions()
+        if check and missing:
+            raise ValueError("Missing functions: %s" % ", ".join(missing))
+
+    @property
+    def validation(self):
+        return self._validation
+
+    def set_validation(self, mode, cache_dir=None):
+        """
+        Set how load_functions() checks the functions of a module
+        :param mode: str, one of
+            ProcessRunner.VALIDATE_STRICT: raise ValueError on unused functions and changed doc-strings
+            ProcessRunner.VALIDATE_WARN_ONCE: raise ValueError on unused functions, warn about changed doc-strings
+                the first time a module file is checked
+            ProcessRunner.VALIDATE_OFF: no checks
+        :param cache_dir: str or None, directory to remember the results per module file,
+            across processes. Within a process they are always remembered.
+        :return: None
+        """
+        if mode not in (self.VALIDATE_STRICT, self.VALIDATE_WARN_ONCE, self.VALIDATE_OFF):
+            raise ValueError("Invalid validation mode '%s'" % mode)
+        self._validation = mode
+        self._validation_cache = cache_dir
+
+    @property
+    def trust_static_check(self):
+        return self._trust_static_check
 
-    def create_context(self, state_name, **kwargs):
+    def set_trust_static_check(self, enabled):
+        """
+        Skip the change detection for transitions whose function is proven by
+        the static analysis in load_functions() to only write its declared changes,
+        see processflow.runner.static_check.
+        With a job store, the changes are still detected, as they are recorded in the journal.
+        :param enabled: bool
+        :return: None
+        """
+        self._trust_static_check = bool(enabled)
+        if self._trust_static_check:
+            # modules loaded with VALIDATE_OFF
+            for module in self._function_modules:
+                if not self._static_results.get(module.__name__):
+                    self._static_results[module.__name__] = static_check.check_module(self._pd, module)
+        self._unbind_functions()
+
+    def static_check_results(self):
+        """
+        Return the results of the static analysis of the loaded transition functions
+        :return: dict of function name -> dict of "writes", "violations", "unknown", "clean",
+            for modules loaded later the results of earlier modules are overridden
+        """
+        ret = dict()
+        for module in reversed(self._function_modules):
+            ret.update(self._static_results.get(module.__name__, dict()))
+        return ret
+
+    def create_context(self, state_name, context_id=None, **kwargs):
+        """
+        Create a new context starting in the given state
+        :param state_name: str
+        :param context_id: str or None, the id of the context in the job store, defaults to a random uuid
+        :param kwargs: the values of the context
+        :return: new ProcessRunnerContext instance
+        """
+        return self._create_context(ProcessRunnerContext, state_name, context_id, kwargs)
+
+    def create_async_context(self, state_name, context_id=None, **kwargs):
+        """
+        Same as create_context() but returns an AsyncProcessRunnerContext
+        """
+        return self._create_context(AsyncProcessRunnerContext, state_name, context_id, kwargs)
+
+    def _create_context(self, context_class, state_name, context_id, kwargs):
         state = self._pd.get_state(state_name)
-        context = ProcessRunnerContext(self, state, **kwargs)
+        context = context_class(self, state, **kwargs)
+        if context_id is not None:
+            context._context_id = context_id
+        if self._job_store is not None:
+            context.checkpoint()
         return context
+
+    @property
+    def logger(self):
+        return self._logger
+
+    def set_logger(self, logger):
+        """
+        Set the logger that receives the records of the contexts, see processflow.runner.log
+        :param logger: logging.Logger instance
+        :return: None
+        """
+        self._logger = logger
+
+    def set_metrics(self, enabled, name="default", buckets=None):
+        """
+        Enable timing of the state and transition functions, the snapshots and the validation
+        :param enabled: bool
+        :param name: str, label of this runner in the prometheus exposition,
+            the metrics of runners with the same name are added up there
+        :param buckets: sequence of float, upper bounds of the histogram buckets in seconds,
+            defaults to RunnerMetrics.BUCKETS
+        :return: None
+        """
+        if self._metrics is not None:
+            # the exposition only shows the current metrics of a runner
+            self._metrics.unregister()
+        self._metrics = RunnerMetrics(name, buckets) if enabled else None
+
+    def metrics(self, percentiles=(50, 90, 99)):
+        """
+        Return the timing statistics, see set_metrics()
+        :param percentiles: sequence of numbers between 0 and 100
+        :return: dict of kind -> name -> dict of "count", "sum", "mean", "min", "max", "p50", ...
+            kind is one of "state", "transition", "snapshot", "diff"
+            and name is the name of the state or transition
+        """
+        if self._metrics is None:
+            raise ValueError("Metrics are not enabled, use set_metrics()")
+        return self._metrics.summary(percentiles)
+
+    @property
+    def job_store(self):
+        return self._job_store
+
+    def set_job_store(self, store, checkpoint_every=None):
+        """
+        Persist the contexts of this runner.
+        New contexts are checkpointed on creation and every completed step is recorded in the store.
+        :param store: a processflow.store.JobStore instance or None
+        :param checkpoint_every: int or None, store a complete checkpoint of a context
+            after this number of steps, which makes resuming independent of the journal before
+        :return: None
+        """
+        self._job_store = store
+        self._checkpoint_every = checkpoint_every
+        self._compiled_steps = None
+
+    def resume(self, context_id, async_context=False):
+        """
+        Restore a context from the job store, by loading its latest checkpoint
+        and replaying the journaled steps after it.
+        :param context_id: str, the ProcessRunnerContext.context_id
+        :param async_context: bool, create an AsyncProcessRunnerContext
+        :return: new ProcessRunnerContext instance
+        """
+        if self._job_store is None:
+            raise ValueError("No job store set in the runner")
+        entries = self._job_store.load(context_id)
+        if not entries:
+            raise KeyError("Context '%s' not found in job store" % context_id)
+
+        checkpoint = entries[0]
+        state = self._pd.get_state(checkpoint.data["state"])
+        context_class = AsyncProcessRunnerContext if async_context else ProcessRunnerContext
+        context = context_class(self, state, **checkpoint.data["objects"])
+        context._context_id = context_id
+        for entry in entries[1:]:
+            context._replay(entry)
+        return context
+
+    def run_many(self, initial_state, contexts_kwargs, executor=None, max_in_flight=100, max_steps=None):
+        """
+        Create a context for each entry in `contexts_kwargs` and step it until the process is finished.
+        The jobs are run on `executor` and their results are yielded as they complete.
+        An error in one job is stored in its JobResult and does not stop the others.
+
+        :param initial_state: str, name of the state each context starts in
+        :param contexts_kwargs: iterable of dicts, the values for each context, see create_context()
+        :param executor: a concurrent.futures.Executor, e.g. a ThreadPoolExecutor or ProcessPoolExecutor.
+            For process pools, the runner, its functions and the context values must be picklable.
+            If None, a ThreadPoolExecutor is created for the run.
+        :param max_in_flight: int, maximum number of jobs submitted to the executor at the same time
+        :param max_steps: int or None, maximum number of steps per job
+        :return: generator of JobResult
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1, got %s" % max_in_flight)
+
+        own_executor = executor is None
+        if own_executor:
+            executor = concurrent.futures.ThreadPoolExecutor()
+
+        jobs = enumerate(contexts_kwargs)
+        pending = dict()
+
+        def _submit(count):
+            for index, kwargs in itertools.islice(jobs, count):
+                future = executor.submit(_run_job, self, initial_state, kwargs, max_steps)
+                pending[future] = (index, kwargs)
+
+        try:
+            _submit(max_in_flight)
+            while pending:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    index, kwargs = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        yield JobResult(index, kwargs, context=future.result())
+                    else:
+                        yield JobResult(index, kwargs, error=error)
+                _submit(max_in_flight - len(pending))
+        finally:
+            for future in pending:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=True)
+
+    async def gather(self, initial_state, contexts_kwargs, concurrency=100, max_steps=None):
+        """
+        Create an AsyncProcessRunnerContext for each entry in `contexts_kwargs` and run them
+        on the current event loop until their processes are finished.
+        An error in one job is stored in its JobResult and does not stop the others.
+
+        :param initial_state: str, name of the state each context starts in
+        :param contexts_kwargs: iterable of dicts, the values for each context, see create_context()
+        :param concurrency: int, maximum number of contexts that are run at the same time
+        :param max_steps: int or None, maximum number of steps per job
+        :return: list of JobResult, in the order of `contexts_kwargs`
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1, got %s" % concurrency)
+
+        jobs = enumerate(contexts_kwargs)
+        results = []
+
+        async def _worker():
+            for index, kwargs in jobs:
+                try:
+                    context = self.create_async_context(initial_state, **kwargs)
+                    await context.run(max_steps=max_steps)
+                except Exception as e:
+                    results.append(JobResult(index, kwargs, error=e))
+                else:
+                    results.append(JobResult(index, kwargs, context=context))
+
+        await asyncio.gather(*(_worker() for i in range(concurrency)))
+
+        results.sort(key=lambda r: r.index)
+        return results
+
+
+def _run_job(runner, initial_state, kwargs, max_steps):
+    """
+    Run one job of ProcessRunner.run_many()
+    Module level function, so it can be passed to process pools
+    """
+    context = runner.create_context(initial_state, **kwargs)
+    context.run(max_steps=max_steps)
+    return context
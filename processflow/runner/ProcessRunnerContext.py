@@ -1,5 +1,14 @@
+import inspect
+import itertools
+import logging
+import time
+import uuid
+
 from ..description import State
 from . import object_compare
+from . import change_tracking
+from .metrics import RunnerMetrics
+from .RunResult import RunResult
 
 
 class ProcessRunnerContext(object):
@@ -14,32 +23,226 @@ class ProcessRunnerContext(object):
         self._current_state = initial_state
         self._function_context = _FunctionContext(self, **kwargs)
         self._finished = False
+        self._context_id = uuid.uuid4().hex
+        self._steps_since_checkpoint = 0
+        # step function of the current state from the runner's compiled module
+        # and the bound step functions it belongs to
+        self._compiled_step = None
+        self._compiled_steps = None
+        if self._runner._compiled_module is not None:
+            self._update_compiled_step()
+
+    @property
+    def context_id(self):
+        """
+        The id of the context in the runner's job store
+        """
+        return self._context_id
+
+    @property
+    def is_finished(self):
+        """
+        True when the state function of the current state has returned None
+        """
+        return self._finished
 
-    def _log(self, x):
-        print(x)
+    @property
+    def current_state(self):
+        return self._current_state
+
+    @property
+    def function_context(self):
+        """
+        The context object passed to the state and transition functions
+        """
+        return self._function_context
+
+    def run(self, max_steps=None, deadline=None):
+        """
+        Step until the process is finished, `max_steps` steps are done or the `deadline` has passed.
+        The deadline is checked between steps, a running step is never interrupted.
+        :param max_steps: int or None, maximum number of steps
+        :param deadline: float or None, a time.monotonic() value
+        :return: RunResult instance
+        """
+        start = time.monotonic()
+        steps = 0
+        step = self.step
+        reason = RunResult.FINISHED
+        while not self._finished:
+            if max_steps is not None and steps >= max_steps:
+                reason = RunResult.MAX_STEPS
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                reason = RunResult.DEADLINE
+                break
+            step()
+            steps += 1
+        return RunResult(steps, self._current_state, reason, time.monotonic() - start)
+
+    def _after_state(self, next_state, start, log):
+        duration = time.perf_counter() - start
+        if self._runner._metrics is not None:
+            self._runner._metrics.record(RunnerMetrics.STATE, self._current_state.name, duration)
+        if log:
+            self._log_state(next_state, duration)
+
+    def _after_transition(self, transition, start, log):
+        duration = time.perf_counter() - start
+        if self._runner._metrics is not None:
+            self._runner._metrics.record(RunnerMetrics.TRANSITION, transition.name, duration)
+        if log:
+            self._log_transition(transition, duration)
+
+    def _log_state(self, next_state, duration):
+        next_name = next_state.name if isinstance(next_state, State) else None
+        self._runner._logger.debug(
+            "%s: state %s -> %s (%.6fs)", self._context_id, self._current_state.name, next_name, duration,
+            extra={
+                "context_id": self._context_id,
+                "state": self._current_state.name,
+                "next_state": next_name,
+                "duration": duration,
+            }
+        )
+
+    def _log_transition(self, transition, duration):
+        self._runner._logger.debug(
+            "%s: transition %s (%.6fs)", self._context_id, transition.name, duration,
+            extra={
+                "context_id": self._context_id,
+                "state": self._current_state.name,
+                "transition": transition.name,
+                "duration": duration,
+            }
+        )
 
     def step(self):
         if self._finished:
             return
+
+        log = self._runner._logger.isEnabledFor(logging.DEBUG)
+        timed = log or self._runner._metrics is not None
+        if self._compiled_step is not None and not timed:
+            if self._compiled_steps is not self._runner._compiled_steps:
+                # the functions or settings of the runner have changed since binding
+                self._update_compiled_step()
+            if self._compiled_step is not None:
+                return self._compiled_step(self)
+
+        record = self._get_dispatch()
+        func = record.state_function or self._get_state_function()
+
+        # run state decision function and determine next state
+        start = time.perf_counter() if timed else None
+        next_state = func(self._function_context)
+        if timed:
+            self._after_state(next_state, start, log)
+
+        try:
+            entry = record.next.get(next_state)
+        except TypeError:
+            # unhashable, reported by _get_dispatch_entry()
+            entry = None
+        entry = entry or self._get_dispatch_entry(next_state)
+        if entry is None:
+            return
+        transition, func = entry
+        func = func or self._get_transition_function(transition)
+
+        # run transition function
+        argument, tracker = self._begin_transition(transition)
+        start = time.perf_counter() if timed else None
+        try:
+            result = func(argument)
+        finally:
+            self._close_tracker(tracker)
+        if timed:
+            self._after_transition(transition, start, log)
+        result = self._end_transition(transition, tracker, result)
+
+        self._current_state = next_state
+        if self._runner._compiled_module is not None:
+            self._update_compiled_step()
+
+        return result
+
+    def _update_compiled_step(self):
+        steps = self._runner._get_compiled_steps()
+        self._compiled_steps = steps
+        self._compiled_step = steps.get(getattr(self._current_state, "name", None)) if steps else None
+
+    def _compiled_transition(self, transition, func):
+        """
+        Run a transition function for a step function of the compiled module
+        :return: the result of the transition function
+        """
+        argument, tracker = self._begin_transition(transition)
+        try:
+            result = func(argument)
+        finally:
+            self._close_tracker(tracker)
+        return self._end_transition(transition, tracker, result)
+
+    def _compiled_fallback(self, next_state):
+        """
+        Continue a step function of the compiled module for next states that it does not handle,
+        which is the end of the process, invalid next states or State objects from other descriptions
+        :return: the result of the transition function
+        """
+        entry = self._get_dispatch_entry(next_state)
+        if entry is None:
+            return
+        transition, func = entry
+        result = self._compiled_transition(transition, func)
+        self._current_state = next_state
+        self._update_compiled_step()
+        return result
+
+    def _get_dispatch(self):
+        try:
+            return self._runner._dispatch[self._current_state.name]
+        except (KeyError, AttributeError):
+            if not isinstance(self._current_state, State):
+                raise ValueError("Invalid state '%s'" % self._current_state)
+            return self._runner.get_dispatch(self._current_state.name)
+
+    def _get_dispatch_entry(self, next_state):
+        """
+        Slow path of the dispatch, for the end of the process, invalid next states
+        or State objects that are not from the runner's description
+        :return: tuple of (Transition, transition function) or None if the process is finished
+        """
+        transition = self._get_transition(next_state)
+        if transition is None:
+            return None
+        return transition, self._get_transition_function(transition)
+
+    def _get_state_function(self):
         if not isinstance(self._current_state, State):
             raise ValueError("Invalid state '%s'" % self._current_state)
 
-        # get state function
         func = self._runner.get_state_function(self._current_state.name)
         if not func or not callable(func):
             raise ValueError("Invalid state function '%s' for state '%s'" % (func, self._current_state))
+        return func
 
-        # run state decision function and determine next state
-        self._log("running state: %s" % self._current_state)
-        next_state = func(self._function_context)
-
-        # verify next state
+    def _get_transition(self, next_state):
+        """
+        Verify the next state returned by the state function
+        :return: the Transition to next_state or None if the process is finished
+        """
         if next_state is None:
-            self._log("process finished")
             self._finished = True
-            return
+            if self._runner._job_store is not None:
+                self._runner._job_store.record_finished(self._context_id)
+            return None
 
         if not isinstance(next_state, State):
+            if inspect.iscoroutine(next_state):
+                next_state.close()
+                raise ValueError("State function for '%s' is a coroutine function, "
+                                 "use an AsyncProcessRunnerContext" % self._current_state)
             raise ValueError("Invalid next state '%s' returned from state function for '%s'" % (
                 next_state, self._current_state))
         if not self._pd.has_transition(self._current_state.name, next_state.name):
@@ -47,33 +250,189 @@ class ProcessRunnerContext(object):
                 self._current_state, next_state
             ))
 
-        # get transition function
         transition = self._runner.get_transition(self._current_state.name, next_state.name)
-        self._log("running transition: %s" % transition)
-        func = self._runner.get_transition_function(self._current_state.name, next_state.name)
+        return transition
+
+    def _get_transition_function(self, transition):
+        func = self._runner.get_transition_function(transition.name_from, transition.name_to)
         if not func or not callable(func):
             raise ValueError("Invalid transition function '%s' for transition '%s'" % (
                 func, transition))
+        return func
 
+    def _begin_transition(self, transition):
+        """
+        Prepare the change detection for a transition
+        :return: tuple of (argument for the transition function, tracker for _end_transition()),
+            the tracker is None if the transition function is proven clean
+            or the ValidationPolicy skips this step
+        """
+        if transition.name in self._runner._static_clean and self._runner._job_store is None:
+            return self._function_context, None
+
+        policies = self._runner._change_validation
+        if policies is not None:
+            policy = policies.get(transition.name)
+            if policy is not None and not policy.should_validate():
+                return self._function_context, None
+
+        if self._runner.change_tracking == self._runner.TRACK_PROXY:
+            recorder = change_tracking.ChangeRecorder()
+            return change_tracking.wrap_context(self._function_context, recorder), recorder
+
+        metrics = self._runner._metrics
+        start = time.perf_counter() if metrics is not None else None
         pre_condition = object_compare.deep_copy(self._function_context)
+        if metrics is not None:
+            metrics.record(RunnerMetrics.SNAPSHOT, transition.name, time.perf_counter() - start)
+        return self._function_context, pre_condition
 
-        # run transition function
-        result = func(self._function_context)
+    @staticmethod
+    def _close_tracker(tracker):
+        """
+        Stop recording when the transition function has returned or raised,
+        the proxies may have leaked out of it
+        """
+        if isinstance(tracker, change_tracking.ChangeRecorder):
+            tracker.close()
+
+    def _end_transition(self, transition, tracker, result):
+        """
+        Verify the changes the transition function has made to the context
+        :return: the result of the transition function
+        """
+        if inspect.iscoroutine(result):
+            result.close()
+            raise ValueError("Transition function for '%s' is a coroutine function, "
+                             "use an AsyncProcessRunnerContext" % transition)
 
-        post_condition = object_compare.deep_copy(self._function_context)
+        store = self._runner._job_store
+        if tracker is None:
+            # not validated, the changes are unknown so the journal gets a complete checkpoint
+            if store is not None:
+                self.checkpoint(transition.name_to)
+            return result
 
-        changes = object_compare.get_difference(pre_condition, post_condition)
-        invalid_changes = object_compare.subtract_valid_changes(changes, transition.changes)
+        metrics = self._runner._metrics
+        start = time.perf_counter() if metrics is not None else None
+        if isinstance(tracker, change_tracking.ChangeRecorder):
+            tracker.close()
+            result = change_tracking.unwrap(result)
+            changes = tracker.get_difference()
+        else:
+            pre_condition = tracker
+            post_condition = object_compare.deep_copy(self._function_context)
+            if metrics is not None:
+                now = time.perf_counter()
+                metrics.record(RunnerMetrics.SNAPSHOT, transition.name, now - start)
+                start = now
+            if store is None:
+                changes = None
+                invalid_changes = self._find_invalid_changes(transition, pre_condition, post_condition)
+            else:
+                changes = object_compare.get_difference(pre_condition, post_condition)
+
+        if changes is not None:
+            invalid_changes = transition.change_matcher.subtract(changes)
+        if metrics is not None:
+            metrics.record(RunnerMetrics.DIFF, transition.name, time.perf_counter() - start)
         if invalid_changes:
+            self._invalid_changes(transition, invalid_changes)
+
+        if store is not None:
+            if not all(object_compare.is_restorable(new) for old, new in changes.values()):
+                # e.g. large buffers are only snapshotted as digests, store their content
+                self.checkpoint(transition.name_to)
+                return result
+            store.record_step(self._context_id, transition.name_from, transition.name_to, changes)
+            self._steps_since_checkpoint += 1
+            every = self._runner._checkpoint_every
+            if every and self._steps_since_checkpoint >= every:
+                self.checkpoint(transition.name_to)
+
+        return result
+
+    def _find_invalid_changes(self, transition, pre_condition, post_condition):
+        """
+        Compare the snapshots without building the dict of all changes,
+        the values at valid paths are not compared.
+        If the invalid changes raise an error, the comparison stops at the first one.
+        :return: dict of the invalid changes, same format as object_compare.get_difference()
+        """
+        differences = object_compare.iter_difference(pre_condition, post_condition, transition.change_matcher)
+        policies = self._runner._change_validation
+        policy = policies.get(transition.name) if policies is not None else None
+        if policy is None or policy.raises:
+            differences = itertools.islice(differences, 1)
+        return {key: object_compare.difference_pair(old, new) for key, old, new in differences}
+
+    def _invalid_changes(self, transition, invalid_changes):
+        """
+        Raise RuntimeError or, if the transition's ValidationPolicy is sampled,
+        report the changes to the runner's violation callback
+        """
+        policies = self._runner._change_validation
+        policy = policies.get(transition.name) if policies is not None else None
+        if policy is not None:
+            policy.violations += 1
+        if policy is None or policy.raises:
             raise RuntimeError("transition '%s' has made invalid changes to context: '%s'" % (
                 transition, invalid_changes
             ))
 
-        self._current_state = next_state
+        callback = self._runner._violation_callback
+        if callback is not None:
+            callback(self, transition, invalid_changes)
+        else:
+            self._runner._logger.warning(
+                "%s: transition '%s' has made invalid changes to context: '%s'",
+                self._context_id, transition, invalid_changes,
+                extra={
+                    "context_id": self._context_id,
+                    "state": self._current_state.name,
+                    "transition": transition.name,
+                }
+            )
 
-        return result
+    def checkpoint(self, state_name=None):
+        """
+        Store the complete context in the runner's job store
+        :param state_name: str, the state to store, defaults to the current state
+        :return: None
+        """
+        store = self._runner._job_store
+        if store is None:
+            raise ValueError("No job store set in the runner")
+        store.checkpoint(
+            self._context_id, state_name or self._current_state.name, self._function_context._get_objects()
+        )
+        self._steps_since_checkpoint = 0
 
+    def _replay(self, entry):
+        """
+        Apply a journal entry of kind STEP or FINISHED to this context
+        The new values of the changes are written to their paths in the context.
+        Values that were objects are restored as the dicts of their snapshots,
+        set the runner's `checkpoint_every` to restore them exactly.
+        """
+        if entry.kind == entry.FINISHED:
+            self._finished = True
+            return
+
+        for key, (old, new) in sorted(entry.data["changes"].items()):
+            new = object_compare.restore_value(new)
+            path = key.split(".")
+            obj = self._function_context
+            for name in path[:-1]:
+                obj = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            if isinstance(obj, dict):
+                obj[path[-1]] = new
+            else:
+                setattr(obj, path[-1], new)
 
+        self._current_state = self._pd.get_state(entry.data["state_to"])
+        if self._runner._compiled_module is not None:
+            self._update_compiled_step()
 
 
 class _FunctionContext:
@@ -93,6 +452,12 @@ class _FunctionContext:
     def state(self):
         return self._states
 
+    def _get_objects(self):
+        """
+        :return: dict of the public attributes, the values stored in the context
+        """
+        return {key: value for key, value in self.__dict__.items() if not key.startswith("_")}
+
 
 class _StateObject:
     def __init__(self, states):
@@ -0,0 +1,36 @@
+class RunResult(object):
+    """
+    Outcome of ProcessRunnerContext.run()
+    """
+    # why run() returned
+    FINISHED = "finished"
+    MAX_STEPS = "max_steps"
+    DEADLINE = "deadline"
+
+    def __init__(self, steps, state, reason, duration):
+        """
+        :param steps: int, number of step() calls
+        :param state: the State the context is in afterwards
+        :param reason: str, one of FINISHED, MAX_STEPS, DEADLINE
+        :param duration: float, seconds the run took
+        """
+        self.steps = steps
+        self.state = state
+        self.reason = reason
+        self.duration = duration
+
+    def __repr__(self):
+        return "RunResult(%s, steps=%s, state=%s, duration=%.6f)" % (
+            self.reason, self.steps, self.state, self.duration
+        )
+
+    @property
+    def finished(self):
+        return self.reason == self.FINISHED
+
+    @property
+    def step_duration(self):
+        """
+        Mean seconds per step
+        """
+        return self.duration / self.steps if self.steps else 0.
@@ -0,0 +1,41 @@
+import types
+
+
+class StateDispatch(object):
+    """
+    Immutable record with everything a context needs to step from one state:
+
+        state:          the State
+        state_function: the bound state function or None
+        next:           read-only mapping of the next State to a tuple of
+                        (Transition, transition function or None)
+
+    Built by ProcessRunner.get_dispatch()
+    """
+    __slots__ = ("state", "state_function", "next")
+
+    def __init__(self, state, state_function, next):
+        object.__setattr__(self, "state", state)
+        object.__setattr__(self, "state_function", state_function)
+        object.__setattr__(self, "next", types.MappingProxyType(dict(next)))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("StateDispatch is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError("StateDispatch is immutable")
+
+    def __repr__(self):
+        return "StateDispatch(%s -> %s)" % (self.state, ", ".join(str(s) for s in self.next))
+
+    def missing_functions(self):
+        """
+        :return: list of str, names of the functions that are not bound
+        """
+        ret = []
+        if self.state_function is None:
+            ret.append(self.state.function_name)
+        for transition, function in self.next.values():
+            if function is None:
+                ret.append(transition.function_name)
+        return ret
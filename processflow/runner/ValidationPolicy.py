@@ -0,0 +1,102 @@
+import random
+
+
+class ValidationPolicy(object):
+    """
+    Decides for which steps of a transition the changes to the context are validated.
+
+        ALWAYS:  every step, invalid changes raise RuntimeError
+        SAMPLED: every `every`th step or with `probability`, invalid changes are
+                 reported to the runner's violation callback and do not raise
+        NEVER:   no snapshots, no validation
+
+    The instances count the steps, the validated steps and the violations.
+    The counters are not synchronized, with contexts in several threads
+    a few increments may be lost.
+    """
+    ALWAYS = "always"
+    SAMPLED = "sampled"
+    NEVER = "never"
+
+    def __init__(self, mode=ALWAYS, every=None, probability=None):
+        """
+        :param mode: str, one of ALWAYS, SAMPLED, NEVER
+        :param every: int, for SAMPLED, validate each `every`th step
+        :param probability: float between 0 and 1, for SAMPLED, validate randomly
+        """
+        if mode not in (self.ALWAYS, self.SAMPLED, self.NEVER):
+            raise ValueError("Invalid validation policy '%s'" % mode)
+        if mode == self.SAMPLED:
+            if (every is None) == (probability is None):
+                raise ValueError("Sampled validation needs either `every` or `probability`")
+            if every is not None and every < 1:
+                raise ValueError("`every` must be at least 1, got %s" % every)
+            if probability is not None and not 0. <= probability <= 1.:
+                raise ValueError("`probability` must be between 0 and 1, got %s" % probability)
+        self.mode = mode
+        self.every = every
+        self.probability = probability
+        self.steps = 0
+        self.validated = 0
+        self.violations = 0
+
+    @classmethod
+    def always(cls):
+        return cls(cls.ALWAYS)
+
+    @classmethod
+    def sampled(cls, every=None, probability=None):
+        return cls(cls.SAMPLED, every=every, probability=probability)
+
+    @classmethod
+    def never(cls):
+        return cls(cls.NEVER)
+
+    def __repr__(self):
+        if self.mode == self.SAMPLED:
+            if self.every is not None:
+                return "ValidationPolicy(sampled, every=%s)" % self.every
+            return "ValidationPolicy(sampled, probability=%s)" % self.probability
+        return "ValidationPolicy(%s)" % self.mode
+
+    @property
+    def raises(self):
+        """
+        True if invalid changes raise, False if they are reported
+        """
+        return self.mode == self.ALWAYS
+
+    def copy(self):
+        """
+        :return: new ValidationPolicy with the same settings and zero counters
+        """
+        return self.__class__(self.mode, every=self.every, probability=self.probability)
+
+    def should_validate(self):
+        """
+        Count a step and decide whether it is validated
+        :return: bool
+        """
+        self.steps += 1
+        if self.mode == self.ALWAYS:
+            validate = True
+        elif self.mode == self.NEVER:
+            validate = False
+        elif self.every is not None:
+            validate = self.steps % self.every == 0
+        else:
+            validate = random.random() < self.probability
+        if validate:
+            self.validated += 1
+        return validate
+
+    def counts(self):
+        """
+        :return: dict with "policy", "steps", "validated" and "violations"
+        """
+        return {
+            "policy": self.mode,
+            "steps": self.steps,
+            "validated": self.validated,
+            "violations": self.violations,
+        }
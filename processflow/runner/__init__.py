@@ -1,2 +1,6 @@
 from .ProcessRunner import ProcessRunner
 from .ProcessRunnerContext import ProcessRunnerContext
+from .AsyncProcessRunnerContext import AsyncProcessRunnerContext
+from .JobResult import JobResult
+from .RunResult import RunResult
+from .ValidationPolicy import ValidationPolicy
@@ -0,0 +1,438 @@
+"""
+Write-tracking proxies for the context passed to transition functions.
+
+Instead of snapshotting the whole context before and after a transition,
+the context is wrapped in recording proxies which log every attribute or
+item write as it happens. Only the written paths are snapshotted and
+compared afterwards.
+
+Values that can not be proxied (sets, objects without __dict__, Django
+managers, ...) fall back to a snapshot of the path they are reached through.
+
+The list and dict proxies support the operators of list and dict, but they are
+no subclasses of them. C functions that require a real list or dict, e.g. json.dumps()
+without indent, reject them. Pass unwrap(value) there, or use TRACK_SNAPSHOT.
+"""
+from . import object_compare
+
+
+_MISSING = object()
+
+LIST_MUTATORS = ("append", "extend", "insert", "pop", "remove", "clear", "sort", "reverse")
+DICT_MUTATORS = ("pop", "popitem", "clear", "update", "setdefault")
+# methods that hand out the contained objects untracked
+LIST_EXPORTS = ("copy", )
+DICT_EXPORTS = ("copy", "values", "items")
+
+
+class ChangeRecorder:
+    """
+    Collects the paths written through the proxies of one transition call
+    """
+    def __init__(self):
+        self._records = dict()
+        self._closed = False
+
+    def record(self, path, getter):
+        """
+        Remember the current value at `path`, if not recorded already
+        :param path: tuple of str, the path in the context
+        :param getter: callable returning the current value at path, raising
+                       AttributeError, KeyError or IndexError if there is none
+        """
+        if self._closed or path in self._records:
+            return
+        self._records[path] = (_snapshot(getter), getter)
+
+    def close(self):
+        """
+        Stop recording, e.g. for proxies that leaked out of the transition function
+        """
+        self._closed = True
+
+    @property
+    def paths(self):
+        return list(self._records)
+
+    def get_difference(self):
+        """
+        Compare the recorded paths with their current values
+        :return: dict, same format as object_compare.get_difference()
+        """
+        diff = dict()
+        for path, (old, getter) in self._records.items():
+            new = _snapshot(getter)
+            if not path:
+                sub_diff = object_compare.get_difference(old, new)
+                prefix = ""
+            else:
+                sub_diff = object_compare.get_difference(
+                    {} if old is _MISSING else {path[-1]: old},
+                    {} if new is _MISSING else {path[-1]: new},
+                )
+                prefix = ".".join(path[:-1])
+            for key in sub_diff:
+                # earlier records hold the older values
+                diff.setdefault("%s.%s" % (prefix, key) if prefix else key, sub_diff[key])
+        return diff
+
+
+def _snapshot(getter):
+    try:
+        value = getter()
+    except (AttributeError, KeyError, IndexError):
+        return _MISSING
+    return object_compare.copy_value(value)
+
+
+def wrap_context(function_context, recorder, exclude=("state", )):
+    """
+    Wrap the _FunctionContext in a recording proxy
+    :param function_context: the _FunctionContext instance
+    :param recorder: ChangeRecorder instance
+    :param exclude: attribute names of the context that are returned unwrapped
+    :return: proxy object
+    """
+    return _ObjectProxy(function_context, (), recorder, None, exclude)
+
+
+def unwrap(value):
+    """
+    Return the original object behind a proxy, or the value itself
+    """
+    if isinstance(value, _Proxy):
+        return object.__getattribute__(value, "_pf_target")
+    return value
+
+
+def _unwrap_items(values):
+    """
+    :return: list of the unwrapped values of an iterable, which may itself be a proxy
+    """
+    return [unwrap(value) for value in unwrap(values)]
+
+
+def _unwrap_mapping(values):
+    """
+    :return: a mapping or the list of key/value pairs that dict.update() accepts, unwrapped
+    """
+    values = unwrap(values)
+    if hasattr(values, "keys"):
+        return {key: unwrap(values[key]) for key in values.keys()}
+    return [(unwrap(key), unwrap(value)) for key, value in values]
+
+
+def _wrap(value, path, recorder, anchor, getter):
+    """
+    Return a proxy for `value` or the value itself.
+    :param path: the path at which value lives
+    :param anchor: None or (path, getter) of the enclosing list,
+                   which receives all writes below it
+    :param getter: callable returning the current value at `path`
+    """
+    if value is None or type(value) in object_compare.IMMUTABLE_TYPES:
+        return value
+    if isinstance(value, list):
+        return _ListProxy(value, path, recorder, anchor)
+    if isinstance(value, dict):
+        return _DictProxy(value, path, recorder, anchor)
+    if _is_proxyable_object(value):
+        return _ObjectProxy(value, path, recorder, anchor)
+
+    # can not track writes, snapshot the whole path instead
+    if anchor:
+        recorder.record(*anchor)
+    else:
+        recorder.record(path, getter)
+    return value
+
+
+def _is_proxyable_object(value):
+    if isinstance(value, type) or not hasattr(value, "__dict__") or callable(value):
+        return False
+    return not object_compare.is_manager(value)
+
+
+class _Proxy(object):
+    """
+    Base of all recording proxies.
+    Attributes are prefixed with _pf_ to not collide with the wrapped object
+    """
+    __slots__ = ("_pf_target", "_pf_path", "_pf_recorder", "_pf_anchor")
+
+    def __init__(self, target, path, recorder, anchor):
+        object.__setattr__(self, "_pf_target", target)
+        object.__setattr__(self, "_pf_path", path)
+        object.__setattr__(self, "_pf_recorder", recorder)
+        object.__setattr__(self, "_pf_anchor", anchor)
+
+    @property
+    def __class__(self):
+        # makes isinstance() work on the proxy
+        return type(self._pf_target)
+
+    def _pf_record(self, path, getter):
+        if self._pf_anchor:
+            self._pf_recorder.record(*self._pf_anchor)
+        else:
+            self._pf_recorder.record(path, getter)
+
+    def _pf_record_self(self):
+        target = self._pf_target
+        self._pf_record(self._pf_path, lambda: target)
+
+    def __repr__(self):
+        return repr(self._pf_target)
+
+    def __str__(self):
+        return str(self._pf_target)
+
+    def __eq__(self, other):
+        return self._pf_target == unwrap(other)
+
+    def __ne__(self, other):
+        return self._pf_target != unwrap(other)
+
+    def __hash__(self):
+        return hash(self._pf_target)
+
+    def __bool__(self):
+        return bool(self._pf_target)
+
+
+class _ObjectProxy(_Proxy):
+    __slots__ = ("_pf_exclude", )
+
+    def __init__(self, target, path, recorder, anchor, exclude=()):
+        super().__init__(target, path, recorder, anchor)
+        object.__setattr__(self, "_pf_exclude", exclude)
+
+    def __getattr__(self, name):
+        target = self._pf_target
+        value = getattr(target, name)
+        if name.startswith("_") or name in self._pf_exclude:
+            return value
+        if callable(value) and not object_compare.is_manager(value):
+            # methods might change the object
+            self._pf_record_self()
+            return value
+        return _wrap(
+            value, self._pf_path + (name, ), self._pf_recorder, self._pf_anchor,
+            lambda: getattr(target, name),
+        )
+
+    def __setattr__(self, name, value):
+        target = self._pf_target
+        if not name.startswith("_"):
+            self._pf_record(self._pf_path + (name, ), lambda: getattr(target, name))
+        setattr(target, name, unwrap(value))
+
+    def __delattr__(self, name):
+        target = self._pf_target
+        if not name.startswith("_"):
+            self._pf_record(self._pf_path + (name, ), lambda: getattr(target, name))
+        delattr(target, name)
+
+    # the protocols of the object hand out its contents untracked, like its methods
+
+    def __len__(self):
+        return len(self._pf_target)
+
+    def __contains__(self, value):
+        return unwrap(value) in self._pf_target
+
+    def __iter__(self):
+        self._pf_record_self()
+        return iter(self._pf_target)
+
+    def __reversed__(self):
+        self._pf_record_self()
+        return reversed(self._pf_target)
+
+    def __getitem__(self, key):
+        self._pf_record_self()
+        return self._pf_target[key]
+
+    def __setitem__(self, key, value):
+        self._pf_record_self()
+        self._pf_target[key] = unwrap(value)
+
+    def __delitem__(self, key):
+        self._pf_record_self()
+        del self._pf_target[key]
+
+
+class _DictProxy(_Proxy):
+    __slots__ = ()
+
+    def _pf_child(self, key, value):
+        target = self._pf_target
+        if isinstance(key, str):
+            return _wrap(
+                value, self._pf_path + (key, ), self._pf_recorder, self._pf_anchor,
+                lambda: target[key],
+            )
+        # get_difference() can not address non-str keys, anchor at the dict
+        return _wrap(
+            value, self._pf_path, self._pf_recorder, self._pf_anchor or (self._pf_path, lambda: target),
+            lambda: target,
+        )
+
+    def _pf_record_key(self, key):
+        target = self._pf_target
+        if isinstance(key, str):
+            self._pf_record(self._pf_path + (key, ), lambda: target[key])
+        else:
+            self._pf_record_self()
+
+    def __getitem__(self, key):
+        return self._pf_child(key, self._pf_target[key])
+
+    def get(self, key, default=None):
+        if key in self._pf_target:
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        self._pf_record_key(key)
+        self._pf_target[key] = unwrap(value)
+
+    def __delitem__(self, key):
+        self._pf_record_key(key)
+        del self._pf_target[key]
+
+    def update(self, *args, **kwargs):
+        self._pf_record_self()
+        self._pf_target.update(
+            *[_unwrap_mapping(values) for values in args], **{key: unwrap(kwargs[key]) for key in kwargs}
+        )
+
+    def setdefault(self, key, default=None):
+        self._pf_record_self()
+        return self._pf_target.setdefault(key, unwrap(default))
+
+    def __getattr__(self, name):
+        value = getattr(self._pf_target, name)
+        if name in DICT_MUTATORS or name in DICT_EXPORTS:
+            self._pf_record_self()
+        return value
+
+    def __or__(self, other):
+        # the new dict holds the contained objects untracked
+        self._pf_record_self()
+        return self._pf_target | unwrap(other)
+
+    def __ror__(self, other):
+        self._pf_record_self()
+        return unwrap(other) | self._pf_target
+
+    def __ior__(self, other):
+        self._pf_record_self()
+        self._pf_target |= _unwrap_mapping(other)
+        return self
+
+    def __reversed__(self):
+        return reversed(self._pf_target)
+
+    def __iter__(self):
+        return iter(self._pf_target)
+
+    def __len__(self):
+        return len(self._pf_target)
+
+    def __contains__(self, key):
+        return key in self._pf_target
+
+
+class _ListProxy(_Proxy):
+    __slots__ = ()
+
+    def _pf_child_anchor(self):
+        target = self._pf_target
+        return self._pf_anchor or (self._pf_path, lambda: target)
+
+    def __getitem__(self, index):
+        value = self._pf_target[index]
+        if isinstance(index, slice):
+            self._pf_record_self()
+            return value
+        return _wrap(value, self._pf_path, self._pf_recorder, self._pf_child_anchor(), None)
+
+    def __setitem__(self, index, value):
+        self._pf_record_self()
+        self._pf_target[index] = _unwrap_items(value) if isinstance(index, slice) else unwrap(value)
+
+    def __delitem__(self, index):
+        self._pf_record_self()
+        del self._pf_target[index]
+
+    def append(self, value):
+        self._pf_record_self()
+        self._pf_target.append(unwrap(value))
+
+    def insert(self, index, value):
+        self._pf_record_self()
+        self._pf_target.insert(index, unwrap(value))
+
+    def extend(self, values):
+        self._pf_record_self()
+        self._pf_target.extend(_unwrap_items(values))
+
+    def __iadd__(self, other):
+        self._pf_record_self()
+        self._pf_target += _unwrap_items(other)
+        return self
+
+    def __imul__(self, other):
+        self._pf_record_self()
+        self._pf_target *= other
+        return self
+
+    def __getattr__(self, name):
+        value = getattr(self._pf_target, name)
+        if name in LIST_MUTATORS or name in LIST_EXPORTS:
+            self._pf_record_self()
+        return value
+
+    def __add__(self, other):
+        # the new list holds the contained objects untracked
+        self._pf_record_self()
+        return self._pf_target + unwrap(other)
+
+    def __radd__(self, other):
+        self._pf_record_self()
+        return unwrap(other) + self._pf_target
+
+    def __mul__(self, other):
+        self._pf_record_self()
+        return self._pf_target * other
+
+    __rmul__ = __mul__
+
+    def __lt__(self, other):
+        return self._pf_target < unwrap(other)
+
+    def __le__(self, other):
+        return self._pf_target <= unwrap(other)
+
+    def __gt__(self, other):
+        return self._pf_target > unwrap(other)
+
+    def __ge__(self, other):
+        return self._pf_target >= unwrap(other)
+
+    def __reversed__(self):
+        recorder, path, anchor = self._pf_recorder, self._pf_path, self._pf_child_anchor()
+        for value in reversed(self._pf_target):
+            yield _wrap(value, path, recorder, anchor, None)
+
+    def __iter__(self):
+        recorder, path, anchor = self._pf_recorder, self._pf_path, self._pf_child_anchor()
+        for value in self._pf_target:
+            yield _wrap(value, path, recorder, anchor, None)
+
+    def __len__(self):
+        return len(self._pf_target)
+
+    def __contains__(self, value):
+        return unwrap(value) in self._pf_target
@@ -0,0 +1,155 @@
+"""
+Validation of the state and transition functions of a module against a ProcessDescription.
+
+The results are remembered per module file (path, modification time and size) and description
+in memory and, optionally, as small json files in a cache directory,
+so the check runs once per deployment and not in every worker process.
+
+The transition functions are also analysed statically, see static_check.
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import weakref
+
+from . import static_check
+
+# increase when the checks change
+VERSION = 4
+
+# cache key -> result dict
+_results = dict()
+
+# ProcessDescription -> (its transition dict, the equal TRANSITIONS of a module), see _cache_key()
+_module_transitions = weakref.WeakKeyDictionary()
+
+
+def check_functions(pd, module):
+    """
+    Compare the functions in `module` with the states and transitions of `pd`
+    :param pd: ProcessDescription
+    :param module: python module
+    :return: dict with
+        "errors": list of str, functions that do not belong to any state or transition
+        "warnings": list of str, functions whose doc-string does not match the description
+        "static": dict of transition function name -> result of static_check.check_function_node()
+        "static_warnings": list of str, transition functions that the static analysis finds
+            writing paths outside their declared changes. The analysis is a heuristic,
+            these are never errors
+    """
+    func_name_to_state = {s.function_name: s for s in pd.states()}
+    func_name_to_transition = {t.function_name: t for t in pd.transitions()}
+
+    errors, warnings = [], []
+    for name, obj in list(module.__dict__.items()):
+        if not inspect.isfunction(obj):
+            continue
+        if name.startswith("state_"):
+            if name not in func_name_to_state:
+                errors.append("state function '%s' is unused" % name)
+            else:
+                doc = func_name_to_state[name].python_doc
+                if not _doc_equal(obj, doc):
+                    warnings.append("doc-string changed for state function '%s':\n%s" % (name, doc))
+
+        if name.startswith("transition_"):
+            if name not in func_name_to_transition:
+                errors.append("transition function '%s' is unused" % name)
+            else:
+                doc = func_name_to_transition[name].python_doc
+                if not _doc_equal(obj, doc):
+                    warnings.append("doc-string changed for transition function '%s':\n%s" % (name, doc))
+
+    static = static_check.check_module(pd, module)
+    static_warnings = []
+    for name, result in sorted(static.items()):
+        for path in result["violations"]:
+            static_warnings.append(
+                "transition function '%s' changes '%s' which is not in its changes" % (name, path)
+            )
+
+    return {"errors": errors, "warnings": warnings, "static": static, "static_warnings": static_warnings}
+
+
+def cached_check_functions(pd, module, cache_dir=None):
+    """
+    Same as check_functions() but the result is cached per module file and description.
+    :param cache_dir: str or None, directory to store the results in
+    :return: tuple of (result dict, bool cached)
+    """
+    key = _cache_key(pd, module)
+    if key is None:
+        return check_functions(pd, module), False
+
+    result = _results.get(key)
+    if result is None and cache_dir:
+        result = _read(os.path.join(cache_dir, "validation-%s.json" % key))
+    if result is not None:
+        _results[key] = result
+        return result, True
+
+    result = _results[key] = check_functions(pd, module)
+    if cache_dir:
+        _write(os.path.join(cache_dir, "validation-%s.json" % key), result)
+    return result, False
+
+
+def _doc_equal(obj, doc):
+    lines1 = list(line.strip() for line in (inspect.getdoc(obj) or "").strip().split("\n") if line.strip())
+    lines2 = list(line.strip() for line in doc.strip().split("\n") if line.strip())
+    return lines1 == lines2
+
+
+def _cache_key(pd, module):
+    filename = getattr(module, "__file__", None)
+    if not filename:
+        return None
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    # the result also depends on the description the module is checked against. The TRANSITIONS
+    # of the module are covered by the file, comparing them is much faster than hashing them
+    transitions = getattr(module, "TRANSITIONS", None)
+    if _has_module_transitions(pd, transitions):
+        description = "TRANSITIONS"
+    else:
+        description = pd.transitions_hash()
+    key = "%s:%s:%s:%s:%s:%s" % (
+        VERSION, os.path.abspath(filename), module.__name__, stat.st_mtime_ns, stat.st_size, description,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _has_module_transitions(pd, transitions):
+    """
+    True if the description was created from `transitions`, remembered per description
+    """
+    if transitions is None or pd.transition_dict is None:
+        return False
+    known = _module_transitions.get(pd)
+    if known is not None and known[0] is pd.transition_dict and known[1] is transitions:
+        return True
+    if pd.transition_dict != transitions:
+        return False
+    _module_transitions[pd] = (pd.transition_dict, transitions)
+    return True
+
+
+def _read(filename):
+    try:
+        with open(filename) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(filename, result):
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=".validation-")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(result, fp)
+    os.replace(tmp_filename, filename)
@@ -0,0 +1,63 @@
+"""
+Logging of the ProcessRunnerContexts.
+
+All records go to the `processflow.runner` logger (or the logger set with
+ProcessRunner.set_logger()) at DEBUG level. When the level is disabled,
+the contexts neither format messages nor measure durations.
+
+The records carry these extra attributes:
+    context_id: the ProcessRunnerContext.context_id
+    state:      name of the state that was run
+    next_state: name of the state returned by the state function, None when finished
+    transition: name of the transition that was run
+    duration:   seconds the state or transition function took
+
+start_queue_logging() attaches a QueueHandler, so the stepping threads only
+put the records into a queue and the formatting and I/O is done by a
+background thread.
+"""
+import logging
+import logging.handlers
+import queue
+
+
+LOGGER = logging.getLogger("processflow.runner")
+
+
+def start_queue_logging(*handlers, level=logging.DEBUG, logger=None):
+    """
+    Route the records of `logger` through a queue to `handlers`
+    :param handlers: logging.Handler instances, defaults to a StreamHandler on stderr
+    :param level: int, the level to set on the logger
+    :param logger: logging.Logger, defaults to the processflow.runner logger
+    :return: logging.handlers.QueueListener, pass to stop_queue_logging()
+    """
+    logger = logger or LOGGER
+    record_queue = queue.SimpleQueue()
+    queue_handler = _RecordQueueHandler(record_queue)
+    listener = logging.handlers.QueueListener(
+        record_queue, *(handlers or (logging.StreamHandler(), )), respect_handler_level=True
+    )
+    listener.logger = logger
+    listener.queue_handler = queue_handler
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    listener.start()
+    return listener
+
+
+def stop_queue_logging(listener):
+    """
+    Detach the queue from the logger and write all remaining records
+    :param listener: the QueueListener returned by start_queue_logging()
+    """
+    listener.logger.removeHandler(listener.queue_handler)
+    listener.stop()
+
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # the records are consumed in the same process, leave the
+        # message formatting to the listener thread
+        return record
@@ -0,0 +1,228 @@
+"""
+Timing instrumentation of the ProcessRunnerContexts.
+
+Wall time is recorded separately for
+    state:      the state functions, keyed by state name
+    transition: the transition functions, keyed by transition name
+    snapshot:   deep_copy() of the context before and after a transition
+    diff:       get_difference() and the validation of the changes
+
+Each thread writes into its own histograms, so recording needs no lock.
+The histograms of all threads are merged when reading.
+"""
+import bisect
+import collections
+import threading
+import weakref
+
+
+# all RunnerMetrics instances, for the prometheus exposition
+_registry = weakref.WeakSet()
+
+
+class RunnerMetrics(object):
+
+    STATE = "state"
+    TRANSITION = "transition"
+    SNAPSHOT = "snapshot"
+    DIFF = "diff"
+
+    # upper bounds of the histogram buckets in seconds, 1µs to about 2 minutes
+    BUCKETS = tuple(1e-6 * 2 ** i for i in range(28))
+
+    def __init__(self, name="default", buckets=None):
+        """
+        :param name: str, label of the runner in the prometheus exposition
+        :param buckets: sequence of float, ascending upper bounds of the buckets in seconds
+        """
+        self.name = name
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_histograms = []
+        _registry.add(self)
+
+    def _histograms(self):
+        try:
+            return self._local.histograms
+        except AttributeError:
+            histograms = self._local.histograms = dict()
+            with self._lock:
+                self._thread_histograms.append(histograms)
+            return histograms
+
+    def record(self, kind, name, seconds):
+        """
+        Add one measurement
+        :param kind: str, one of STATE, TRANSITION, SNAPSHOT, DIFF
+        :param name: str, name of the state or transition
+        :param seconds: float
+        """
+        histograms = self._histograms()
+        histogram = histograms.get((kind, name))
+        if histogram is None:
+            histogram = histograms[(kind, name)] = Histogram(len(self.buckets) + 1)
+        histogram.add(bisect.bisect_left(self.buckets, seconds), seconds)
+
+    def reset(self):
+        with self._lock:
+            for histograms in self._thread_histograms:
+                histograms.clear()
+
+    def unregister(self):
+        """
+        Remove the metrics from the prometheus exposition, e.g. when the runner replaces them
+        """
+        _registry.discard(self)
+
+    def histograms(self):
+        """
+        Merge the histograms of all threads
+        :return: dict of (kind, name) -> Histogram
+        """
+        merged = dict()
+        with self._lock:
+            thread_histograms = list(self._thread_histograms)
+        for histograms in thread_histograms:
+            for key, histogram in list(histograms.items()):
+                if key in merged:
+                    merged[key].merge(histogram)
+                else:
+                    merged[key] = histogram.copy()
+        return merged
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Aggregate statistics of all measurements
+        :param percentiles: sequence of numbers between 0 and 100
+        :return: dict of kind -> name -> dict with
+            "count", "sum", "mean", "min", "max" and "p50", "p90", ... in seconds
+        """
+        ret = dict()
+        for (kind, name), histogram in sorted(self.histograms().items()):
+            values = {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "mean": histogram.sum / histogram.count if histogram.count else 0.,
+                "min": histogram.min,
+                "max": histogram.max,
+            }
+            for p in percentiles:
+                values["p%s" % p] = histogram.percentile(p, self.buckets)
+            ret.setdefault(kind, dict())[name] = values
+        return ret
+
+
+class Histogram(object):
+    """
+    Counts per bucket plus count, sum, min and max of the measurements
+    """
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.
+        self.min = None
+        self.max = None
+
+    def add(self, index, value):
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def copy(self):
+        histogram = Histogram(0)
+        histogram.merge(self)
+        return histogram
+
+    def merge(self, other):
+        if not self.counts:
+            self.counts = [0] * len(other.counts)
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p, buckets):
+        """
+        Estimate the p-th percentile by linear interpolation within its bucket
+        :param p: number between 0 and 100
+        :param buckets: the upper bounds of the buckets
+        :return: float or None if empty
+        """
+        if not self.count:
+            return None
+        rank = p / 100. * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = buckets[i - 1] if i else 0.
+                upper = buckets[i] if i < len(buckets) else self.max
+                value = lower + (upper - lower) * (rank - cumulative) / count
+                return min(max(value, self.min), self.max)
+            cumulative += count
+        return self.max
+
+
+def prometheus_text(metrics=None, metric_name="processflow_duration_seconds"):
+    """
+    Render histograms in the prometheus text exposition format
+    The histograms of RunnerMetrics with the same name and buckets are added up,
+    e.g. of several runners with the default name, so every series is unique.
+    :param metrics: sequence of RunnerMetrics, defaults to all registered instances
+    :param metric_name: str
+    :return: str
+    """
+    if metrics is None:
+        metrics = list(_registry)
+
+    lines = [
+        "# HELP %s Wall time of the processflow runner functions" % metric_name,
+        "# TYPE %s histogram" % metric_name,
+    ]
+    for runner_name, buckets, histograms in _merge(metrics):
+        bounds = ["%g" % b for b in buckets] + ["+Inf"]
+        for (kind, name), histogram in sorted(histograms.items()):
+            labels = 'runner="%s",kind="%s",name="%s"' % (_escape(runner_name), kind, _escape(name))
+            cumulative = 0
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %s' % (metric_name, labels, bound, cumulative))
+            lines.append("%s_sum{%s} %r" % (metric_name, labels, histogram.sum))
+            lines.append("%s_count{%s} %s" % (metric_name, labels, histogram.count))
+    return "\n".join(lines) + "\n"
+
+
+def _merge(metrics):
+    """
+    :return: list of tuples (runner label, buckets, dict of (kind, name) -> Histogram),
+        metrics with the same name but other buckets get the label "<name>-2", "<name>-3", ...
+    """
+    groups = collections.OrderedDict()
+    for m in sorted(metrics, key=lambda m: (m.name, m.buckets)):
+        merged = groups.setdefault((m.name, m.buckets), dict())
+        for key, histogram in m.histograms().items():
+            if key in merged:
+                merged[key].merge(histogram)
+            else:
+                merged[key] = histogram
+
+    ret = []
+    names = collections.Counter()
+    for (name, buckets), histograms in groups.items():
+        names[name] += 1
+        ret.append((name if names[name] == 1 else "%s-%s" % (name, names[name]), buckets, histograms))
+    return ret
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,71 +1,656 @@
+import datetime
+import decimal
+import hashlib
+import inspect
+import types
+import uuid
+
 try:
+    from django.db.models import Model
     from django.db.models.manager import Manager
     USE_DJANGO = True
 except ImportError:
-    pass
+    USE_DJANGO = False
+
+try:
+    import numpy
+    USE_NUMPY = True
+except ImportError:
+    USE_NUMPY = False
+
+
+# types which are returned as-is by deep_copy()
+IMMUTABLE_TYPES = (
+    int, str, float, bool, bytes,
+    decimal.Decimal, datetime.date, datetime.time, datetime.timedelta, uuid.UUID,
+)
+if USE_NUMPY:
+    IMMUTABLE_TYPES += (numpy.generic, )
+
+# buffers and arrays up to this number of bytes are copied by deep_copy(),
+# larger ones are only stored as digests of their chunks
+BUFFER_COPY_LIMIT = 1 << 20
+# the number of bytes per digest of a large buffer
+BUFFER_CHUNK_SIZE = 1 << 16
+
+
+class Reference(object):
+    """
+    Stands in for an object in a snapshot which is already being copied
+    further up in the hierarchy, e.g. a child object linking back to its parent.
+    `path` is the tuple of keys/indices at which the object's copy is stored.
+    """
+    __slots__ = ("path", )
+
+    def __init__(self, path):
+        self.path = tuple(path)
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self.path == other.path
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return "Reference(%s)" % ".".join(str(k) for k in self.path)
+
+
+class BufferSnapshot(object):
+    """
+    Stands in for a bytearray, memoryview or numpy array in a snapshot.
+    Buffers up to BUFFER_COPY_LIMIT bytes keep a copy of their content in `data`,
+    of larger ones only the digests of their chunks are stored, computed without copying the buffer.
+    Snapshots are equal if their type, dtype, shape and bytes are equal.
+    """
+    __slots__ = ("type", "dtype", "shape", "itemsize", "data", "chunk_digests", "_digest")
+
+    def __init__(self, type, dtype, shape, itemsize, data=None, chunk_digests=None):
+        self.type = type
+        self.dtype = dtype
+        self.shape = shape
+        self.itemsize = itemsize
+        self.data = data
+        self.chunk_digests = chunk_digests
+        self._digest = None
+
+    @classmethod
+    def from_buffer(cls, object):
+        """
+        :param object: bytearray, memoryview or numpy.ndarray
+        :return: BufferSnapshot
+        """
+        if isinstance(object, memoryview):
+            snapshot = cls("memoryview", object.format, object.shape, object.itemsize)
+            size, copy = object.nbytes, object.tobytes
+        elif isinstance(object, bytearray):
+            snapshot = cls("bytearray", "B", (len(object), ), 1)
+            size, copy = len(object), lambda: bytes(object)
+        else:
+            snapshot = cls("ndarray", object.dtype.str, object.shape, object.dtype.itemsize)
+            size, copy = object.nbytes, object.copy
+
+        if size <= BUFFER_COPY_LIMIT:
+            snapshot.data = copy()
+        else:
+            snapshot.chunk_digests = _chunk_digests(_byte_view(object), snapshot.chunk_items * snapshot.itemsize)
+        return snapshot
+
+    @property
+    def chunk_items(self):
+        """
+        The number of items per chunk digest
+        """
+        return max(1, BUFFER_CHUNK_SIZE // max(1, self.itemsize))
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            chunk_digests = self.chunk_digests
+            if chunk_digests is None:
+                chunk_digests = _chunk_digests(_byte_view(self.data), self.chunk_items * self.itemsize)
+            h = hashlib.blake2b(
+                ("%s:%s:%s" % (self.type, self.dtype, self.shape)).encode(), digest_size=16
+            )
+            for digest in chunk_digests:
+                h.update(digest)
+            self._digest = h.digest()
+        return self._digest
+
+    def restore(self):
+        """
+        :return: a new buffer with the copied content
+        :raise ValueError: if only the digests of the content are stored
+        """
+        if self.data is None:
+            raise ValueError("Only the digest of the %s is stored, it can not be restored" % self.type)
+        if self.type == "ndarray":
+            return self.data.copy()
+        if self.type == "memoryview":
+            return memoryview(bytearray(self.data)).cast("B").cast(self.dtype, self.shape)
+        return bytearray(self.data)
+
+    def __eq__(self, other):
+        if not isinstance(other, BufferSnapshot):
+            return False
+        if (self.type, self.dtype, self.shape) != (other.type, other.dtype, other.shape):
+            return False
+        if self.data is not None and other.data is not None:
+            if self.type == "ndarray":
+                return numpy.array_equal(_byte_view(self.data), _byte_view(other.data))
+            return self.data == other.data
+        return self.digest == other.digest
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return "BufferSnapshot(%s, %s, %s)" % (self.type, self.dtype, self.shape)
+
+
+class BufferDifference(list):
+    """
+    The [old, new] values of a changed buffer or array in the result of get_difference(),
+    with the changed ranges of item indices (in the flattened buffer) in `ranges`,
+    a list of (start, stop) tuples, or None if the type, dtype or shape has changed.
+    """
+    __slots__ = ("ranges", )
+
+    def __init__(self, old, new):
+        super().__init__((old, new))
+        self.ranges = _changed_ranges(old, new)
+
+    def __repr__(self):
+        if self.ranges is None:
+            return "BufferDifference(%r, %r)" % (_short_repr(self[0]), _short_repr(self[1]))
+        return "BufferDifference(ranges=%r)" % (self.ranges, )
+
+
+def _byte_view(object):
+    """
+    :return: the content of a bytes-like object or numpy array as a flat buffer of bytes,
+        without copying if it is contiguous
+    """
+    if isinstance(object, (bytes, bytearray)):
+        return memoryview(object)
+    if isinstance(object, memoryview):
+        return object.cast("B") if object.c_contiguous else memoryview(object.tobytes())
+    return numpy.ascontiguousarray(object).reshape(-1).view(numpy.uint8)
+
+
+def _chunk_digests(view, chunk_size):
+    return [
+        hashlib.blake2b(view[start:start + chunk_size], digest_size=16).digest()
+        for start in range(0, len(view), chunk_size)
+    ]
+
+
+def _changed_ranges(old, new):
+    """
+    :return: list of (start, stop) of the changed item indices, or None if the whole value has changed
+    """
+    if isinstance(old, bytes) and isinstance(new, bytes):
+        a, b, itemsize, size_a, size_b = memoryview(old), memoryview(new), 1, len(old), len(new)
+    elif isinstance(old, BufferSnapshot) and isinstance(new, BufferSnapshot):
+        if (old.type, old.dtype) != (new.type, new.dtype):
+            return None
+        # one-dimensional buffers may grow or shrink
+        if old.shape != new.shape and not (len(old.shape) == len(new.shape) == 1):
+            return None
+        itemsize = old.itemsize
+        size_a = size_b = 1
+        for n in old.shape:
+            size_a *= n
+        for n in new.shape:
+            size_b *= n
+        if old.data is None or new.data is None:
+            return _changed_chunks(old, new, size_a, size_b)
+        a, b = _byte_view(old.data), _byte_view(new.data)
+    else:
+        return None
+
+    size = min(size_a, size_b)
+    ranges = _changed_items(a[:size * itemsize], b[:size * itemsize], itemsize)
+    if size_a != size_b:
+        _add_range(ranges, size, max(size_a, size_b))
+    return ranges
+
+
+def _changed_items(a, b, itemsize):
+    """
+    Compare two byte buffers of the same length item by item
+    :return: list of (start, stop) of the changed item indices
+    """
+    if USE_NUMPY:
+        mask = numpy.frombuffer(a, numpy.uint8) != numpy.frombuffer(b, numpy.uint8)
+        if itemsize > 1:
+            mask = mask.reshape(-1, itemsize).any(axis=1)
+        indices = numpy.flatnonzero(mask)
+        if not len(indices):
+            return []
+        breaks = numpy.flatnonzero(numpy.diff(indices) > 1)
+        starts = indices[numpy.concatenate(([0], breaks + 1))]
+        stops = indices[numpy.concatenate((breaks, [len(indices) - 1]))] + 1
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    ranges = []
+    step = 256 * itemsize
+    for start in range(0, len(a), step):
+        if a[start:start + step] == b[start:start + step]:
+            continue
+        for i in range(start, min(start + step, len(a)), itemsize):
+            if a[i:i + itemsize] != b[i:i + itemsize]:
+                _add_range(ranges, i // itemsize, i // itemsize + 1)
+    return ranges
+
+
+def _changed_chunks(old, new, size_a, size_b):
+    """
+    Compare two snapshots by their chunk digests
+    :return: list of (start, stop) of the item indices of the changed chunks
+    """
+    chunk_items = old.chunk_items
+    digests_a, digests_b = (
+        s.chunk_digests if s.chunk_digests is not None
+        else _chunk_digests(_byte_view(s.data), chunk_items * s.itemsize)
+        for s in (old, new)
+    )
+    ranges = []
+    size = max(size_a, size_b)
+    for i in range(max(len(digests_a), len(digests_b))):
+        if i >= len(digests_a) or i >= len(digests_b) or digests_a[i] != digests_b[i]:
+            _add_range(ranges, i * chunk_items, min((i + 1) * chunk_items, size))
+    return ranges
+
+
+def _add_range(ranges, start, stop):
+    if ranges and ranges[-1][1] >= start:
+        ranges[-1] = (ranges[-1][0], max(ranges[-1][1], stop))
+    else:
+        ranges.append((start, stop))
+
+
+def _short_repr(value):
+    if isinstance(value, bytes) and len(value) > 32:
+        return "<%s bytes>" % len(value)
+    return value
+
+
+def restore_value(value):
+    """
+    Convert a value of a snapshot back to the type it was copied from, where possible
+    :return: a new buffer for a BufferSnapshot, otherwise `value` itself
+    :raise ValueError: for values that can not be restored, see is_restorable()
+    """
+    if isinstance(value, BufferSnapshot):
+        return value.restore()
+    if not is_restorable(value):
+        raise ValueError("The value only holds digests of the original content, it can not be restored")
+    return value
+
+
+def is_restorable(value):
+    """
+    False if a value of a snapshot is or contains a BufferSnapshot
+    that is not restored by restore_value(), e.g. a digest of a large buffer
+    """
+    if isinstance(value, BufferSnapshot):
+        return value.data is not None
+    seen = set()
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, BufferSnapshot):
+            return False
+        if isinstance(value, _CONTAINER_TYPES) and id(value) not in seen:
+            seen.add(id(value))
+            stack.extend(value.values() if isinstance(value, dict) else value)
+    return True
 
 
 def deep_copy(object):
     """
     Make a deep copy of any value/object, returning nested dicts
+    Objects reachable through several paths are copied only once and the copy is shared.
+    Cyclic links (to an object which contains the link) are stored as a Reference.
     :param object: Any type of object,
-           especially: single value, tuples/lists, dicts, classes, Django model instances
+           especially: single value, tuples/lists, dicts, classes, Django model instances.
+           bytearrays, memoryviews and numpy arrays are stored as BufferSnapshot
     :return: single value or dict of values/dicts
     """
+    relations = _RelationLoader()
+    snapshot = _copy(object, relations)
+    relations.load()
+    return snapshot
+
+
+# task types of the _copy() stack
+_COPY, _BUILD, _EXIT = range(3)
+
+
+def _copy(object, relations):
+    """
+    Iterative deep copy, see deep_copy()
+    """
     from .ProcessRunnerContext import _FunctionContext
 
-    # return single value
-    if object is None:
-        return None
-    if isinstance(object, (int, str, float, bool)):
-        return object
-
-    # return list of deep copies
-    if isinstance(object, list):
-        return [deep_copy(o) for o in object]
-    if isinstance(object, tuple):
-        return tuple(deep_copy(o) for o in object)
-    if isinstance(object, set):
-        return set(deep_copy(o) for o in object)
-
-    # return dict of deep copies
-
-    if isinstance(object, dict):
-        keys = object.keys()
-        _get = lambda k: object[k]
-    elif isinstance(object, _FunctionContext):
-        keys = list(dir(object))
-        keys.remove("state")
-        _get = lambda k: getattr(object, k)
-    else:
-        keys = dir(object)
-        _get = lambda k: getattr(object, k)
+    # id(object) -> (object, copy, path), the object is kept to keep the id valid.
+    # paths are linked (parent path, key) tuples, to not copy the keys for every value
+    memo = dict()
+    # ids of the objects whose attributes are currently copied
+    active = set()
 
-    ret = dict()
+    result = [None]
+    stack = [(_COPY, object, result, 0, None)]
+    while stack:
+        task = stack.pop()
+
+        if task[0] == _EXIT:
+            active.discard(task[1])
+            continue
+
+        if task[0] == _BUILD:
+            # all items of a tuple or set are copied
+            _, factory, target, key, items = task
+            target[key] = factory(items)
+            continue
+
+        _, object, target, key, path = task
+
+        # return single value
+        if object is None or isinstance(object, IMMUTABLE_TYPES):
+            target[key] = object
+            continue
+
+        if USE_NUMPY and isinstance(object, numpy.ndarray) and object.dtype.hasobject:
+            # the buffer only holds references, copy the items
+            object = object.tolist()
+
+        if isinstance(object, (tuple, set)):
+            items = [None] * len(object)
+            stack.append((_BUILD, type(object) if isinstance(object, tuple) else set, target, key, items))
+            for i, o in reversed(list(enumerate(object))):
+                stack.append((_COPY, o, items, i, (path, i)))
+            continue
+
+        object_id = id(object)
+        if object_id in memo:
+            if object_id in active:
+                target[key] = Reference(_unlink_path(memo[object_id][2]))
+            else:
+                target[key] = memo[object_id][1]
+            continue
 
-    for key in keys:
+        if isinstance(object, (bytearray, memoryview)) or (USE_NUMPY and isinstance(object, numpy.ndarray)):
+            ret = target[key] = BufferSnapshot.from_buffer(object)
+            memo[object_id] = (object, ret, path)
+            continue
+
+        # return list of deep copies
+        if isinstance(object, list):
+            ret = [None] * len(object)
+            pairs = enumerate(object)
+
+        # return dict of deep copies
+        else:
+            ret = dict()
+            if USE_DJANGO and isinstance(object, Model):
+                pairs = _model_items(object, ret, relations)
+            elif isinstance(object, dict):
+                pairs = _dict_items(object, ret)
+            elif isinstance(object, _FunctionContext):
+                pairs = _object_items(object, ret, exclude=("state", ))
+            else:
+                pairs = _object_items(object, ret)
+
+        target[key] = ret
+        memo[object_id] = (object, ret, path)
+        active.add(object_id)
+        stack.append((_EXIT, object_id))
+        for sub_key, value in reversed(list(pairs)):
+            stack.append((_COPY, value, ret, sub_key, (path, sub_key)))
+
+    return result[0]
+
+
+def _unlink_path(path):
+    keys = []
+    while path is not None:
+        path, key = path
+        keys.append(key)
+    return tuple(reversed(keys))
+
+
+def _add_attribute(ret, pairs, key, value):
+    """
+    Add the attribute to the `pairs` that need to be copied,
+    or store a Django manager's primary keys directly in `ret`.
+    Callables are skipped
+    """
+    if is_manager(value):
+        ret[key] = set(v[0] for v in value.values_list("pk"))
+    elif not callable(value):
+        pairs.append((key, value))
+
+
+def _dict_items(object, ret):
+    pairs = []
+    for key in object:
+        if isinstance(key, str) and key.startswith("_"):
+            continue
+        _add_attribute(ret, pairs, key, object[key])
+    return pairs
+
+
+def _object_items(object, ret, exclude=()):
+    """
+    Collect the public, non-callable attributes of an object.
+    Same result as iterating dir(object), but the instance attributes are read from __dict__
+    and the remaining candidates are taken from the per-type schema cache
+    """
+    schema = _get_type_schema(type(object))
+    if schema is None:
+        class_names = [key for key in dir(object) if not key.startswith("_")]
+        instance_values = dict()
+    else:
+        class_names, class_name_set = schema
         try:
-            if key.startswith("_"):
-                continue
+            instance_values = object.__dict__
         except AttributeError:
-            pass
+            instance_values = dict()
+
+    pairs = []
+
+    for key in instance_values:
+        if not isinstance(key, str) or key.startswith("_") or key in exclude:
+            continue
+        if schema is not None and key in class_name_set:
+            # might be shadowed by a data descriptor, read below
+            continue
+        _add_attribute(ret, pairs, key, instance_values[key])
+
+    for key in class_names:
+        if key in exclude:
+            continue
         try:
-            value = _get(key)
+            value = getattr(object, key)
         except AttributeError:
             continue
+        _add_attribute(ret, pairs, key, value)
 
-        if USE_DJANGO:
-            if isinstance(value, Manager):
-                value = set(v[0] for v in value.values_list("pk"))
+    return pairs
 
-        if callable(value):
-            continue
 
-        ret[key] = deep_copy(value)
+# class attributes that always return callables when accessed through an instance
+_CALLABLE_CLASS_ATTRIBUTES = (
+    types.FunctionType, types.BuiltinFunctionType, types.MethodDescriptorType,
+    types.WrapperDescriptorType, types.ClassMethodDescriptorType,
+    staticmethod, classmethod, type,
+)
+
+_type_schemas = dict()
+
+
+def _get_type_schema(cls):
+    """
+    Returns the names of the public class attributes of `cls` which may yield
+    a non-callable value on an instance (properties, slots, plain values, ...),
+    as a tuple and a frozenset.
+    Returns None for types that customize dir() or are metaclasses,
+    those are copied by calling dir() on the instance.
+    """
+    try:
+        return _type_schemas[cls]
+    except KeyError:
+        pass
+
+    if issubclass(cls, type) or getattr(cls, "__dir__", None) is not object.__dir__:
+        schema = None
+    else:
+        names = []
+        for name in dir(cls):
+            if name.startswith("_"):
+                continue
+            try:
+                attr = inspect.getattr_static(cls, name)
+            except AttributeError:
+                continue
+            if not isinstance(attr, _CALLABLE_CLASS_ATTRIBUTES):
+                names.append(name)
+        schema = (tuple(names), frozenset(names))
+
+    _type_schemas[cls] = schema
+    return schema
+
+
+def invalidate_type_cache(cls=None):
+    """
+    Forget the cached attribute schema of a class and its subclasses,
+    e.g. after attributes have been added to the class at runtime.
+    :param cls: the class or None to clear the whole cache
+    :return: None
+    """
+    for cache in (_type_schemas, _model_schemas):
+        if cls is None:
+            cache.clear()
+        else:
+            for key in list(cache):
+                if issubclass(key, cls):
+                    del cache[key]
+
+
+def copy_value(value):
+    """
+    Make a deep copy of an attribute value, like deep_copy() does for the attributes of objects,
+    e.g. Django managers are converted to the set of their primary keys
+    :param value: Any type of object
+    :return: single value or dict of values/dicts
+    """
+    if is_manager(value):
+        return set(v[0] for v in value.values_list("pk"))
 
+    return deep_copy(value)
+
+
+def _model_items(object, ret, relations):
+    """
+    Snapshot a Django model instance without dir() and property evaluation.
+    Contains the concrete field values (by attname, e.g. 'order_id' for a ForeignKey),
+    'pk', public non-field attributes of the instance
+    and the sets of primary keys of the related objects of many-to-many and reverse foreign-key
+    relations, e.g. 'orderitem_set'. The related objects themselves are not followed.
+    """
+    attnames, related = _get_model_schema(type(object))
+
+    pairs = []
+    values = object.__dict__
+    for attname in attnames:
+        if attname in values:
+            pairs.append((attname, values[attname]))
+        else:
+            # deferred field, this loads it
+            pairs.append((attname, getattr(object, attname)))
+    pairs.append(("pk", object.pk))
+
+    for key in values:
+        if not key.startswith("_") and key not in attnames:
+            _add_attribute(ret, pairs, key, values[key])
+
+    for accessor_name, related_model, lookup in related:
+        ret[accessor_name] = relations.request(related_model, lookup, object.pk)
+
+    return pairs
+
+
+_model_schemas = dict()
+
+
+def _get_model_schema(model):
+    """
+    Returns the concrete field attnames and a list of (accessor name, related model, lookup)
+    for the many-to-many and reverse many-to-one relations of the model class
+    """
+    try:
+        return _model_schemas[model]
+    except KeyError:
+        pass
+
+    opts = model._meta
+    attnames = [f.attname for f in opts.concrete_fields]
+    related = []
+    for rel in opts.related_objects:
+        if rel.one_to_many or rel.many_to_many:
+            # reverse relation, lookup is the field on the related model
+            related.append((rel.get_accessor_name(), rel.related_model, rel.field.name))
+    for field in opts.many_to_many:
+        related.append((field.name, field.related_model, field.related_query_name()))
+
+    ret = _model_schemas[model] = (attnames, related)
     return ret
 
 
+class _RelationLoader:
+    """
+    Collects requests for the primary keys of related objects during a copy,
+    to load them with one query per relation for all instances.
+    """
+    def __init__(self):
+        self._requests = dict()
+
+    def request(self, related_model, lookup, pk):
+        """
+        Returns an empty set that will be filled with the primary keys of the
+        `related_model` instances for which `lookup` points to `pk`, when calling load()
+        """
+        pk_set = set()
+        if pk is not None:
+            self._requests.setdefault((related_model, lookup), dict()).setdefault(pk, []).append(pk_set)
+        return pk_set
+
+    def load(self):
+        for (related_model, lookup), pk_sets in self._requests.items():
+            query = related_model._default_manager.filter(**{"%s__pk__in" % lookup: list(pk_sets)})
+            for pk, related_pk in query.values_list("%s__pk" % lookup, "pk"):
+                for pk_set in pk_sets[pk]:
+                    pk_set.add(related_pk)
+        self._requests = dict()
+
+
+def is_manager(value):
+    """
+    Returns True if value is a Django model manager
+    """
+    return USE_DJANGO and isinstance(value, Manager)
+
+
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+
 def get_difference(A, B):
     """
     Compare two dicts and return the differences per key in the hierarchy.
@@ -75,33 +660,77 @@ def get_difference(A, B):
     the result would be
         {"main.sub": [1, 2], "foo": [None, "bar"]}
 
+    Changed bytes and buffers are reported as BufferDifference, which holds the changed index ranges.
+
     :param A: dict
     :param B: dict
     :return: dict
     """
-    diff = dict()
-
-    def _compare(A, B, key, prefix):
-        prefix_key = ".".join((prefix, key)) if prefix else key
-        if key not in A:
-            diff[prefix_key] = [None, B[key]]
-            return
-        if key not in B:
-            diff[prefix_key] = [A[key], None]
-            return
-        a, b = A[key], B[key]
-        if a != b:
-            if type(a) == type(b):
-                if isinstance(a, dict):
-                    for key in set(a.keys()) | set(b.keys()):
-                        _compare(a, b, key, prefix_key)
-                    return
-            diff[prefix_key] = [a, b]
-
-    for key in set(A.keys()) | set(B.keys()):
-        _compare(A, B, key, "")
-
-    return diff
+    return {key: difference_pair(a, b) for key, a, b in iter_difference(A, B)}
+
+
+def difference_pair(a, b):
+    """
+    :return: the value of a change in the result of get_difference(), [a, b] or a BufferDifference
+    """
+    if isinstance(a, _BUFFER_VALUES) and isinstance(b, _BUFFER_VALUES):
+        return BufferDifference(a, b)
+    return [a, b]
+
+
+def iter_difference(A, B, matcher=None):
+    """
+    Generator form of get_difference(), yields a tuple (key, old value, new value) for each change.
+    The changes are compared lazily while iterating, so the caller can stop at any change.
+
+    With a `matcher`, only the changes that are not valid are yielded and the nested dicts at valid paths
+    are not compared at all, e.g. next(iter_difference(A, B, matcher), None) finds the first invalid change.
+
+    :param A: dict
+    :param B: dict
+    :param matcher: None or a ChangeMatcher of the valid changes
+    :return: generator of tuples (str, value or None, value or None)
+    """
+    # the state of the matcher's walk, None without matcher or if no valid change is below a path
+    nodes = matcher.walk_start() if matcher is not None else None
+    walk_step = matcher.walk_step if matcher is not None else None
+
+    # `deep` is set below dicts that were too deep for the builtin comparison
+    stack = [(A, B, "", False, nodes)]
+    while stack:
+        A, B, prefix, deep, nodes = stack.pop()
+
+        for key in set(A.keys()) | set(B.keys()):
+            if key in A and key in B:
+                a, b = A[key], B[key]
+                if type(a) == type(b) and isinstance(a, dict):
+                    # a subtree, only compared if changes in it may be invalid
+                    sub_nodes = nodes
+                    if nodes:
+                        sub_nodes = walk_step(nodes, key)
+                        if sub_nodes is True:
+                            continue
+                    sub_deep = deep
+                    if not deep:
+                        try:
+                            if a == b:
+                                continue
+                        except RecursionError:
+                            sub_deep = True
+                    stack.append((a, b, ".".join((prefix, key)) if prefix else key, sub_deep, sub_nodes))
+                    continue
+                if not a != b:
+                    continue
+            else:
+                a, b = A.get(key), B.get(key)
+
+            if nodes and walk_step(nodes, key) is True:
+                # a valid change
+                continue
+            yield ".".join((prefix, key)) if prefix else key, a, b
+
+
+_BUFFER_VALUES = (bytes, BufferSnapshot)
 
 
 def subtract_valid_changes(diff, valid_changes):
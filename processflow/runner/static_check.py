@@ -0,0 +1,265 @@
+"""
+Static analysis of the context writes of transition functions.
+
+The source of each `transition_*` function is parsed and every use of its
+context argument is followed along attribute, constant subscript and
+`getattr(obj, "name")` chains. The resulting paths are classified as
+
+    writes:    assignments, augmented assignments, `del` and calls of
+               mutating methods like list.append() or dict.update()
+    unknown:   uses that can not be followed, e.g. passing `context.order`
+               to another function or calling `context.order.save()`
+
+A transition function is proven clean if all of its writes are covered
+by the declared changes and there are no unknown uses. The analysis assumes
+that the objects in the context are not reachable through globals and that
+attribute writes do not have side effects, e.g. through property setters.
+"""
+import ast
+import inspect
+
+from .change_tracking import LIST_MUTATORS, DICT_MUTATORS
+
+
+MUTATING_METHODS = frozenset(
+    LIST_MUTATORS + DICT_MUTATORS
+    + ("add", "discard", "difference_update", "intersection_update", "symmetric_difference_update")
+)
+
+# methods whose result is treated like a value below the object
+READING_METHODS = frozenset((
+    "get", "keys", "values", "items", "copy", "count", "index",
+    "startswith", "endswith", "lower", "upper", "strip", "split", "format",
+))
+
+# builtins whose result does not reference their arguments
+SAFE_BUILTINS = frozenset((
+    "len", "str", "repr", "int", "float", "bool", "hash", "abs", "round",
+    "isinstance", "callable", "format", "any", "all", "sum",
+))
+
+# builtins that can reach the context in ways that are not followed
+UNSAFE_BUILTINS = frozenset(("eval", "exec", "locals", "vars", "globals", "setattr", "delattr"))
+
+
+def check_module(pd, module):
+    """
+    Analyse the transition functions of `module`
+    :param pd: ProcessDescription
+    :param module: python module
+    :return: dict of function name -> result of check_function_node(),
+        empty if the source of the module is not available
+    """
+    try:
+        tree = ast.parse(inspect.getsource(module))
+    except (OSError, TypeError, SyntaxError):
+        return dict()
+
+    transitions = {t.function_name: t for t in pd.transitions()}
+    ret = dict()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in transitions:
+            ret[node.name] = check_function_node(node, transitions[node.name].change_matcher)
+    return ret
+
+
+def check_function_node(node, matcher):
+    """
+    Analyse one transition function
+    :param node: ast.FunctionDef or ast.AsyncFunctionDef
+    :param matcher: ChangeMatcher of the declared changes
+    :return: dict with
+        "writes": list of str, the written paths, ending with '.*' if the exact path is unknown
+        "violations": list of str, written paths that are not allowed by `matcher`
+        "unknown": list of str, descriptions of the uses that could not be followed
+        "clean": bool, True if there are no violations and no unknown uses
+    """
+    analysis = _Analysis(node)
+    writes, violations, unknown = [], [], list(analysis.unknown)
+    for path, wildcard in analysis.writes:
+        key = ".".join(path + ("*", ) if wildcard else path)
+        if key not in writes:
+            writes.append(key)
+        if path and matcher.match_sequence(path):
+            continue
+        if path and not matcher.may_change(path):
+            if key not in violations:
+                violations.append(key)
+        elif "writes to '%s'" % key not in unknown:
+            unknown.append("writes to '%s'" % key)
+
+    return {
+        "writes": writes,
+        "violations": violations,
+        "unknown": unknown,
+        "clean": not violations and not unknown,
+    }
+
+
+class _Analysis:
+
+    def __init__(self, node):
+        self.writes = []
+        self.unknown = []
+        args = node.args.posonlyargs + node.args.args
+        if not args:
+            self.unknown.append("no context parameter")
+            return
+        if node.args.vararg or node.args.kwarg:
+            self.unknown.append("takes *args or **kwargs")
+            return
+        if node.decorator_list:
+            self.unknown.append("decorated function")
+            return
+
+        self.parents = dict()
+        for parent in ast.walk(node):
+            for child in ast.iter_child_nodes(parent):
+                self.parents[child] = parent
+
+        # local name -> path in the context
+        self.roots = {args[0].arg: ()}
+        self.alias_targets = set()
+        self._find_aliases(node)
+
+        # in source order
+        for sub_node in sorted(self.parents, key=lambda n: (getattr(n, "lineno", 0), getattr(n, "col_offset", 0))):
+            if (isinstance(sub_node, ast.Name) and sub_node.id in self.roots
+                    and sub_node not in self.alias_targets):
+                self._follow(sub_node)
+            elif (isinstance(sub_node, ast.Call) and isinstance(sub_node.func, ast.Name)
+                    and sub_node.func.id in UNSAFE_BUILTINS):
+                self.unknown.append("calls %s()" % sub_node.func.id)
+
+    def _find_aliases(self, node):
+        """
+        Names that are assigned once, from a path of the context, like `order = context.order`.
+        global and nonlocal names outlive the call, assigning the context to them is an unknown use
+        """
+        stores = dict()
+        shared = set()
+        for sub_node in ast.walk(node):
+            if isinstance(sub_node, ast.Name) and not isinstance(sub_node.ctx, ast.Load):
+                stores[sub_node.id] = stores.get(sub_node.id, 0) + 1
+            elif isinstance(sub_node, (ast.Global, ast.Nonlocal)):
+                shared.update(sub_node.names)
+
+        for sub_node in ast.walk(node):
+            if (isinstance(sub_node, ast.Assign) and len(sub_node.targets) == 1
+                    and isinstance(sub_node.targets[0], ast.Name)
+                    and stores.get(sub_node.targets[0].id) == 1
+                    and sub_node.targets[0].id not in shared):
+                path = self._static_path(sub_node.value)
+                if path is not None:
+                    self.roots[sub_node.targets[0].id] = path
+                    self.alias_targets.add(sub_node.targets[0])
+
+    def _static_path(self, node):
+        """
+        :return: tuple of str if node is a plain path below a root, else None
+        """
+        keys = []
+        while True:
+            if isinstance(node, ast.Attribute):
+                keys.append(node.attr)
+                node = node.value
+            elif isinstance(node, ast.Subscript) and _constant_key(node.slice) is not None:
+                keys.append(_constant_key(node.slice))
+                node = node.value
+            elif isinstance(node, ast.Name) and node.id in self.roots and isinstance(node.ctx, ast.Load):
+                return self.roots[node.id] + tuple(reversed(keys))
+            else:
+                return None
+
+    def _follow(self, node):
+        """
+        Follow a use of a root name up the expression tree and classify it
+        """
+        if not isinstance(node.ctx, ast.Load):
+            self.unknown.append("rebinds '%s'" % node.id)
+            return
+
+        path = list(self.roots[node.id])
+        wildcard = False
+        while True:
+            parent = self.parents.get(node)
+
+            if isinstance(parent, ast.Attribute) and parent.value is node:
+                call = self.parents.get(parent)
+                if isinstance(call, ast.Call) and call.func is parent:
+                    if parent.attr in MUTATING_METHODS:
+                        self.writes.append((tuple(path), True))
+                        return
+                    if parent.attr not in READING_METHODS:
+                        self.unknown.append("calls '%s.%s()'" % (_join(path, wildcard), parent.attr))
+                        return
+                    # the result lives somewhere below the object
+                    wildcard = True
+                    node = call
+                    continue
+                if not wildcard:
+                    path.append(parent.attr)
+                node = parent
+
+            elif isinstance(parent, ast.Subscript) and parent.value is node:
+                key = _constant_key(parent.slice)
+                if key is None:
+                    wildcard = True
+                elif not wildcard:
+                    path.append(key)
+                node = parent
+
+            elif (isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id == "getattr"
+                    and parent.args and parent.args[0] is node):
+                key = _constant_key(parent.args[1]) if len(parent.args) > 1 else None
+                if key is None:
+                    wildcard = True
+                elif not wildcard:
+                    path.append(key)
+                node = parent
+
+            else:
+                break
+
+        ctx = getattr(node, "ctx", None)
+        if isinstance(ctx, (ast.Store, ast.Del)):
+            self.writes.append((tuple(path), wildcard))
+            return
+
+        if not self._is_safe_use(node, self.parents.get(node)):
+            self.unknown.append("'%s' is used as a value" % _join(path, wildcard))
+
+    def _is_safe_use(self, node, parent):
+        """
+        True if the value of `node` is only read and can not be modified through the use
+        """
+        if isinstance(parent, (ast.Compare, ast.BinOp, ast.UnaryOp, ast.FormattedValue, ast.Expr)):
+            return True
+        if isinstance(parent, (ast.If, ast.While, ast.IfExp, ast.Assert)) and parent.test is node:
+            return True
+        if isinstance(parent, (ast.BoolOp, ast.IfExp)):
+            # the result is the operand itself, e.g. `context.order or None`
+            return self._is_safe_use(parent, self.parents.get(parent))
+        if isinstance(parent, ast.Subscript) and parent.slice is node:
+            return True
+        if isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id in SAFE_BUILTINS:
+            return True
+        if isinstance(parent, ast.keyword):
+            call = self.parents.get(parent)
+            return (isinstance(call, ast.Call) and isinstance(call.func, ast.Name)
+                    and call.func.id in SAFE_BUILTINS)
+        if isinstance(parent, ast.Assign) and parent.value is node:
+            # the alias is followed itself
+            targets = parent.targets
+            return len(targets) == 1 and isinstance(targets[0], ast.Name) and targets[0].id in self.roots
+        return False
+
+
+def _constant_key(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, int)) and not isinstance(node.value, bool):
+        return str(node.value)
+    return None
+
+
+def _join(path, wildcard):
+    return ".".join(list(path) + (["*"] if wildcard else [])) or "context"
@@ -0,0 +1,89 @@
+import os
+import pickle
+import struct
+
+from .JobStore import JobStore, JournalEntry
+
+
+class FileJournalStore(JobStore):
+    """
+    JobStore writing to a single append-only journal file.
+    Each record is a 4 byte length followed by the pickled (seq, kind, context_id, data).
+    An index of the record offsets per context is kept in memory,
+    so the file must only be written by one store at a time.
+    """
+    _HEADER = struct.Struct(">I")
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(**kwargs)
+        self.filename = filename
+        # context_id -> list of offsets of the records since the latest checkpoint
+        self._index = dict()
+        self._scan()
+        self._fp = open(self.filename, "ab")
+
+    def context_ids(self):
+        with self._lock:
+            self.commit()
+            return list(self._index)
+
+    def _scan(self):
+        """
+        Build the index from an existing journal.
+        A partly written record at the end (e.g. after a crash) is cut off.
+        """
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, "r+b") as fp:
+            offset = 0
+            while True:
+                record = self._read_record(fp)
+                if record is None:
+                    break
+                seq, kind, context_id, data = record
+                self._add_to_index(offset, kind, context_id)
+                self._seq = max(self._seq, seq)
+                offset = fp.tell()
+            fp.truncate(offset)
+
+    def _read_record(self, fp):
+        header = fp.read(self._HEADER.size)
+        if len(header) < self._HEADER.size:
+            return None
+        length, = self._HEADER.unpack(header)
+        data = fp.read(length)
+        if len(data) < length:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def _add_to_index(self, offset, kind, context_id):
+        if kind == JournalEntry.CHECKPOINT:
+            self._index[context_id] = [offset]
+        else:
+            self._index.setdefault(context_id, []).append(offset)
+
+    def _write(self, entries):
+        offset = self._fp.tell()
+        for entry in entries:
+            record = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+            self._fp.write(self._HEADER.pack(len(record)))
+            self._fp.write(record)
+            self._add_to_index(offset, entry[1], entry[2])
+            offset += self._HEADER.size + len(record)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    def _load(self, context_id):
+        ret = []
+        with open(self.filename, "rb") as fp:
+            for offset in self._index.get(context_id, []):
+                fp.seek(offset)
+                seq, kind, context_id, data = self._read_record(fp)
+                ret.append((seq, kind, data))
+        return ret
+
+    def _close(self):
+        self._fp.close()
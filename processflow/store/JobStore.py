@@ -0,0 +1,178 @@
+import pickle
+import threading
+import time
+
+
+class JournalEntry(object):
+    """
+    One entry of the journal of a JobStore
+    """
+    CHECKPOINT = "checkpoint"
+    STEP = "step"
+    FINISHED = "finished"
+
+    __slots__ = ("seq", "kind", "context_id", "data")
+
+    def __init__(self, seq, kind, context_id, data):
+        """
+        :param seq: int, position in the journal
+        :param kind: str, one of CHECKPOINT, STEP, FINISHED
+        :param context_id: str, the id of the ProcessRunnerContext
+        :param data: dict,
+            for CHECKPOINT: "state" and "objects", the context values
+            for STEP: "state_from", "state_to" and "changes", the allowed changes as gotten from get_difference()
+        """
+        self.seq = seq
+        self.kind = kind
+        self.context_id = context_id
+        self.data = data
+
+    def __repr__(self):
+        return "JournalEntry(%s, %s, %s)" % (self.seq, self.kind, self.context_id)
+
+
+class JobStore(object):
+    """
+    Base class of the persistent stores for ProcessRunnerContexts.
+
+    Every completed step is appended to a journal. Entries are buffered and written
+    together (group commit) once `commit_every` entries are pending or `commit_interval`
+    seconds have passed since the last commit, so not every step pays for a disk sync.
+    A background thread commits the entries that are pending longer than `commit_interval`
+    when no further entry is appended, it is stopped by close().
+    Entries that are not committed are lost on a crash.
+
+    Subclasses implement _write(), _load(), context_ids() and _close()
+    """
+    def __init__(self, commit_every=100, commit_interval=1.):
+        """
+        :param commit_every: int, number of pending entries that are committed together
+        :param commit_interval: number or None, max seconds that entries stay pending,
+            None to only commit by `commit_every`, commit() and close()
+        """
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._lock = threading.RLock()
+        self._pending = []
+        self._last_commit = time.monotonic()
+        self._seq = 0
+        # commits for commit_interval, started with the first entry
+        self._flush_thread = None
+        self._flush_condition = threading.Condition(self._lock)
+        self._closed = False
+
+    def checkpoint(self, context_id, state_name, objects):
+        """
+        Store the complete state of a context
+        :param objects: dict, the values of the context, must be picklable
+        """
+        self._append(JournalEntry.CHECKPOINT, context_id, {"state": state_name, "objects": objects})
+
+    def record_step(self, context_id, state_from, state_to, changes):
+        """
+        Store a completed step of a context
+        :param changes: dict, the changes of the transition, as gotten from get_difference()
+        """
+        self._append(JournalEntry.STEP, context_id, {
+            "state_from": state_from, "state_to": state_to, "changes": changes,
+        })
+
+    def record_finished(self, context_id):
+        self._append(JournalEntry.FINISHED, context_id, {})
+
+    def _append(self, kind, context_id, data):
+        # pickle now, the objects might change until the commit
+        data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._seq += 1
+            self._pending.append((self._seq, kind, context_id, data))
+            if len(self._pending) >= self.commit_every or (
+                    self.commit_interval is not None
+                    and time.monotonic() - self._last_commit >= self.commit_interval):
+                self.commit()
+            elif len(self._pending) == 1 and self.commit_interval is not None:
+                if self._flush_thread is None:
+                    self._flush_thread = threading.Thread(
+                        target=self._flush_loop, name="JobStore-flush", daemon=True
+                    )
+                    self._flush_thread.start()
+                self._flush_condition.notify()
+
+    def _flush_loop(self):
+        """
+        Commit the pending entries once they are `commit_interval` seconds old
+        """
+        with self._lock:
+            while not self._closed:
+                timeout = None
+                if self._pending:
+                    timeout = self._last_commit + self.commit_interval - time.monotonic()
+                    if timeout <= 0:
+                        self.commit()
+                        continue
+                self._flush_condition.wait(timeout)
+
+    def commit(self):
+        """
+        Write all pending entries to the storage
+        """
+        with self._lock:
+            if self._pending:
+                self._write(self._pending)
+                self._pending = []
+            self._last_commit = time.monotonic()
+
+    def load(self, context_id):
+        """
+        Return the journal of a context, starting with its latest checkpoint
+        :param context_id: str
+        :return: list of JournalEntry, empty if the context is unknown
+        """
+        with self._lock:
+            self.commit()
+            return [
+                JournalEntry(seq, kind, context_id, pickle.loads(data))
+                for seq, kind, data in self._load(context_id)
+            ]
+
+    def close(self):
+        """
+        Commit the pending entries, stop the background commits and close the storage
+        """
+        with self._lock:
+            self._closed = True
+            self._flush_condition.notify()
+            self.commit()
+            self._close()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def context_ids(self):
+        """
+        :return: list of str, ids of all contexts in the store
+        """
+        raise NotImplementedError
+
+    def _write(self, entries):
+        """
+        Durably write the entries
+        :param entries: list of tuples (seq, kind, context_id, pickled data)
+        """
+        raise NotImplementedError
+
+    def _load(self, context_id):
+        """
+        :return: list of tuples (seq, kind, pickled data) of the context,
+            starting with the latest checkpoint
+        """
+        raise NotImplementedError
+
+    def _close(self):
+        pass
@@ -0,0 +1,50 @@
+import sqlite3
+
+from .JobStore import JobStore, JournalEntry
+
+
+class SqliteJobStore(JobStore):
+    """
+    JobStore writing the journal to a SQLite database.
+    Each group commit is one transaction. The sequence numbers are assigned by the database,
+    so several processes can share the same file.
+    """
+    def __init__(self, filename, **kwargs):
+        super().__init__(**kwargs)
+        self.filename = filename
+        self._connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY, context_id TEXT NOT NULL, kind TEXT NOT NULL, data BLOB NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS journal_context ON journal (context_id, kind, seq)"
+        )
+        self._connection.commit()
+        self._seq = self._connection.execute("SELECT max(seq) FROM journal").fetchone()[0] or 0
+
+    def context_ids(self):
+        with self._lock:
+            self.commit()
+            return [row[0] for row in self._connection.execute("SELECT DISTINCT context_id FROM journal")]
+
+    def _write(self, entries):
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO journal (kind, context_id, data) VALUES (?, ?, ?)",
+                (entry[1:] for entry in entries)
+            )
+
+    def _load(self, context_id):
+        row = self._connection.execute(
+            "SELECT max(seq) FROM journal WHERE context_id = ? AND kind = ?",
+            (context_id, JournalEntry.CHECKPOINT)
+        ).fetchone()
+        return list(self._connection.execute(
+            "SELECT seq, kind, data FROM journal WHERE context_id = ? AND seq >= ? ORDER BY seq",
+            (context_id, row[0] or 0)
+        ))
+
+    def _close(self):
+        self._connection.close()
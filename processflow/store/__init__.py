@@ -0,0 +1,3 @@
+from .JobStore import JobStore, JournalEntry
+from .FileJournalStore import FileJournalStore
+from .SqliteJobStore import SqliteJobStore
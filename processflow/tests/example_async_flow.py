@@ -0,0 +1,73 @@
+"""
+The example_flow with async functions, used by the async runner tests
+"""
+import asyncio
+
+TRANSITIONS = {'new': {'$in': ['order'], 'validated': {'$change': ['order.status'], '$doc': 'check the order'}, 'invalid': {'$change': ['order.status']}}, 'validated': {'done': {'$change': ['order.status', 'log'], '$name': 'finish'}}, 'invalid': {}, 'done': {}}
+
+
+
+# STATES #
+
+async def state_done(context):
+    """
+    inputs: 
+    """
+    pass
+
+
+async def state_invalid(context):
+    """
+    inputs: 
+    """
+    pass
+
+
+async def state_new(context):
+    """
+    inputs: order
+    """
+    await asyncio.sleep(0)
+    if not context.order.items:
+        return context.state.invalid
+    else:
+        return context.state.validated
+
+
+async def state_validated(context):
+    """
+    inputs: 
+    """
+    return context.state.done
+
+
+# TRANSITIONS #
+
+async def transition_finish(context):
+    """
+    inputs: 
+    changes: order.status, log
+    """
+    context.order.status = "done"
+    context.log.append("finished %s" % context.order.id)
+    if getattr(context.order, "express", False):
+        # not declared in changes
+        context.order.priority = 1
+
+
+async def transition_from_new_to_invalid(context):
+    """
+    inputs: order
+    changes: order.status
+    """
+    context.order.status = "invalid"
+
+
+async def transition_from_new_to_validated(context):
+    """
+    check the order
+    inputs: order
+    changes: order.status
+    """
+    await asyncio.sleep(0)
+    context.order.status = "validated"
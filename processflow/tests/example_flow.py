@@ -0,0 +1,70 @@
+"""
+Small order flow used by the runner tests
+"""
+
+TRANSITIONS = {'new': {'$in': ['order'], 'validated': {'$change': ['order.status'], '$doc': 'check the order'}, 'invalid': {'$change': ['order.status']}}, 'validated': {'done': {'$change': ['order.status', 'log'], '$name': 'finish'}}, 'invalid': {}, 'done': {}}
+
+
+
+# STATES #
+
+def state_done(context):
+    """
+    inputs: 
+    """
+    pass
+
+
+def state_invalid(context):
+    """
+    inputs: 
+    """
+    pass
+
+
+def state_new(context):
+    """
+    inputs: order
+    """
+    if not context.order.items:
+        return context.state.invalid
+    else:
+        return context.state.validated
+
+
+def state_validated(context):
+    """
+    inputs: 
+    """
+    return context.state.done
+
+
+# TRANSITIONS #
+
+def transition_finish(context):
+    """
+    inputs: 
+    changes: order.status, log
+    """
+    context.order.status = "done"
+    context.log.append("finished %s" % context.order.id)
+    if getattr(context.order, "express", False):
+        # not declared in changes
+        context.order.priority = 1
+
+
+def transition_from_new_to_invalid(context):
+    """
+    inputs: order
+    changes: order.status
+    """
+    context.order.status = "invalid"
+
+
+def transition_from_new_to_validated(context):
+    """
+    check the order
+    inputs: order
+    changes: order.status
+    """
+    context.order.status = "validated"
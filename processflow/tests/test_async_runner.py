@@ -0,0 +1,70 @@
+import asyncio
+import io
+import unittest
+
+from ..description import ProcessDescription
+from ..runner import ProcessRunner
+from . import example_flow
+
+
+class Order:
+    def __init__(self, id, items, express=False):
+        self.id = id
+        self.items = items
+        self.status = "new"
+        self.express = express
+
+
+class TestAsyncRunner(unittest.TestCase):
+
+    def test_run(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_async_flow")
+        order = Order(1, ["a"])
+        context = runner.create_async_context("new", order=order, log=[])
+        result = asyncio.run(context.run())
+        self.assertEqual(3, result.steps)
+        self.assertTrue(result.finished)
+        self.assertTrue(context.is_finished)
+        self.assertEqual("done", order.status)
+        self.assertEqual(["finished 1"], context.function_context.log)
+
+    def test_sync_functions(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        order = Order(1, ["a"])
+        asyncio.run(runner.create_async_context("new", order=order, log=[]).run())
+        self.assertEqual("done", order.status)
+
+    def test_invalid_changes(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_async_flow")
+        context = runner.create_async_context("new", order=Order(1, ["a"], express=True), log=[])
+        with self.assertRaises(RuntimeError):
+            asyncio.run(context.run())
+
+    def test_sync_context(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_async_flow")
+        context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+        with self.assertRaises(ValueError):
+            context.step()
+
+    def test_gather(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_async_flow")
+        kwargs = [
+            {"order": Order(i, ["a"] if i % 2 else [], express=i == 5), "log": []}
+            for i in range(20)
+        ]
+        results = asyncio.run(runner.gather("new", kwargs, concurrency=4))
+        self.assertEqual(list(range(20)), [r.index for r in results])
+        self.assertFalse(results[5].ok)
+        self.assertIsInstance(results[5].error, RuntimeError)
+        for r in results:
+            if r.index != 5:
+                self.assertTrue(r.ok)
+                self.assertEqual("done" if r.index % 2 else "invalid", r.kwargs["order"].status)
+
+    def test_render_async(self):
+        fp = io.StringIO()
+        ProcessDescription(example_flow.TRANSITIONS).render_code(fp, async_functions=True)
+        code = fp.getvalue()
+        self.assertIn("async def state_new(context):", code)
+        self.assertIn("async def transition_finish(context):", code)
+        self.assertNotIn("\ndef ", code)
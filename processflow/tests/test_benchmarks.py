@@ -0,0 +1,42 @@
+import unittest
+
+from ..description import ProcessDescription
+from ..runner import ProcessRunner
+from ..runner.object_compare import deep_copy, get_difference
+from ..benchmarks import generators
+from ..benchmarks.run import measure, compare
+
+
+class TestBenchmarkGenerators(unittest.TestCase):
+
+    def test_scripted_flow(self):
+        transitions = generators.make_transitions(50)
+        route = generators.make_route(transitions, 30)
+        runner = ProcessRunner.from_process_description(ProcessDescription(transitions))
+        self.assertEqual(50, len(runner.states()))
+        generators.install_scripted_functions(runner)
+
+        context = runner.create_context("s0", data=generators.make_data(), route=route, cursor=[0])
+        steps = 0
+        while not context.is_finished:
+            context.step()
+            steps += 1
+        self.assertEqual(31, steps)
+        self.assertEqual(route[-1], context.current_state.name)
+
+    def test_context(self):
+        tree = generators.make_context(3, 4)
+        A = {"context": deep_copy(tree)}
+        generators.modify_context(tree, 5)
+        diff = get_difference(A, {"context": deep_copy(tree)})
+        self.assertTrue(diff)
+        self.assertTrue(all(key.startswith("context.") for key in diff))
+
+    def test_measure(self):
+        result = measure(lambda: None, repeat=2, min_time=0.)
+        self.assertEqual(2, result["repeat"])
+        self.assertLessEqual(result["min"], result["median"])
+
+        old = {"results": [{"name": "a", "params": {"x": 1}, "min": 2.}]}
+        new = {"results": [{"name": "a", "params": {"x": 1}, "min": 1.}, {"name": "b", "params": {}, "min": 1.}]}
+        self.assertEqual([("a", {"x": 1}, 2., 1., .5)], compare(old, new))
@@ -0,0 +1,250 @@
+import unittest
+
+from ..runner import ProcessRunner
+from ..runner.object_compare import deep_copy, get_difference
+from ..runner.change_tracking import ChangeRecorder, wrap_context, unwrap
+
+
+class Thing:
+    def __init__(self, **kwargs):
+        for key in kwargs:
+            setattr(self, key, kwargs[key])
+
+    def rename(self, name):
+        self.name = name
+
+
+class Context:
+    def __init__(self, **kwargs):
+        for key in kwargs:
+            setattr(self, key, kwargs[key])
+
+
+def _create_context():
+    return Context(
+        value=1,
+        thing=Thing(name="a", sub=Thing(name="b"), tags={"x", "y"}),
+        items=[Thing(name="c"), Thing(name="d")],
+        mapping={"e": Thing(name="e"), "f": [1, 2]},
+    )
+
+
+class TestChangeRecorder(unittest.TestCase):
+
+    def _assert_same_difference(self, func):
+        """
+        Run func on a snapshotted and on a proxied context and compare the differences
+        """
+        context = _create_context()
+        pre = deep_copy(context)
+        func(context)
+        expected = get_difference(pre, deep_copy(context))
+
+        context = _create_context()
+        recorder = ChangeRecorder()
+        func(wrap_context(context, recorder, exclude=()))
+        self.assertEqual(expected, recorder.get_difference())
+        return recorder
+
+    def test_no_change(self):
+        def func(context):
+            context.value
+            context.thing.sub.name
+            context.mapping["e"]
+        recorder = self._assert_same_difference(func)
+        self.assertEqual([], recorder.paths)
+
+    def test_attributes(self):
+        def func(context):
+            context.value = 2
+            context.thing.sub.name = "B"
+            context.thing.new = "new"
+        recorder = self._assert_same_difference(func)
+        self.assertEqual({("value", ), ("thing", "sub", "name"), ("thing", "new")}, set(recorder.paths))
+
+    def test_unchanged_write(self):
+        def func(context):
+            context.value = 1
+        self._assert_same_difference(func)
+
+    def test_replace_object(self):
+        def func(context):
+            context.thing = Thing(name="a", sub=Thing(name="x"), tags={"x", "y"})
+        self._assert_same_difference(func)
+
+    def test_delete(self):
+        def func(context):
+            del context.thing.sub
+        self._assert_same_difference(func)
+
+    def test_list(self):
+        def func(context):
+            context.items.append(Thing(name="g"))
+        self._assert_same_difference(func)
+
+        def func(context):
+            context.items[0].name = "C"
+        self._assert_same_difference(func)
+
+        def func(context):
+            for item in context.items:
+                item.name = item.name.upper()
+        self._assert_same_difference(func)
+
+    def test_dict(self):
+        def func(context):
+            context.mapping["e"].name = "E"
+            context.mapping["f"].append(3)
+            context.mapping["g"] = 1
+        self._assert_same_difference(func)
+
+        def func(context):
+            context.mapping.pop("e")
+        self._assert_same_difference(func)
+
+        def func(context):
+            for value in context.mapping.values():
+                if isinstance(value, Thing):
+                    value.name = "x"
+        self._assert_same_difference(func)
+
+    def test_fallback(self):
+        def func(context):
+            context.thing.tags.add("z")
+        recorder = self._assert_same_difference(func)
+        self.assertEqual([("thing", "tags")], recorder.paths)
+
+        def func(context):
+            context.thing.sub.rename("renamed")
+        recorder = self._assert_same_difference(func)
+        self.assertEqual([("thing", "sub")], recorder.paths)
+
+    def test_proxy_transparency(self):
+        context = _create_context()
+        proxy = wrap_context(context, ChangeRecorder(), exclude=())
+        self.assertIsInstance(proxy.thing, Thing)
+        self.assertIsInstance(proxy.items, list)
+        self.assertIsInstance(proxy.mapping, dict)
+        self.assertEqual(2, len(proxy.items))
+        self.assertIn("e", proxy.mapping)
+        self.assertIs(context.thing, unwrap(proxy.thing))
+
+        proxy.other = proxy.thing
+        self.assertIs(context.thing, context.other)
+
+    def test_proxy_operators(self):
+        context = Context(numbers=[1, 2], mapping={"a": 1})
+        recorder = ChangeRecorder()
+        proxy = wrap_context(context, recorder, exclude=())
+        self.assertEqual([1, 2, 3], proxy.numbers + [3])
+        self.assertEqual([0, 1, 2], [0] + proxy.numbers)
+        self.assertEqual([1, 2, 1, 2], 2 * proxy.numbers)
+        self.assertEqual([[0], [1, 2]], sorted([proxy.numbers, [0]]))
+        self.assertTrue(proxy.numbers < [1, 3])
+        self.assertTrue(proxy.numbers >= [1, 2])
+        self.assertEqual([2, 1], list(reversed(proxy.numbers)))
+        self.assertEqual({"a": 1, "b": 2}, proxy.mapping | {"b": 2})
+        self.assertNotIn("b", context.mapping)
+
+        proxy.numbers += [3]
+        proxy.mapping |= {"b": 2}
+        self.assertEqual([1, 2, 3], context.numbers)
+        self.assertEqual({"a": 1, "b": 2}, context.mapping)
+        self.assertEqual({"numbers": [[1, 2], [1, 2, 3]], "mapping.b": [None, 2]}, recorder.get_difference())
+
+    def test_mutators_store_originals(self):
+        context = _create_context()
+        proxy = wrap_context(context, ChangeRecorder(), exclude=())
+        proxy.items.append(proxy.thing)
+        proxy.items.insert(0, proxy.thing)
+        proxy.items.extend([proxy.thing])
+        proxy.items.extend(proxy.items)
+        proxy.items += [proxy.thing]
+        proxy.items[0:1] = [proxy.thing]
+        proxy.mapping.update({"a": proxy.thing}, b=proxy.thing)
+        proxy.mapping.update([("c", proxy.thing)])
+        proxy.mapping.setdefault("d", proxy.thing)
+        proxy.mapping |= {"g": proxy.thing}
+        self.assertEqual({Thing}, set(type(item) for item in context.items))
+        self.assertEqual({Thing, list}, set(type(value) for value in context.mapping.values()))
+
+    def test_object_protocols(self):
+        class Bag(Thing):
+            def __len__(self):
+                return len(self.values)
+
+            def __iter__(self):
+                return iter(self.values)
+
+            def __getitem__(self, index):
+                return self.values[index]
+
+            def __setitem__(self, index, value):
+                self.values[index] = value
+
+        context = Context(bag=Bag(values=[1, 2]), thing=Thing(name="a"))
+        recorder = ChangeRecorder()
+        proxy = wrap_context(context, recorder, exclude=())
+        self.assertEqual(2, len(proxy.bag))
+        self.assertEqual([1, 2], list(proxy.bag))
+        self.assertIn(2, proxy.bag)
+        self.assertEqual(2, proxy.bag[1])
+        proxy.bag[0] = proxy.thing
+        self.assertIs(context.thing, context.bag.values[0])
+        self.assertEqual(["bag.values"], list(recorder.get_difference()))
+        with self.assertRaises(TypeError):
+            len(proxy.thing)
+
+
+class Order:
+    def __init__(self, id, items, express=False):
+        self.id = id
+        self.items = items
+        self.status = "new"
+        self.express = express
+
+
+class TestRunnerChangeTracking(unittest.TestCase):
+
+    def _run(self, runner, order):
+        context = runner.create_context("new", order=order, log=[])
+        while not context.is_finished:
+            context.step()
+        return context
+
+    def test_modes_agree(self):
+        for mode in (ProcessRunner.TRACK_SNAPSHOT, ProcessRunner.TRACK_PROXY):
+            runner = ProcessRunner.from_python("processflow.tests.example_flow")
+            runner.set_change_tracking(mode)
+
+            order = Order(1, ["a"])
+            self._run(runner, order)
+            self.assertEqual("done", order.status)
+
+            order = Order(2, [])
+            self._run(runner, order)
+            self.assertEqual("invalid", order.status)
+
+            with self.assertRaises(RuntimeError):
+                self._run(runner, Order(3, ["a"], express=True))
+
+    def test_recorder_closed_on_error(self):
+        leaked = []
+
+        def transition(context):
+            leaked.append(context.order)
+            raise KeyError("failed")
+
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        runner.set_change_tracking(ProcessRunner.TRACK_PROXY)
+        runner._transition_functions[("new", "validated")] = transition
+        context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+        with self.assertRaises(KeyError):
+            context.step()
+        leaked[0].status = "changed"
+        self.assertEqual([], object.__getattribute__(leaked[0], "_pf_recorder").paths)
+
+    def test_invalid_mode(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        with self.assertRaises(ValueError):
+            runner.set_change_tracking("nope")
@@ -0,0 +1,134 @@
+import copy
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ..description import ProcessDescription
+from ..runner import ProcessRunner
+
+
+TRANSITIONS = {
+    "new": {"validated": {"$change": ["order.status"]}, "invalid": {"$change": ["order.status"]}},
+    "validated": {"done": {"$change": ["order.status"]}},
+    "invalid": {},
+    "done": {},
+}
+
+
+class TestCodeRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "flow_update.py")
+        sys.path.insert(0, self.path)
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        shutil.rmtree(self.path)
+        sys.modules.pop("flow_update", None)
+
+    def _read(self):
+        with open(self.filename) as fp:
+            return fp.read()
+
+    def _render(self, transitions, async_functions=False):
+        fp = io.StringIO()
+        ProcessDescription(copy.deepcopy(transitions)).render_code(fp, async_functions=async_functions)
+        return fp.getvalue()
+
+    def test_unchanged(self):
+        report = ProcessDescription(copy.deepcopy(TRANSITIONS)).update_code(self.filename)
+        self.assertEqual(7, len(report["added"]))
+        self.assertEqual(self._render(TRANSITIONS), self._read())
+
+        report = ProcessDescription(copy.deepcopy(TRANSITIONS)).update_code(self.filename)
+        self.assertEqual({"added": [], "updated": [], "removed": [], "commented": []}, report)
+        self.assertEqual(self._render(TRANSITIONS), self._read())
+
+        # the same as rendering it again, without user code
+        transitions = copy.deepcopy(TRANSITIONS)
+        transitions["validated"]["shipped"] = {"$change": ["order.status"], "$doc": "ship it"}
+        transitions["done"] = {"$doc": "all done"}
+        del transitions["new"]["invalid"]
+        del transitions["invalid"]
+        ProcessDescription(copy.deepcopy(transitions)).update_code(self.filename)
+        self.assertEqual(self._render(transitions), self._read())
+
+        ProcessDescription(copy.deepcopy(transitions)).update_code(self.filename, async_functions=True)
+        self.assertEqual(self._render(transitions, async_functions=True), self._read())
+
+    def test_user_code(self):
+        ProcessDescription(copy.deepcopy(TRANSITIONS)).update_code(self.filename)
+        code = self._read()
+        code = code.replace(
+            'def transition_from_new_to_validated(context):\n    """\n    inputs: \n    changes: order.status\n    """\n    pass',
+            'def transition_from_new_to_validated(context):\n    """\n    inputs: \n    changes: order.status\n    """\n'
+            '    context.order.status = """\nvalidated"""',
+        ).replace(
+            'def transition_from_new_to_invalid(context):\n    """\n    inputs: \n    changes: order.status\n    """\n    pass',
+            'def transition_from_new_to_invalid(context):\n    """\n    inputs: \n    changes: order.status\n    """\n'
+            '    context.order.status = "invalid"',
+        )
+        code = "import os\n" + code + "\n\ndef helper():\n    return 1\n"
+        with open(self.filename, "w") as fp:
+            fp.write(code)
+
+        transitions = copy.deepcopy(TRANSITIONS)
+        transitions["new"]["validated"]["$doc"] = "check the order"
+        transitions["new"]["cancelled"] = {"$change": ["order.status"]}
+        transitions["cancelled"] = {}
+        del transitions["new"]["invalid"]
+        del transitions["invalid"]
+        report = ProcessDescription(copy.deepcopy(transitions)).update_code(self.filename)
+
+        self.assertEqual(["state_cancelled", "transition_from_new_to_cancelled"], report["added"])
+        self.assertEqual(["state_new", "transition_from_new_to_validated"], report["updated"])
+        self.assertEqual(["state_invalid"], report["removed"])
+        self.assertEqual(["transition_from_new_to_invalid"], report["commented"])
+
+        code = self._read()
+        self.assertTrue(code.startswith("import os\n"))
+        self.assertIn(
+            'def transition_from_new_to_validated(context):\n    """\n    check the order\n'
+            '    inputs: \n    changes: order.status\n    """\n    context.order.status = """\nvalidated"""\n',
+            code
+        )
+        self.assertIn(
+            "# removed from the process description:\n# def transition_from_new_to_invalid(context):\n", code
+        )
+        self.assertIn("#     context.order.status = \"invalid\"\n", code)
+        self.assertNotIn("def state_invalid", code)
+        self.assertIn("def helper():\n    return 1\n", code)
+        self.assertLess(code.index("def state_cancelled"), code.index("def state_done"))
+        self.assertLess(code.index("def transition_from_new_to_cancelled"),
+                        code.index("def transition_from_new_to_validated"))
+
+        importlib.invalidate_caches()
+        runner = ProcessRunner.from_python("flow_update", validation=ProcessRunner.VALIDATE_STRICT)
+        self.assertEqual(["cancelled", "validated"], sorted(runner.process_description.get_state("new").outputs))
+
+    def test_decorated_stub(self):
+        ProcessDescription(copy.deepcopy(TRANSITIONS)).update_code(self.filename)
+        code = self._read()
+        for name in ("transition_from_new_to_validated", "transition_from_new_to_invalid"):
+            code = code.replace("def %s(" % name, "@deco(\n    1)\ndef %s(" % name)
+        with open(self.filename, "w") as fp:
+            fp.write(code)
+
+        transitions = copy.deepcopy(TRANSITIONS)
+        transitions["new"]["validated"]["$doc"] = "check the order"
+        del transitions["new"]["invalid"]
+        del transitions["invalid"]
+        report = ProcessDescription(copy.deepcopy(transitions)).update_code(self.filename)
+
+        self.assertEqual(["state_new", "transition_from_new_to_validated"], report["updated"])
+        self.assertEqual(["transition_from_new_to_invalid"], report["commented"])
+        code = self._read()
+        self.assertIn(
+            '@deco(\n    1)\ndef transition_from_new_to_validated(context):\n    """\n    check the order\n', code
+        )
+        self.assertIn("# @deco(\n#     1)\n# def transition_from_new_to_invalid(context):\n", code)
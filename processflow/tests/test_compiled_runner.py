@@ -0,0 +1,151 @@
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ..description import ProcessDescription, ChangeMatcher
+from ..renderer import RunnerRenderer
+from ..runner import ProcessRunner, ValidationPolicy
+from . import example_flow
+
+
+class Order:
+    def __init__(self, id, items):
+        self.id = id
+        self.items = items
+        self.status = "new"
+
+
+class TestCompiledRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        sys.path.insert(0, self.path)
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        shutil.rmtree(self.path)
+        for name in ("flow_compiled", "flow_compiled_outdated"):
+            sys.modules.pop(name, None)
+
+    def _render(self, name, transitions):
+        ProcessDescription(transitions).render_runner(os.path.join(self.path, "%s.py" % name))
+        importlib.invalidate_caches()
+        return name
+
+    def _runner(self):
+        return ProcessRunner.from_python("processflow.tests.example_flow", validation=ProcessRunner.VALIDATE_OFF)
+
+    def test_run(self):
+        runner = self._runner()
+        self.assertTrue(runner.load_compiled(self._render("flow_compiled", example_flow.TRANSITIONS)))
+
+        for items, state in ((["a"], "done"), ([], "invalid")):
+            context = runner.create_context("new", order=Order(1, items), log=[])
+            self.assertIs(runner._get_compiled_steps()["new"], context._compiled_step)
+            result = context.run()
+            self.assertTrue(result.finished)
+            self.assertEqual(state, context.current_state.name)
+            self.assertEqual(state, context.function_context.order.status)
+
+        # undeclared changes are still found
+        order = Order(2, ["a"])
+        order.express = True
+        context = runner.create_context("new", order=order, log=[])
+        with self.assertRaises(RuntimeError):
+            context.run()
+
+        # states that are not handled by the compiled step
+        runner._state_functions["validated"] = lambda context: "done"
+        runner._compiled_steps = None
+        context = runner.create_context("new", order=Order(3, ["a"]), log=[])
+        context.step()
+        with self.assertRaises(ValueError):
+            context.step()
+
+    def test_tracking(self):
+        runner = self._runner()
+        runner.load_compiled(self._render("flow_compiled", example_flow.TRANSITIONS))
+        runner.set_trust_static_check(True)
+        validate = runner.get_transition("new", "validated")
+        validate_func = runner.get_transition_function("new", "validated")
+        finish = runner.get_transition("validated", "done")
+        finish_func = runner.get_transition_function("validated", "done")
+
+        for mode in (ProcessRunner.TRACK_SNAPSHOT, ProcessRunner.TRACK_PROXY):
+            runner.set_change_tracking(mode)
+            order = Order(2, ["a"])
+            order.express = True
+            context = runner.create_context("new", order=order, log=[])
+            context.step()
+            self.assertEqual("validated", order.status)
+            with self.assertRaises(RuntimeError):
+                context.step()
+            self.assertEqual("clean", runner._compiled_tracking(validate, validate_func))
+            self.assertEqual(mode, runner._compiled_tracking(finish, finish_func))
+
+        # a context does not keep the step functions bound with other settings
+        order = Order(3, ["a"])
+        order.express = True
+        context = runner.create_context("new", order=order, log=[])
+        runner.set_change_validation(ValidationPolicy.NEVER)
+        self.assertIsNone(runner._compiled_tracking(finish, finish_func))
+        context.run()
+        self.assertEqual(1, order.priority)
+        self.assertIs(runner._compiled_steps, context._compiled_steps)
+
+    def test_from_python(self):
+        runner = ProcessRunner.from_python(
+            "processflow.tests.example_flow", validation=ProcessRunner.VALIDATE_OFF, compiled=True,
+        )
+        self.assertIsNone(runner.compiled_module)
+
+        name = self._render("flow_compiled", example_flow.TRANSITIONS)
+        runner = ProcessRunner.from_python(
+            "processflow.tests.example_flow", validation=ProcessRunner.VALIDATE_OFF, compiled=name,
+        )
+        self.assertEqual(name, runner.compiled_module.__name__)
+
+    def test_outdated(self):
+        transitions = {"new": {"validated": {"$change": ["order"]}}, "validated": {}}
+        name = self._render("flow_compiled_outdated", transitions)
+        with self.assertRaises(ValueError):
+            self._runner().load_compiled(name)
+
+    def test_checks(self):
+        changes = ["a", "b.c", "d.*", "e.*.f", "*.g.h"]
+        keys = ["a", "a.x", "ab", "b", "b.c", "b.c.d", "b.d", "d", "d.x", "e.x", "e.x.f", "e.x.f.y",
+                "e.x.g", "x.g.h", "x.g", "y"]
+        fp = io.StringIO()
+        RunnerRenderer(ProcessDescription({"a": {"b": {"$change": changes}}, "b": {}})).render(fp)
+        namespace = dict()
+        exec(fp.getvalue(), namespace)
+
+        diff = {key: (1, 2) for key in keys}
+        self.assertEqual(
+            ChangeMatcher(changes).subtract(diff),
+            namespace["CHECKS"][("a", "b")].subtract(diff),
+        )
+
+    def test_ambiguous_names(self):
+        transitions = {
+            "a": {"b__c": {"$change": ["x"]}},
+            "a__b": {"c": {"$change": ["y"]}},
+            "b__c": {},
+            "c": {},
+        }
+        fp = io.StringIO()
+        RunnerRenderer(ProcessDescription(transitions)).render(fp)
+        source = fp.getvalue()
+        self.assertEqual(2, source.count("def _subtract_"))
+        self.assertEqual(1, source.count("    T_0 = "))
+        self.assertEqual(1, source.count("    T_1 = "))
+        namespace = dict()
+        exec(source, namespace)
+
+        diff = {"x": (1, 2), "y": (1, 2)}
+        self.assertEqual({"y": (1, 2)}, namespace["CHECKS"][("a", "b__c")].subtract(diff))
+        self.assertEqual({"x": (1, 2)}, namespace["CHECKS"][("a__b", "c")].subtract(diff))
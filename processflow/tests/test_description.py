@@ -0,0 +1,141 @@
+import copy
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..description import ProcessDescription, DescriptionCache
+from ..runner import ProcessRunner
+
+
+TRANSITIONS = {
+    "$in": ["order"],
+    "new": {
+        "validated": {"$change": ["order.status"]},
+        "invalid": {"$change": ["order.status"], "$name": "reject"},
+    },
+    "validated": {
+        "done": {"$change": ["order.status"]},
+        "invalid": {"$change": ["order.status"]},
+    },
+    "invalid": {},
+    "done": {},
+}
+
+
+class TestProcessDescription(unittest.TestCase):
+
+    def test_adjacency(self):
+        pd = ProcessDescription(TRANSITIONS)
+        self.assertEqual(
+            ["reject", "new->validated"],
+            [t.name for t in pd.outgoing("new")]
+        )
+        self.assertEqual(
+            ["reject", "validated->invalid"],
+            [t.name for t in pd.incoming(pd.get_state("invalid"))]
+        )
+        self.assertEqual([], pd.outgoing("done"))
+        self.assertEqual([], pd.incoming("new"))
+        self.assertEqual(pd.outgoing("validated"), pd.get_state("validated").transitions)
+
+        self.assertIs(pd.get_transition("new", "invalid"), pd.transition_by_name("reject"))
+        self.assertIs(pd.get_transition("validated", "done"), pd.transition_by_name("validated->done"))
+        with self.assertRaises(KeyError):
+            pd.transition_by_name("new->invalid")
+        with self.assertRaises(KeyError):
+            pd.outgoing("unknown")
+
+    def test_global_options(self):
+        pd = ProcessDescription(TRANSITIONS)
+        for state in pd.states():
+            self.assertEqual(["order"], state.inputs)
+            self.assertNotIn("change", state.options)
+
+    def test_duplicate_name(self):
+        with self.assertRaises(ValueError):
+            ProcessDescription({
+                "a": {"b": {"$name": "x"}, "c": {"$name": "x"}},
+            })
+
+
+class TestDescriptionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def assertDescriptionEqual(self, pd1, pd2):
+        self.assertEqual([s.name for s in pd1.states()], [s.name for s in pd2.states()])
+        for s1 in pd1.states():
+            s2 = pd2.get_state(s1.name)
+            self.assertEqual(s1.inputs, s2.inputs)
+            self.assertEqual(s1.outputs, s2.outputs)
+            self.assertEqual([t.name for t in pd1.incoming(s1)], [t.name for t in pd2.incoming(s2)])
+        self.assertEqual([t.name for t in pd1.transitions()], [t.name for t in pd2.transitions()])
+        for t1 in pd1.transitions():
+            t2 = pd2.transition_by_name(t1.name)
+            self.assertIs(pd2, t2.pd)
+            self.assertEqual(t1.changes, t2.changes)
+            self.assertEqual(t1.inputs, t2.inputs)
+            self.assertEqual(t1.python_doc, t2.python_doc)
+            self.assertEqual(t1.change_matcher.valid_changes, t2.change_matcher.valid_changes)
+
+    def test_cache(self):
+        transitions = copy.deepcopy(TRANSITIONS)
+        cache = DescriptionCache(self.path)
+        pd = cache.get(transitions)
+        self.assertEqual(TRANSITIONS, transitions)
+        self.assertIs(transitions, pd.transition_dict)
+        self.assertEqual(1, len(os.listdir(self.path)))
+
+        cached = cache.get(transitions)
+        self.assertDescriptionEqual(ProcessDescription(copy.deepcopy(TRANSITIONS)), cached)
+        self.assertEqual(1, len(os.listdir(self.path)))
+        self.assertTrue(cached.get_transition("new", "validated").change_matcher.match("order.status"))
+
+        # other content, other file
+        transitions["done"] = {"new": {}}
+        cache.get(transitions)
+        self.assertEqual(2, len(os.listdir(self.path)))
+
+    def test_corrupt_file(self):
+        cache = DescriptionCache(self.path)
+        filename = cache.filename(cache.transitions_hash(TRANSITIONS))
+        with open(filename, "wb") as fp:
+            fp.write(b"nonsense")
+        self.assertDescriptionEqual(ProcessDescription(copy.deepcopy(TRANSITIONS)), cache.get(TRANSITIONS))
+        self.assertIsNotNone(cache.load(filename))
+
+    def test_runner(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow", description_cache=self.path)
+        runner = ProcessRunner.from_python("processflow.tests.example_flow", description_cache=self.path)
+        # by content and by module file
+        self.assertEqual(2, len(os.listdir(self.path)))
+        self.assertTrue(runner.get_state_function("new"))
+        self.assertTrue(runner.get_transition_function("validated", "done"))
+
+    def test_module(self):
+        module = importlib.import_module("processflow.tests.example_flow")
+        cache = DescriptionCache(self.path)
+        pd = cache.get(module.TRANSITIONS, module)
+        self.assertEqual(2, len(os.listdir(self.path)))
+
+        # an unchanged module file is not hashed, other TRANSITIONS are not even looked at
+        cached = cache.get(TRANSITIONS, module)
+        self.assertIs(TRANSITIONS, cached.transition_dict)
+        self.assertDescriptionEqual(pd, cached)
+        self.assertEqual(cache.transitions_hash(module.TRANSITIONS), cached.transitions_hash())
+
+        # a modified module file is hashed again
+        stat = os.stat(module.__file__)
+        try:
+            os.utime(module.__file__, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            cached = cache.get(module.TRANSITIONS, module)
+        finally:
+            os.utime(module.__file__, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertDescriptionEqual(pd, cached)
+        self.assertEqual(3, len(os.listdir(self.path)))
@@ -0,0 +1,66 @@
+import unittest
+
+from ..description import ProcessDescription
+from ..runner import ProcessRunner
+
+
+class Order:
+    def __init__(self, id, items):
+        self.id = id
+        self.items = items
+        self.status = "new"
+
+
+class TestDispatch(unittest.TestCase):
+
+    def test_records(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        runner.build_dispatch()
+
+        record = runner.get_dispatch("new")
+        self.assertIs(runner.get_state("new"), record.state)
+        self.assertIs(runner.get_state_function("new"), record.state_function)
+        transition, func = record.next[runner.get_state("validated")]
+        self.assertIs(runner.get_transition("new", "validated"), transition)
+        self.assertIs(runner.get_transition_function("new", "validated"), func)
+        self.assertEqual([], record.missing_functions())
+        self.assertEqual({}, dict(runner.get_dispatch("done").next))
+
+        with self.assertRaises(AttributeError):
+            record.state_function = None
+        with self.assertRaises(TypeError):
+            record.next[runner.get_state("done")] = None
+        with self.assertRaises(ValueError):
+            runner.get_dispatch("nope")
+
+    def test_missing_functions(self):
+        runner = ProcessRunner.from_process_description(ProcessDescription({"a": {"b": {}}}))
+        runner._state_functions["a"] = lambda context: context.state.b
+        with self.assertRaises(ValueError) as cm:
+            runner.build_dispatch()
+        self.assertIn("transition_from_a_to_b", str(cm.exception))
+        self.assertIn("state_b", str(cm.exception))
+        runner.build_dispatch(check=False)
+
+        context = runner.create_context("a")
+        with self.assertRaises(ValueError):
+            context.step()
+
+    def test_next_states(self):
+        other_pd = ProcessDescription({"a": {"b": {}}})
+        for next_state, error in (
+                (other_pd.get_state("b"), None),
+                ("b", ValueError),
+                ([], ValueError),
+                (other_pd.get_state("a"), ValueError),
+        ):
+            runner = ProcessRunner.from_process_description(ProcessDescription({"a": {"b": {}}}))
+            runner._state_functions["a"] = lambda context: next_state
+            runner._transition_functions[("a", "b")] = lambda context: None
+            context = runner.create_context("a")
+            if error:
+                with self.assertRaises(error):
+                    context.step()
+            else:
+                context.step()
+                self.assertEqual("b", context.current_state.name)
@@ -0,0 +1,130 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import warnings
+
+from ..description import ProcessDescription
+from ..runner import ProcessRunner
+from ..runner import function_validation
+
+
+TRANSITIONS = {"a": {"b": {"$change": ["x"]}}, "b": {}}
+
+MODULE_CODE = '''
+def state_a(context):
+    """
+    inputs: %s
+    """
+    return context.state.b
+
+
+def state_b(context):
+    """
+    inputs: 
+    """
+    pass
+
+
+def transition_from_a_to_b(context):
+    """
+    inputs: 
+    changes: x
+    """
+    context.x = 2
+'''
+
+
+class TestFunctionValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        sys.path.insert(0, self.path)
+        function_validation._results.clear()
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        shutil.rmtree(self.path)
+        for name in ("flow_valid", "flow_changed", "flow_unused", "flow_transitions"):
+            sys.modules.pop(name, None)
+        function_validation._results.clear()
+
+    def _module(self, name, code):
+        with open(os.path.join(self.path, "%s.py" % name), "w") as fp:
+            fp.write(code)
+        importlib.invalidate_caches()
+        return name
+
+    def _runner(self, mode=ProcessRunner.VALIDATE_WARN_ONCE, cache_dir=None, transitions=TRANSITIONS):
+        runner = ProcessRunner.from_process_description(ProcessDescription(transitions))
+        runner.set_validation(mode, cache_dir)
+        return runner
+
+    def test_valid(self):
+        module = self._module("flow_valid", MODULE_CODE % "")
+        runner = self._runner(ProcessRunner.VALIDATE_STRICT)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            runner.load_functions(module)
+
+        # functions are bound on first use
+        self.assertEqual({}, runner._state_functions)
+        context = runner.create_context("a", x=1)
+        while not context.is_finished:
+            context.step()
+        self.assertEqual(2, context.function_context.x)
+        self.assertEqual({"a", "b"}, set(runner._state_functions))
+        self.assertIsNone(runner.get_state_function("c"))
+
+    def test_changed_doc(self):
+        module = self._module("flow_changed", MODULE_CODE % "something")
+
+        with self.assertRaises(ValueError):
+            self._runner(ProcessRunner.VALIDATE_STRICT).load_functions(module)
+
+        function_validation._results.clear()
+        cache_dir = os.path.join(self.path, "cache")
+        with self.assertWarns(UserWarning):
+            self._runner(cache_dir=cache_dir).load_functions(module)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            self._runner(cache_dir=cache_dir).load_functions(module)
+            # other process, same file
+            function_validation._results.clear()
+            self._runner(cache_dir=cache_dir).load_functions(module)
+            self._runner(ProcessRunner.VALIDATE_OFF).load_functions(module)
+
+        # strict mode still fails on the cached result
+        with self.assertRaises(ValueError):
+            self._runner(ProcessRunner.VALIDATE_STRICT, cache_dir).load_functions(module)
+
+    def test_other_description(self):
+        module = self._module("flow_valid", MODULE_CODE % "")
+        self._runner(ProcessRunner.VALIDATE_STRICT).load_functions(module)
+
+        # the same module file does not reuse the result of another description
+        transitions = {"a": {"b": {"$change": ["y"]}}, "b": {}}
+        with self.assertRaises(ValueError):
+            self._runner(ProcessRunner.VALIDATE_STRICT, transitions=transitions).load_functions(module)
+        self.assertEqual(2, len(function_validation._results))
+
+        # the TRANSITIONS of the module are compared instead of hashing the description
+        module = self._module("flow_transitions", "TRANSITIONS = %r\n" % (TRANSITIONS, ) + MODULE_CODE % "")
+        runner = self._runner(ProcessRunner.VALIDATE_STRICT)
+        runner.load_functions(module)
+        self.assertIsNone(runner.process_description._transitions_hash)
+        with self.assertRaises(ValueError):
+            self._runner(ProcessRunner.VALIDATE_STRICT, transitions=transitions).load_functions(module)
+
+    def test_unused(self):
+        module = self._module("flow_unused", MODULE_CODE % "" + "\n\ndef state_c(context):\n    pass\n")
+        for mode in (ProcessRunner.VALIDATE_STRICT, ProcessRunner.VALIDATE_WARN_ONCE):
+            with self.assertRaises(ValueError):
+                self._runner(mode).load_functions(module)
+        self._runner(ProcessRunner.VALIDATE_OFF).load_functions(module)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            self._runner("nope")
@@ -0,0 +1,138 @@
+import concurrent.futures
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ..description import ProcessDescription
+from ..renderer import GraphvizRenderer
+
+
+TRANSITIONS = {
+    "order_new": {"order_validated": {}, "order_invalid": {}},
+    "order_validated": {"payment_pending": {"$doc": "request payment", "$change": ["payment"]}},
+    "order_invalid": {},
+    "payment_pending": {"payment_done": {}},
+    "payment_done": {},
+    "archive": {"archived": {}},
+    "archived": {},
+}
+
+# writes the format and the DOT source to stdout and counts its calls
+STUB_DOT = """#!%(python)s
+import sys
+with open(%(calls)r, "a") as fp:
+    fp.write("x")
+source = sys.stdin.read()
+if "fail" in source:
+    sys.stderr.write("syntax error")
+    sys.exit(1)
+sys.stdout.write("%%s:%%s" %% (sys.argv[1], source))
+"""
+
+
+class TestGraphvizRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.calls = os.path.join(self.path, "calls")
+        self.dot = os.path.join(self.path, "dot")
+        with open(self.dot, "w") as fp:
+            fp.write(STUB_DOT % {"python": sys.executable, "calls": self.calls})
+        os.chmod(self.dot, 0o755)
+        GraphvizRenderer.clear_cache()
+        self.pd = ProcessDescription(TRANSITIONS)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        GraphvizRenderer.clear_cache()
+
+    def _calls(self):
+        if not os.path.exists(self.calls):
+            return 0
+        with open(self.calls) as fp:
+            return len(fp.read())
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name), "rb") as fp:
+            return fp.read()
+
+    def test_run_graphviz(self):
+        renderer = GraphvizRenderer(self.pd)
+        filename = os.path.join(self.path, "graph.png")
+        renderer.run_graphviz(filename, "PNG", executable=self.dot)
+        self.assertEqual(("-Tpng:%s" % renderer.dot_source()).encode("utf-8"), self._read("graph.png"))
+        self.assertEqual(1, self._calls())
+
+        # cached in memory
+        renderer.run_graphviz(filename, "png", executable=self.dot)
+        self.assertEqual(1, self._calls())
+
+        # cached on disk
+        cache_dir = os.path.join(self.path, "cache")
+        renderer.run_graphviz(filename, "svg", executable=self.dot, cache_dir=cache_dir)
+        GraphvizRenderer.clear_cache()
+        renderer.run_graphviz(filename, "svg", executable=self.dot, cache_dir=cache_dir)
+        self.assertEqual(2, self._calls())
+        self.assertEqual(1, len(os.listdir(cache_dir)))
+
+        with self.assertRaises(RuntimeError) as cm:
+            GraphvizRenderer.run_dot("digraph { fail }", "png", executable=self.dot)
+        self.assertIn("syntax error", str(cm.exception))
+
+    def test_run_graphviz_many(self):
+        jobs = [
+            (GraphvizRenderer(self.pd), os.path.join(self.path, "a.png"), "png"),
+            (GraphvizRenderer(self.pd), os.path.join(self.path, "b.png"), "png"),
+            (GraphvizRenderer(self.pd, center="archive"), os.path.join(self.path, "c.png"), "png"),
+            (GraphvizRenderer(self.pd), os.path.join(self.path, "d.svg"), "svg"),
+        ]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            filenames = GraphvizRenderer.run_graphviz_many(jobs, executable=self.dot, executor=executor)
+        self.assertEqual([job[1] for job in jobs], filenames)
+        # the same graphs are rendered once
+        self.assertEqual(3, self._calls())
+        self.assertEqual(self._read("a.png"), self._read("b.png"))
+        self.assertTrue(self._read("c.png").startswith(b"-Tpng:"))
+
+        GraphvizRenderer.run_graphviz_many(jobs, executable=self.dot)
+        self.assertEqual(3, self._calls())
+
+    def test_render(self):
+        fp = io.StringIO()
+        self.pd.render_graphviz(fp, format="dot")
+        source = fp.getvalue()
+        self.assertNotIn("subgraph", source)
+        self.assertIn('\t"archive" -> "archived" [color=black]\n', source)
+
+        source = GraphvizRenderer(self.pd, cluster="prefix").dot_source()
+        self.assertIn('\t"archive" [', source)
+        self.assertIn('\tsubgraph "cluster_order" {\n\t\tlabel="order";\n\t\t"order_invalid" [', source)
+        self.assertIn('\tsubgraph "cluster_payment" {\n', source)
+
+        clusters = GraphvizRenderer(self.pd, cluster="component").get_clusters(
+            self.pd, set(s.name for s in self.pd.states())
+        )
+        self.assertEqual("archive", clusters["archived"])
+        self.assertEqual("order_invalid", clusters["payment_done"])
+
+        clusters = GraphvizRenderer(self.pd, cluster=lambda state: state.name[0]).get_clusters(
+            self.pd, {"archive", "archived", "order_new"}
+        )
+        # clusters of one state are left out
+        self.assertEqual({"archive": "a", "archived": "a"}, clusters)
+
+        renderer = GraphvizRenderer(self.pd, center="order_validated")
+        self.assertEqual({"order_new", "order_validated", "payment_pending"}, renderer.selected_states(self.pd))
+        source = renderer.dot_source()
+        self.assertIn('"order_validated" [color="0.31 0.2, .9", style=filled, shape=ellipse, penwidth=3]', source)
+        self.assertNotIn('"order_invalid"', source)
+        renderer.depth = 2
+        self.assertEqual(5, len(renderer.selected_states(self.pd)))
+
+        with self.assertRaises(ValueError):
+            GraphvizRenderer(self.pd, center="unknown")
+        with self.assertRaises(ValueError):
+            GraphvizRenderer(self.pd, cluster="name")
@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ..runner import ProcessRunner
+from ..store import FileJournalStore, SqliteJobStore, JournalEntry
+
+
+class Order:
+    def __init__(self, id, items):
+        self.id = id
+        self.items = items
+        self.status = "new"
+
+
+class TestJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _stores(self, **kwargs):
+        yield lambda: FileJournalStore(os.path.join(self.path, "journal"), **kwargs)
+        yield lambda: SqliteJobStore(os.path.join(self.path, "journal.sqlite3"), **kwargs)
+
+    def test_journal(self):
+        for create_store in self._stores():
+            with create_store() as store:
+                store.checkpoint("a", "new", {"x": 1})
+                store.record_step("a", "new", "validated", {"x": [1, 2]})
+                store.checkpoint("b", "new", {"x": 10})
+                store.checkpoint("a", "validated", {"x": 2})
+                store.record_finished("a")
+
+            with create_store() as store:
+                self.assertEqual({"a", "b"}, set(store.context_ids()))
+                entries = store.load("a")
+                self.assertEqual(
+                    [JournalEntry.CHECKPOINT, JournalEntry.FINISHED],
+                    [e.kind for e in entries]
+                )
+                self.assertEqual({"state": "validated", "objects": {"x": 2}}, entries[0].data)
+                self.assertEqual({"x": 10}, store.load("b")[0].data["objects"])
+                self.assertEqual([], store.load("c"))
+
+    def test_group_commit(self):
+        for create_store in self._stores(commit_every=3, commit_interval=1000):
+            with create_store() as store:
+                store.checkpoint("a", "new", {})
+                store.record_step("a", "new", "validated", {})
+                self.assertEqual(2, len(store._pending))
+                store.record_finished("a")
+                self.assertEqual(0, len(store._pending))
+
+    def test_commit_interval(self):
+        for create_store in self._stores(commit_every=100, commit_interval=0.01):
+            with create_store() as store:
+                store.checkpoint("a", "new", {"x": 1})
+                # committed in the background, without further entries
+                deadline = time.monotonic() + 10
+                while store._pending and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual([], store._pending)
+                with create_store() as other:
+                    self.assertEqual(["a"], list(other.context_ids()))
+            self.assertFalse(store._flush_thread)
+
+    def test_truncated_tail(self):
+        filename = os.path.join(self.path, "journal")
+        with FileJournalStore(filename) as store:
+            store.checkpoint("a", "new", {"x": 1})
+            store.record_step("a", "new", "validated", {"x": [1, 2]})
+        size = os.path.getsize(filename)
+        with open(filename, "r+b") as fp:
+            fp.truncate(size - 3)
+
+        with FileJournalStore(filename) as store:
+            self.assertEqual([JournalEntry.CHECKPOINT], [e.kind for e in store.load("a")])
+            store.record_finished("a")
+        with FileJournalStore(filename) as store:
+            self.assertEqual(
+                [JournalEntry.CHECKPOINT, JournalEntry.FINISHED],
+                [e.kind for e in store.load("a")]
+            )
+
+    def test_resume(self):
+        for checkpoint_every in (None, 1):
+            for create_store in self._stores():
+                runner = ProcessRunner.from_python("processflow.tests.example_flow")
+                runner.set_job_store(create_store(), checkpoint_every=checkpoint_every)
+                context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+                context.step()
+                runner.job_store.close()
+
+                runner = ProcessRunner.from_python("processflow.tests.example_flow")
+                runner.set_job_store(create_store())
+                resumed = runner.resume(context.context_id)
+                self.assertEqual("validated", resumed.current_state.name)
+                self.assertEqual("validated", resumed.function_context.order.status)
+
+                while not resumed.is_finished:
+                    resumed.step()
+                self.assertEqual(["finished 1"], resumed.function_context.log)
+                self.assertTrue(runner.resume(context.context_id).is_finished)
+                runner.job_store.close()
+                os.remove(runner.job_store.filename)
+
+    def test_resume_buffers(self):
+        def transition(context):
+            context.order.status[0] = 1
+
+        for create_store in self._stores():
+            # large buffers are only snapshotted as digests, the step is stored as checkpoint
+            for size in (10, 2 << 20):
+                runner = ProcessRunner.from_python("processflow.tests.example_flow")
+                runner.set_job_store(create_store())
+                runner._transition_functions[("new", "validated")] = transition
+                order = Order(1, ["a"])
+                order.status = bytearray(size)
+                context = runner.create_context("new", order=order, log=[])
+                context.step()
+                runner.job_store.close()
+
+                runner = ProcessRunner.from_python("processflow.tests.example_flow")
+                runner.set_job_store(create_store())
+                resumed = runner.resume(context.context_id)
+                self.assertEqual("validated", resumed.current_state.name)
+                self.assertIsInstance(resumed.function_context.order.status, bytearray)
+                self.assertEqual(size, len(resumed.function_context.order.status))
+                self.assertEqual(1, resumed.function_context.order.status[0])
+                runner.job_store.close()
+                os.remove(runner.job_store.filename)
+
+    def test_resume_unknown(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        with self.assertRaises(ValueError):
+            runner.resume("a")
+        runner.set_job_store(SqliteJobStore(":memory:"))
+        with self.assertRaises(KeyError):
+            runner.resume("a")
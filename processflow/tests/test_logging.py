@@ -0,0 +1,70 @@
+import logging
+import unittest
+
+from ..runner import ProcessRunner
+from ..runner.log import start_queue_logging, stop_queue_logging
+
+
+class Order:
+    def __init__(self, id, items):
+        self.id = id
+        self.items = items
+        self.status = "new"
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestLogging(unittest.TestCase):
+
+    def _run(self, runner):
+        context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+        while not context.is_finished:
+            context.step()
+        return context
+
+    def test_queue_logging(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        logger = logging.getLogger("processflow.tests.logging")
+        runner.set_logger(logger)
+
+        handler = ListHandler()
+        listener = start_queue_logging(handler, logger=logger)
+        try:
+            context = self._run(runner)
+        finally:
+            stop_queue_logging(listener)
+
+        records = handler.records
+        self.assertEqual(
+            [("new", "validated"), ("validated", "done"), ("done", None)],
+            [(r.state, r.next_state) for r in records if hasattr(r, "next_state")]
+        )
+        self.assertEqual(
+            ["new->validated", "finish"],
+            [r.transition for r in records if hasattr(r, "transition")]
+        )
+        for r in records:
+            self.assertEqual(context.context_id, r.context_id)
+            self.assertGreaterEqual(r.duration, 0.)
+            self.assertIn(context.context_id, r.getMessage())
+
+        # no more records after stopping
+        self._run(runner)
+        self.assertEqual(len(records), len(handler.records))
+
+    def test_disabled(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        logger = logging.getLogger("processflow.tests.logging.disabled")
+        logger.setLevel(logging.INFO)
+        handler = ListHandler()
+        logger.addHandler(handler)
+        runner.set_logger(logger)
+        self._run(runner)
+        self.assertEqual([], handler.records)
@@ -0,0 +1,112 @@
+import threading
+import unittest
+
+from ..runner import ProcessRunner
+from ..runner.metrics import RunnerMetrics, prometheus_text
+
+
+class Order:
+    def __init__(self, id, items):
+        self.id = id
+        self.items = items
+        self.status = "new"
+
+
+class TestMetrics(unittest.TestCase):
+
+    def _run(self, runner, order):
+        context = runner.create_context("new", order=order, log=[])
+        while not context.is_finished:
+            context.step()
+
+    def test_runner_metrics(self):
+        for mode in (ProcessRunner.TRACK_SNAPSHOT, ProcessRunner.TRACK_PROXY):
+            runner = ProcessRunner.from_python("processflow.tests.example_flow")
+            runner.set_change_tracking(mode)
+            with self.assertRaises(ValueError):
+                runner.metrics()
+
+            runner.set_metrics(True)
+            for i in range(3):
+                self._run(runner, Order(i, ["a"]))
+            self._run(runner, Order(4, []))
+
+            metrics = runner.metrics()
+            self.assertEqual({"new": 4, "validated": 3, "done": 3, "invalid": 1},
+                             {name: m["count"] for name, m in metrics["state"].items()})
+            self.assertEqual({"new->validated": 3, "finish": 3, "new->invalid": 1},
+                             {name: m["count"] for name, m in metrics["transition"].items()})
+            self.assertEqual(4, metrics["diff"]["new->validated"]["count"] + metrics["diff"]["new->invalid"]["count"])
+            if mode == ProcessRunner.TRACK_SNAPSHOT:
+                # before and after
+                self.assertEqual(6, metrics["snapshot"]["finish"]["count"])
+            else:
+                self.assertNotIn("snapshot", metrics)
+
+            m = metrics["state"]["new"]
+            self.assertLessEqual(m["min"], m["p50"])
+            self.assertLessEqual(m["p50"], m["p99"])
+            self.assertLessEqual(m["p99"], m["max"])
+
+    def test_registry(self):
+        runners, replaced = [], []
+        for i in range(2):
+            runner = ProcessRunner.from_python("processflow.tests.example_flow")
+            runners.append(runner)
+            runner.set_metrics(True, name="registry")
+            self._run(runner, Order(i, ["a"]))
+            replaced.append(runner._metrics)
+            # replaces the first one in the exposition
+            runner.set_metrics(True, name="registry")
+            self._run(runner, Order(i, ["a"]))
+
+        # the runners with the same name are added up
+        text = prometheus_text()
+        series = 'processflow_duration_seconds_count{runner="registry",kind="transition",name="finish"}'
+        self.assertIn("%s 2\n" % series, text)
+        self.assertEqual(1, text.count(series))
+
+        other = RunnerMetrics(name="registry", buckets=[1])
+        other.record(RunnerMetrics.STATE, "new", .5)
+        self.assertIn('processflow_duration_seconds_count{runner="registry-2",kind="state",name="new"} 1\n',
+                      prometheus_text())
+
+    def test_percentiles(self):
+        metrics = RunnerMetrics(buckets=[1, 2, 3, 4])
+        for value in (.5, 1.5, 1.5, 2.5, 3.5, 10.):
+            metrics.record(RunnerMetrics.STATE, "a", value)
+        m = metrics.summary(percentiles=(0, 50, 100))["state"]["a"]
+        self.assertEqual(6, m["count"])
+        self.assertEqual(19.5, m["sum"])
+        self.assertEqual(.5, m["p0"])
+        self.assertEqual(2., m["p50"])
+        self.assertEqual(10., m["p100"])
+
+    def test_threads(self):
+        metrics = RunnerMetrics()
+
+        def record():
+            for i in range(1000):
+                metrics.record(RunnerMetrics.TRANSITION, "t", 1e-5)
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(4000, metrics.summary()["transition"]["t"]["count"])
+
+    def test_prometheus(self):
+        metrics = RunnerMetrics(name="test", buckets=[.1, 1])
+        metrics.record(RunnerMetrics.STATE, "a", .5)
+        metrics.record(RunnerMetrics.STATE, "a", 2)
+        self.assertEqual(
+            "# HELP processflow_duration_seconds Wall time of the processflow runner functions\n"
+            "# TYPE processflow_duration_seconds histogram\n"
+            'processflow_duration_seconds_bucket{runner="test",kind="state",name="a",le="0.1"} 0\n'
+            'processflow_duration_seconds_bucket{runner="test",kind="state",name="a",le="1"} 1\n'
+            'processflow_duration_seconds_bucket{runner="test",kind="state",name="a",le="+Inf"} 2\n'
+            'processflow_duration_seconds_sum{runner="test",kind="state",name="a"} 2.5\n'
+            'processflow_duration_seconds_count{runner="test",kind="state",name="a"} 2\n',
+            prometheus_text([metrics])
+        )
@@ -1,6 +1,11 @@
 import unittest
 
-from ..runner.object_compare import deep_copy, get_difference, subtract_valid_changes
+from ..runner import object_compare
+from ..runner.object_compare import (
+    deep_copy, get_difference, iter_difference, subtract_valid_changes, Reference,
+    invalidate_type_cache, BufferSnapshot, BufferDifference, USE_NUMPY,
+)
+from ..description import ChangeMatcher
 
 
 class ClassWithAttributes:
@@ -90,6 +95,97 @@ class TestDeepCopy(unittest.TestCase):
             self.assertNotEqual(id(v), id(deep_copy(v)))
 
 
+class ClassWithClassAttributes:
+    kind = "thing"
+
+    def __init__(self, value):
+        self.value = value
+        self._private = 1
+
+    @property
+    def double(self):
+        return self.value * 2
+
+    @staticmethod
+    def static():
+        pass
+
+    def method(self):
+        pass
+
+
+class ClassWithSlots:
+    __slots__ = ("a", "b", "_c")
+
+    def __init__(self):
+        self.a = 1
+        self._c = 3
+
+
+class TestDeepCopySchema(unittest.TestCase):
+
+    def test_class_attributes(self):
+        o = ClassWithClassAttributes(3)
+        self.assertEqual({"kind": "thing", "value": 3, "double": 6}, deep_copy(o))
+        o.extra = [1]
+        o.kind = "other"
+        o.callback = lambda: None
+        self.assertEqual({"kind": "other", "value": 3, "double": 6, "extra": [1]}, deep_copy(o))
+
+    def test_slots(self):
+        self.assertEqual({"a": 1}, deep_copy(ClassWithSlots()))
+
+    def test_invalidate(self):
+        class Changing:
+            def __init__(self):
+                self.a = 1
+
+        self.assertEqual({"a": 1}, deep_copy(Changing()))
+        Changing.b = property(lambda self: 2)
+        invalidate_type_cache(Changing)
+        self.assertEqual({"a": 1, "b": 2}, deep_copy(Changing()))
+
+
+class TestDeepCopyGraphs(unittest.TestCase):
+
+    def test_shared(self):
+        shared = ClassWithAttributes(x=[1, 2])
+        o = ClassWithAttributes(a=shared, b=[shared, shared])
+        copy = deep_copy(o)
+        self.assertEqual({"x": [1, 2]}, copy["a"])
+        self.assertIs(copy["a"], copy["b"][0])
+        self.assertIs(copy["a"], copy["b"][1])
+
+    def test_cycle(self):
+        parent = ClassWithAttributes(name="parent")
+        parent.child = ClassWithAttributes(name="child", parent=parent)
+        copy = deep_copy(parent)
+        self.assertEqual(
+            {"name": "parent", "child": {"name": "child", "parent": Reference(())}},
+            copy,
+        )
+        l = [1]
+        l.append(l)
+        self.assertEqual([1, Reference(())], deep_copy(l))
+
+        parent.child.name = "changed"
+        self.assertEqual({"child.name": ["child", "changed"]}, get_difference(copy, deep_copy(parent)))
+
+    def test_deep(self):
+        root = node = ClassWithAttributes()
+        for i in range(5000):
+            node.next = ClassWithAttributes(value=i)
+            node = node.next
+        node.first = root
+        copy = deep_copy(root)
+        node.value = "changed"
+        self.assertEqual(
+            {".".join(["next"] * 5000 + ["value"]): [4999, "changed"]},
+            get_difference(copy, deep_copy(root)),
+        )
+        self.assertEqual({}, get_difference(deep_copy(root), deep_copy(root)))
+
+
 class TestDifference(unittest.TestCase):
 
     def test_level1(self):
@@ -154,6 +250,137 @@ class TestDifference(unittest.TestCase):
         )
 
 
+class Uncomparable:
+    def __eq__(self, other):
+        raise AssertionError("compared")
+
+    __ne__ = __eq__
+
+
+class TestIterDifference(unittest.TestCase):
+
+    def test_equal_to_get_difference(self):
+        A = {"a": {"b": 1, "c": {"d": [1, 2]}}, "e": {"f": 1}, "h": 1}
+        B = {"a": {"b": 1, "c": {"d": [1, 3]}}, "e": {"f": 2}, "g": 2}
+        self.assertEqual(
+            get_difference(A, B),
+            {key: [a, b] for key, a, b in iter_difference(A, B)},
+        )
+
+    def test_matcher(self):
+        matcher = ChangeMatcher(["a.c", "e.*", "x"])
+        A = {"a": {"b": 1, "c": {"d": Uncomparable()}}, "e": {"f": Uncomparable()}, "h": 1, "x": 1}
+        B = {"a": {"b": 2, "c": {"d": Uncomparable()}}, "e": {"f": Uncomparable()}, "g": 2, "x": 2}
+        # the subtrees at valid paths are not compared
+        self.assertEqual(
+            [("a.b", 1, 2), ("g", None, 2), ("h", 1, None)],
+            sorted(iter_difference(A, B, matcher)),
+        )
+        self.assertEqual([], list(iter_difference({"a": {"c": 1}}, {"a": {"c": 2}}, matcher)))
+
+        # stops at the first invalid change
+        differences = iter_difference(A, B, matcher)
+        self.assertIn(next(differences)[0], ("a.b", "g", "h"))
+
+    def test_matcher_equals_subtract(self):
+        A = {"a": {"b": {"c": 1, "d": 2}, "e": 3}, "f": {"g": {"h": 4}}, "i": 5}
+        B = {"a": {"b": {"c": 0, "d": 2}, "e": 0}, "f": {"g": {"h": 0}, "j": 6}}
+        diff = get_difference(A, B)
+        for valid_changes in (["a"], ["a.b"], ["a.*.c"], ["*.g"], ["*"], ["f.*", "i"], ["x.y"], []):
+            matcher = ChangeMatcher(valid_changes)
+            self.assertEqual(
+                matcher.subtract(diff),
+                {key: [a, b] for key, a, b in iter_difference(A, B, matcher)},
+                "for valid changes %s" % (valid_changes, )
+            )
+
+
+class TestBuffers(unittest.TestCase):
+
+    def setUp(self):
+        self.limit = object_compare.BUFFER_COPY_LIMIT, object_compare.BUFFER_CHUNK_SIZE
+
+    def tearDown(self):
+        object_compare.BUFFER_COPY_LIMIT, object_compare.BUFFER_CHUNK_SIZE = self.limit
+
+    def test_bytes(self):
+        value = b"abcdef"
+        self.assertIs(value, deep_copy({"a": value})["a"])
+
+        diff = get_difference({"a": b"abcdef"}, {"a": b"aXcdYYg"})
+        self.assertIsInstance(diff["a"], BufferDifference)
+        self.assertEqual([b"abcdef", b"aXcdYYg"], diff["a"])
+        self.assertEqual([(1, 2), (4, 7)], diff["a"].ranges)
+        self.assertEqual({"a": [b"abc", "abc"]}, get_difference({"a": b"abc"}, {"a": "abc"}))
+
+    def test_bytearray(self):
+        buffer = bytearray(b"abcdef")
+        A = deep_copy({"a": buffer, "b": buffer, "m": memoryview(buffer)})
+        self.assertIsInstance(A["a"], BufferSnapshot)
+        self.assertIs(A["a"], A["b"])
+        self.assertEqual(b"abcdef", A["a"].data)
+        self.assertEqual(bytearray(b"abcdef"), A["a"].restore())
+
+        buffer[0:2] = b"XY"
+        B = deep_copy({"a": buffer, "b": buffer, "m": memoryview(buffer)})
+        diff = get_difference(A, B)
+        self.assertEqual(["a", "b", "m"], sorted(diff))
+        self.assertEqual([(0, 2)], diff["a"].ranges)
+
+        buffer.extend(b"gh")
+        diff = get_difference(A, deep_copy({"a": buffer}))
+        self.assertEqual([(0, 2), (6, 8)], diff["a"].ranges)
+        self.assertIsNone(get_difference(A, deep_copy({"a": memoryview(buffer)}))["a"].ranges)
+
+    def test_large(self):
+        object_compare.BUFFER_COPY_LIMIT, object_compare.BUFFER_CHUNK_SIZE = 16, 4
+        buffer = bytearray(range(40))
+        A = deep_copy({"a": buffer})
+        self.assertIsNone(A["a"].data)
+        self.assertEqual(10, len(A["a"].chunk_digests))
+        with self.assertRaises(ValueError):
+            object_compare.restore_value(A["a"])
+        self.assertFalse(object_compare.is_restorable({"x": [A["a"]]}))
+        self.assertEqual({}, get_difference(A, deep_copy({"a": buffer})))
+
+        buffer[5] = 0
+        buffer[38] = 0
+        diff = get_difference(A, deep_copy({"a": buffer}))
+        self.assertEqual([(4, 8), (36, 40)], diff["a"].ranges)
+        self.assertIn("ranges", repr(diff["a"]))
+
+        # the same digests as a copied snapshot
+        object_compare.BUFFER_COPY_LIMIT = 100
+        self.assertEqual(A["a"].digest, deep_copy({"a": bytearray(range(40))})["a"].digest)
+
+    @unittest.skipIf(not USE_NUMPY, "numpy is not installed")
+    def test_numpy(self):
+        import numpy
+        array = numpy.arange(12, dtype=numpy.int32).reshape(3, 4)
+        A = deep_copy({"a": array, "f": numpy.array([numpy.nan]), "o": numpy.array([[1]], dtype=object)})
+        self.assertIsInstance(A["a"], BufferSnapshot)
+        self.assertEqual([[1]], A["o"])
+        self.assertEqual({}, get_difference(A, deep_copy({"a": array, "f": numpy.array([numpy.nan]), "o": [[1]]})))
+
+        array[1, 1:3] = 0
+        array[2, 3] = 0
+        B = deep_copy({"a": array, "f": numpy.array([numpy.nan]), "o": [[1]]})
+        diff = get_difference(A, B)
+        self.assertEqual(["a"], list(diff))
+        self.assertEqual([(5, 7), (11, 12)], diff["a"].ranges)
+        numpy.testing.assert_array_equal(array, B["a"].restore())
+
+        self.assertIsNone(get_difference(A, deep_copy({"a": array.astype(numpy.int64)}))["a"].ranges)
+        self.assertIsNone(get_difference(A, deep_copy({"a": array.reshape(4, 3)}))["a"].ranges)
+
+        # not contiguous, digests of the chunks
+        object_compare.BUFFER_COPY_LIMIT, object_compare.BUFFER_CHUNK_SIZE = 16, 16
+        A = deep_copy({"a": array[:, ::2]})
+        self.assertIsNone(A["a"].data)
+        array[0, 0] = 100
+        self.assertEqual([(0, 4)], get_difference(A, deep_copy({"a": array[:, ::2]}))["a"].ranges)
+
+
 class TestValidChanges(unittest.TestCase):
 
     def _test_valid_changes(self, valid_changes, changes_made, expected):
@@ -161,6 +388,8 @@ class TestValidChanges(unittest.TestCase):
         expected_changes = {key: None for key in expected}
         invalid_changes = subtract_valid_changes(diff, valid_changes)
         self.assertEqual(expected_changes, invalid_changes)
+        invalid_changes = ChangeMatcher(valid_changes).subtract(diff)
+        self.assertEqual(expected_changes, invalid_changes)
 
     def test_level1_complete(self):
         valid_changes = []
@@ -265,3 +494,31 @@ class TestValidChanges(unittest.TestCase):
         valid_changes = ["x.*.*"]
         changes_made  = ["x.y.z", "x.y"]
         self._test_valid_changes(valid_changes, changes_made, [])
+
+    def test_matcher_may_change(self):
+        matcher = ChangeMatcher(["a.b", "*.c.d", "e.*"])
+        self.assertTrue(matcher.may_change(["a"]))
+        self.assertTrue(matcher.may_change(["a", "b", "x"]))
+        self.assertTrue(matcher.may_change(["x", "c"]))
+        self.assertTrue(matcher.may_change(["e", "x", "y"]))
+        self.assertFalse(matcher.may_change(["a", "x"]))
+        self.assertFalse(matcher.may_change(["x", "d"]))
+        self.assertFalse(ChangeMatcher([]).may_change([]))
+
+    def test_matcher_equals_subtract(self):
+        import itertools
+        segments = ["a", "b", "*"]
+        keys = [
+            ".".join(seq)
+            for length in (1, 2, 3, 4)
+            for seq in itertools.product(segments, repeat=length)
+        ]
+        patterns = keys + ["a.*.*", "*.*.*.*", ""]
+        diff = {key: None for key in keys}
+        for num in (1, 2, 3):
+            for valid_changes in itertools.combinations(patterns[::11], num):
+                self.assertEqual(
+                    subtract_valid_changes(diff, valid_changes),
+                    ChangeMatcher(valid_changes).subtract(diff),
+                    "for valid changes %s" % (valid_changes, )
+                )
@@ -0,0 +1,101 @@
+import concurrent.futures
+import time
+import unittest
+
+from ..runner import ProcessRunner, RunResult
+
+
+class Order:
+    def __init__(self, id, items, express=False):
+        self.id = id
+        self.items = items
+        self.status = "new"
+        self.express = express
+
+
+def _orders(count):
+    for i in range(count):
+        # every 7th order makes an invalid change
+        yield {"order": Order(i, ["a"] if i % 3 else [], express=i % 7 == 6), "log": []}
+
+
+class TestRunMany(unittest.TestCase):
+
+    def _check_results(self, results, count):
+        self.assertEqual(list(range(count)), sorted(r.index for r in results))
+        for r in results:
+            order = r.kwargs["order"]
+            if order.express and order.items:
+                self.assertFalse(r.ok)
+                self.assertIsInstance(r.error, RuntimeError)
+            else:
+                self.assertTrue(r.ok, r)
+                self.assertEqual(
+                    "done" if order.items else "invalid",
+                    r.context.function_context.order.status,
+                )
+
+    def test_threads(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        results = list(runner.run_many("new", _orders(50), max_in_flight=4))
+        self._check_results(results, 50)
+
+    def test_processes(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(runner.run_many("new", _orders(20), executor=executor, max_in_flight=3))
+        self._check_results(results, 20)
+
+    def test_max_steps(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        results = list(runner.run_many("new", _orders(3), max_steps=1))
+        self.assertEqual(
+            ["invalid", "validated", "validated"],
+            [r.context.current_state.name for r in sorted(results, key=lambda r: r.index)],
+        )
+
+    def test_create_error(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        results = list(runner.run_many("unknown", _orders(2)))
+        self.assertEqual([False, False], [r.ok for r in results])
+        self.assertIsInstance(results[0].error, KeyError)
+
+
+class TestRun(unittest.TestCase):
+
+    def test_run(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+        self.assertFalse(context.is_finished)
+
+        result = context.run(max_steps=1)
+        self.assertEqual(RunResult.MAX_STEPS, result.reason)
+        self.assertEqual(1, result.steps)
+        self.assertEqual("validated", result.state.name)
+        self.assertFalse(result.finished)
+
+        result = context.run()
+        self.assertTrue(result.finished)
+        self.assertTrue(context.is_finished)
+        self.assertEqual(2, result.steps)
+        self.assertEqual("done", result.state.name)
+        self.assertGreaterEqual(result.duration, 0.)
+
+        self.assertEqual(0, context.run().steps)
+
+    def test_deadline(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+        result = context.run(deadline=time.monotonic() - 1)
+        self.assertEqual(RunResult.DEADLINE, result.reason)
+        self.assertEqual(0, result.steps)
+        self.assertTrue(context.run(deadline=time.monotonic() + 60).finished)
+
+    def test_round_robin(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        contexts = [runner.create_context("new", order=Order(i, ["a"] if i % 2 else []), log=[]) for i in range(10)]
+        rounds = 0
+        while contexts:
+            contexts = [c for c in contexts if not c.run(max_steps=1).finished]
+            rounds += 1
+        self.assertEqual(3, rounds)
@@ -0,0 +1,123 @@
+import ast
+import textwrap
+import unittest
+import warnings
+
+from ..description import ChangeMatcher
+from ..runner import ProcessRunner
+from ..runner import static_check
+from ..runner import function_validation
+
+
+class Order:
+    def __init__(self, id, items):
+        self.id = id
+        self.items = items
+        self.status = "new"
+
+
+class TestStaticCheck(unittest.TestCase):
+
+    def _check(self, code, changes):
+        node = ast.parse(textwrap.dedent(code)).body[0]
+        return static_check.check_function_node(node, ChangeMatcher(changes))
+
+    def test_writes(self):
+        result = self._check('''
+            def transition(context):
+                context.order.status = "done"
+                context.counts["a"] += 1
+                context.log.append("finished %s" % context.order.id)
+                context.items[len(context.items) - 1] = None
+                del context.tmp
+                order = context.order
+                order.total = sum(i.price for i in [])
+                if getattr(context.order, "express", False):
+                    context.order.priority = 1
+        ''', ["order.status", "counts", "log", "items", "tmp", "order.total", "order.priority"])
+        self.assertEqual(
+            ["order.status", "counts.a", "log.*", "items.*", "tmp", "order.total", "order.priority"],
+            result["writes"]
+        )
+        self.assertEqual([], result["violations"])
+        self.assertEqual([], result["unknown"])
+        self.assertTrue(result["clean"])
+
+    def test_violations(self):
+        result = self._check('''
+            def transition(ctx):
+                ctx.order.status = "done"
+                ctx.order.priority = 1
+                ctx.data.get("list").append(1)
+        ''', ["order.status"])
+        self.assertEqual(["order.priority", "data.*"], result["violations"])
+        self.assertFalse(result["clean"])
+
+    def test_unknown(self):
+        for code in (
+            "def transition(context):\n    helper(context.order)",
+            "def transition(context):\n    context.order.save()",
+            "def transition(context):\n    for item in context.order.items:\n        item.x = 1",
+            "def transition(context):\n    x = context.order\n    x = None",
+            "def transition(context):\n    context = None",
+            "def transition(context):\n    setattr(context.order, 'status', 1)",
+            "def transition(context):\n    order = context.order or None\n    order.status = 1",
+            "def transition(context):\n    (context.order if context.x else None).status = 1",
+            "def transition(context):\n    max(context.orders, key=len).status = 1",
+            # may replace the declared path with the same value
+            "def transition(context):\n    context.order = None",
+            # not analysed
+            "def transition(*args):\n    args[0].order.priority = 1",
+            "def transition(**kwargs):\n    pass",
+            "def transition(context, *args):\n    pass",
+            "def transition():\n    pass",
+            # the context outlives the call
+            "def transition(context):\n    global G\n    G = context.order",
+            "def transition(context, order=None):\n    def f():\n        nonlocal order\n"
+            "        order = context.order\n    return f",
+        ):
+            result = self._check(code, ["order.status"])
+            self.assertEqual([], result["violations"], code)
+            self.assertTrue(result["unknown"], code)
+            self.assertFalse(result["clean"], code)
+
+    def test_load_functions(self):
+        runner = ProcessRunner.from_process_description(
+            ProcessRunner.from_python(
+                "processflow.tests.example_flow", validation=ProcessRunner.VALIDATE_OFF
+            ).process_description
+        )
+        # the static analysis only warns, also in strict mode
+        runner.set_validation(ProcessRunner.VALIDATE_STRICT)
+        function_validation._results.clear()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            runner.load_functions("processflow.tests.example_flow")
+        self.assertTrue(any("'order.priority'" in str(w.message) for w in caught))
+
+        results = runner.static_check_results()
+        self.assertEqual(["order.priority"], results["transition_finish"]["violations"])
+        self.assertTrue(results["transition_from_new_to_validated"]["clean"])
+
+    def test_trust(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow", validation=ProcessRunner.VALIDATE_OFF)
+        runner.set_trust_static_check(True)
+        context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+
+        calls = []
+        begin_transition = context._begin_transition
+        context._begin_transition = lambda transition: calls.append(transition.name) or begin_transition(transition)
+        end_transition = context._end_transition
+        context._end_transition = lambda transition, tracker, *args: \
+            calls.append(tracker is None) or end_transition(transition, tracker, *args)
+
+        context.run()
+        self.assertEqual("done", context.function_context.order.status)
+        # the finish transition is not clean and still checked
+        self.assertEqual(["new->validated", True, "finish", False], calls)
+        self.assertEqual({"new->validated", "new->invalid"}, runner._static_clean)
+
+        runner.set_trust_static_check(False)
+        self.assertEqual(set(), runner._static_clean)
+        runner.create_context("new", order=Order(2, ["a"]), log=[]).run()
+        self.assertEqual(set(), runner._static_clean)
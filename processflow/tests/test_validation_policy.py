@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..runner import ProcessRunner, ValidationPolicy
+from ..store import FileJournalStore
+
+
+class Order:
+    def __init__(self, id, items, express=False):
+        self.id = id
+        self.items = items
+        self.status = "new"
+        self.express = express
+
+
+class TestValidationPolicy(unittest.TestCase):
+
+    def _run(self, runner, num_orders, express=True):
+        contexts = []
+        for i in range(num_orders):
+            context = runner.create_context("new", order=Order(i, ["a"], express=express), log=[])
+            context.run()
+            contexts.append(context)
+        return contexts
+
+    def test_default_raises(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        with self.assertRaises(RuntimeError):
+            self._run(runner, 1)
+        self.assertEqual({}, runner.change_validation_counts())
+
+    def test_sampled_every(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        runner.set_change_validation(ValidationPolicy.sampled(every=2), "finish")
+        violations = []
+        runner.set_violation_callback(lambda context, transition, changes: violations.append(
+            (context.context_id, transition.name, sorted(changes))
+        ))
+
+        contexts = self._run(runner, 5)
+        self.assertTrue(all(c.is_finished for c in contexts))
+        self.assertEqual(
+            [(c.context_id, "finish", ["order.priority"]) for c in contexts[1::2]],
+            violations
+        )
+        counts = runner.change_validation_counts()
+        self.assertEqual(
+            {"policy": "sampled", "steps": 5, "validated": 2, "violations": 2},
+            counts["finish"]
+        )
+        # the other transitions keep the default
+        self.assertEqual(
+            {"policy": "always", "steps": 5, "validated": 5, "violations": 0},
+            counts["new->validated"]
+        )
+
+    def test_sampled_probability(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        runner.set_change_validation(ValidationPolicy.sampled(probability=0.))
+        with self.assertLogs("processflow.runner", "WARNING"):
+            runner.set_change_validation(ValidationPolicy.sampled(probability=1.), "finish")
+            self._run(runner, 2)
+        counts = runner.change_validation_counts()
+        self.assertEqual(0, counts["new->validated"]["validated"])
+        self.assertEqual(2, counts["finish"]["violations"])
+
+    def test_counters_kept(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        policy = ValidationPolicy.sampled(every=2)
+        runner.set_change_validation(policy, "finish")
+        runner.set_violation_callback(lambda context, transition, changes: None)
+        self._run(runner, 2)
+        self.assertEqual(2, policy.steps)
+
+        runner.set_change_validation(ValidationPolicy.always(), "new->validated")
+        counts = runner.change_validation_counts()
+        self.assertEqual(2, counts["finish"]["steps"])
+        self.assertEqual(0, counts["new->validated"]["steps"])
+
+        # the explicit policies are not replaced by a new default
+        runner.set_change_validation(ValidationPolicy.NEVER)
+        self._run(runner, 1)
+        self.assertEqual(3, policy.steps)
+        self.assertEqual(1, runner.change_validation_counts()["new->validated"]["steps"])
+
+    def test_never(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        runner.set_change_validation(ValidationPolicy.NEVER)
+        self._run(runner, 3)
+        self.assertEqual(
+            {"policy": "never", "steps": 3, "validated": 0, "violations": 0},
+            runner.change_validation_counts()["finish"]
+        )
+
+        runner.set_change_validation(ValidationPolicy.ALWAYS, "finish")
+        with self.assertRaises(RuntimeError):
+            self._run(runner, 1)
+
+    def test_never_with_job_store(self):
+        path = tempfile.mkdtemp()
+        try:
+            runner = ProcessRunner.from_python("processflow.tests.example_flow")
+            runner.set_change_validation(ValidationPolicy.NEVER)
+            with FileJournalStore(os.path.join(path, "journal")) as store:
+                runner.set_job_store(store)
+                context = runner.create_context("new", order=Order(1, ["a"]), log=[])
+                context.step()
+                context.step()
+
+                resumed = runner.resume(context.context_id)
+                self.assertEqual("done", resumed.current_state.name)
+                self.assertEqual("done", resumed.function_context.order.status)
+                self.assertEqual(["finished 1"], resumed.function_context.log)
+        finally:
+            shutil.rmtree(path)
+
+    def test_arguments(self):
+        runner = ProcessRunner.from_python("processflow.tests.example_flow")
+        with self.assertRaises(ValueError):
+            runner.set_change_validation("sometimes")
+        with self.assertRaises(ValueError):
+            runner.set_change_validation(ValidationPolicy.ALWAYS, "nope")
+        with self.assertRaises(ValueError):
+            ValidationPolicy.sampled()
+        with self.assertRaises(ValueError):
+            ValidationPolicy.sampled(every=2, probability=.5)
+        with self.assertRaises(ValueError):
+            ValidationPolicy.sampled(probability=2.)
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.http import HttpResponse, Http404
+
+from .runner.metrics import prometheus_text
+
+
+def prometheus_metrics(request):
+    """
+    Timing histograms of all ProcessRunners with enabled metrics,
+    in the prometheus text exposition format.
+    Only served if the setting PROCESSFLOW_METRICS is True
+    """
+    if not getattr(settings, "PROCESSFLOW_METRICS", False):
+        raise Http404("Metrics are not enabled")
+    return HttpResponse(prometheus_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,190 @@
+import datetime
+import logging
+import os
+import socket
+import time
+import traceback
+import uuid
+
+from django.db import connections, transaction, router
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import FlowInstance
+from ..runner import ProcessRunner
+
+
+LOGGER = logging.getLogger("processflow.worker")
+
+class FlowWorker(object):
+    """
+    Steps the due FlowInstances of the database through their ProcessRunners.
+
+    Instances are claimed in batches by writing a lease (owner and expiry time)
+    inside a transaction that locks the rows with SELECT ... FOR UPDATE SKIP LOCKED,
+    so any number of workers can share the same table.
+    On backends without SKIP LOCKED (e.g. SQLite) the lease is written with a conditional
+    UPDATE instead and the worker only processes the rows that it actually got.
+
+    A lease that is not released within `lease_seconds` (e.g. because the worker died)
+    is taken over by other workers.
+
+    The state and context are saved after each step, so when a step fails,
+    the steps before it are not run again.
+    """
+    UPDATE_FIELDS = (
+        "state", "context", "finished", "error", "steps",
+        "next_run_at", "lease_owner", "lease_expires", "updated",
+    )
+
+    def __init__(self, worker_id=None, batch_size=100, lease_seconds=300, max_steps=1, retry_seconds=None,
+                 description_cache=None):
+        """
+        :param worker_id: str, name of the lease owner, defaults to host, pid and a random part
+        :param batch_size: int, max number of instances claimed at once
+        :param lease_seconds: number, time that a batch may take to process
+        :param max_steps: int, number of steps per instance and claim, None to run until finished
+        :param retry_seconds: number or None, reschedule failed instances after this time,
+            None leaves them with their error until reset manually
+        :param description_cache: DescriptionCache or directory, see ProcessRunner.from_python()
+        """
+        self.worker_id = worker_id or "%s-%s-%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_steps = max_steps
+        self.retry_seconds = retry_seconds
+        self.description_cache = description_cache
+        self._runners = dict()
+
+    def get_runner(self, flow):
+        """
+        Return the (cached) ProcessRunner for a flow module
+        """
+        runner = self._runners.get(flow)
+        if runner is None:
+            runner = self._runners[flow] = ProcessRunner.from_python(flow, description_cache=self.description_cache)
+        return runner
+
+    def _due_instances(self, now):
+        return FlowInstance.objects.filter(
+            finished=False, error__isnull=True, next_run_at__lte=now,
+        ).filter(
+            Q(lease_owner__isnull=True) | Q(lease_expires__lt=now)
+        ).order_by("next_run_at")
+
+    def claim(self):
+        """
+        Lease a batch of due instances to this worker
+        :return: list of FlowInstance
+        """
+        now = timezone.now()
+        expires = now + datetime.timedelta(seconds=self.lease_seconds)
+        db = router.db_for_write(FlowInstance)
+
+        if not connections[db].features.has_select_for_update_skip_locked:
+            pks = list(self._due_instances(now).values_list("pk", flat=True)[:self.batch_size])
+            # the lease is checked again, other workers might have claimed some of them meanwhile
+            FlowInstance.objects.filter(pk__in=pks) \
+                .filter(Q(lease_owner__isnull=True) | Q(lease_expires__lt=now)) \
+                .update(lease_owner=self.worker_id, lease_expires=expires)
+            return list(FlowInstance.objects.filter(lease_owner=self.worker_id, lease_expires=expires))
+
+        with transaction.atomic(using=db):
+            instances = list(
+                self._due_instances(now).select_for_update(skip_locked=True)[:self.batch_size]
+            )
+            for instance in instances:
+                instance.lease_owner = self.worker_id
+                instance.lease_expires = expires
+            FlowInstance.objects.bulk_update(instances, ["lease_owner", "lease_expires"])
+        return instances
+
+    def process(self, instances):
+        """
+        Step the instances and write them back, releasing the lease.
+        Instances whose lease has expired and was taken over by another worker meanwhile
+        are not written back, the new owner steps them again.
+        :param instances: list of FlowInstance, as returned by claim()
+        :return: list of the FlowInstances that were written back
+        """
+        for instance in instances:
+            self._step_instance(instance)
+
+        now = timezone.now()
+        for instance in instances:
+            instance.lease_owner = None
+            instance.lease_expires = None
+            instance.updated = now
+
+        db = router.db_for_write(FlowInstance)
+        with transaction.atomic(using=db):
+            leased = FlowInstance.objects.filter(pk__in=[instance.pk for instance in instances],
+                                                 lease_owner=self.worker_id)
+            pks = set(leased.select_for_update().values_list("pk", flat=True))
+            written = [instance for instance in instances if instance.pk in pks]
+            # the UPDATE checks the lease again, for backends without row locks
+            leased.bulk_update(written, self.UPDATE_FIELDS)
+        return written
+
+    def _step_instance(self, instance):
+        try:
+            runner = self.get_runner(instance.flow)
+            context = runner.create_context(instance.state, context_id=instance.context_id, **instance.get_context())
+            steps = 0
+            while not context.is_finished and (self.max_steps is None or steps < self.max_steps):
+                context.step()
+                steps += 1
+                self._save_step(instance, context)
+        except Exception:
+            self._failed(instance)
+
+    def _save_step(self, instance, context):
+        instance.state = context.current_state.name
+        instance.set_context(context._function_context._get_objects())
+        instance.finished = context.is_finished
+        instance.steps += 1
+        instance.next_run_at = None if context.is_finished else timezone.now()
+
+    def _failed(self, instance):
+        """
+        Store the error of the failed step, or reschedule the instance if `retry_seconds` is set
+        """
+        error = traceback.format_exc()
+        LOGGER.error(
+            "flow instance %s failed in state %s:\n%s", instance.pk, instance.state, error,
+            extra={
+                "flow_instance": instance.pk,
+                "state": instance.state,
+                "retry": self.retry_seconds is not None,
+            }
+        )
+        if self.retry_seconds is None:
+            instance.error = error
+        else:
+            instance.next_run_at = timezone.now() + datetime.timedelta(seconds=self.retry_seconds)
+
+    def run_once(self):
+        """
+        Claim and process one batch
+        :return: int, number of processed instances that were written back
+        """
+        instances = self.claim()
+        if instances:
+            instances = self.process(instances)
+        return len(instances)
+
+    def run(self, idle_sleep=1., stop_when_idle=False):
+        """
+        Process batches until interrupted
+        :param idle_sleep: seconds to wait when no instance is due
+        :param stop_when_idle: bool, return when no instance is due
+        :return: int, number of processed instances
+        """
+        count = 0
+        while True:
+            num = self.run_once()
+            count += num
+            if not num:
+                if stop_when_idle:
+                    return count
+                time.sleep(idle_sleep)
@@ -0,0 +1 @@
+from .FlowWorker import FlowWorker